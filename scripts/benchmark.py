@@ -0,0 +1,440 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from functools import partial
+import os
+from pathlib import Path
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import orjson
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+TOPICS = [
+    ("考试", "考试作弊", "考试作弊者，取消该科目成绩，并视情节给予记过或留校察看处分。"),
+    ("补考", "补考", "课程考核不及格的学生，可在下一学期开学两周内参加补考一次。"),
+    ("请假", "请假", "学生因病请假须持校医院证明，三天以内由辅导员审批，超过三天报学院审批。"),
+    ("宿舍", "宿舍", "学生宿舍实行统一管理，禁止使用大功率电器，违者没收并通报批评。"),
+    ("奖学金", "奖学金", "国家奖学金每学年评审一次，申请者学年综合测评成绩须位于专业前百分之十。"),
+    ("转专业", "转专业", "学生在第一学年结束后可申请转专业，须参加转入学院组织的考核。"),
+    ("学位", "学位", "修满培养方案规定学分且成绩合格者，经学位委员会审议后授予学士学位。"),
+    ("休学", "休学", "学生休学一般以一年为期，累计休学时间不得超过两年。"),
+    ("选课", "选课", "学生应在规定时间内完成网上选课，逾期未选课者不得参加该课程考核。"),
+    ("处分", "处分", "受到留校察看处分的学生，察看期一般为十二个月，期满表现良好者可解除处分。"),
+]
+QUESTIONS = ["{t}有什么规定？", "关于{t}学校是怎么要求的", "{t}需要满足哪些条件？", "违反{t}规定会怎么处理？"]
+CHITCHAT = ["你好", "今天天气怎么样", "讲个笑话吧", "你是谁"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready in {timeout}s")
+
+
+def start_fake_llm(args) -> tuple[str, subprocess.Popen]:
+    port = free_port()
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            str(ROOT / "scripts" / "fake_deepseek_server.py"),
+            "--port", str(port),
+            "--latency-ms", str(args.llm_latency_ms),
+            "--tokens-per-second", str(args.llm_tokens_per_second),
+        ],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+    url = f"http://127.0.0.1:{port}"
+    wait_for(f"{url}/health")
+    return url, proc
+
+
+def configure_env(args, workdir: Path, llm_url: str) -> None:
+    # Settings are read at import time, so this runs before any src.* import.
+    os.environ.update(
+        {
+            "DEEPSEEK_BASE_URL": llm_url,
+            "DEEPSEEK_API_KEY": os.getenv("DEEPSEEK_API_KEY") or "bench",
+            "CHROMA_PERSIST_DIR": str(workdir / "chroma_db"),
+            "TRACE_DIR": str(workdir / "traces"),
+            "LLM_CACHE_PATH": str(workdir / "llm_cache.sqlite3"),
+            "LLM_CACHE_ENABLED": str(args.with_caches).lower(),
+            "SEMANTIC_CACHE_ENABLED": str(args.with_caches).lower(),
+            "VECTOR_BACKEND": args.vector_backend,
+        }
+    )
+    if args.embedding == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        from src.runtime.resources import registry
+
+        # Registered ahead of src.retrieval.embeddings, so this factory wins.
+        registry.register("embeddings", lambda: DeterministicFakeEmbedding(size=args.embedding_dim))
+
+
+def synthetic_document(rng: random.Random, articles: int) -> str:
+    lines = []
+    for n in range(1, articles + 1):
+        _, _, rule = rng.choice(TOPICS)
+        lines.append(f"第{n}条 {rule}")
+    return "\n".join(lines)
+
+
+def chunk_spans(text: str, size: int) -> list[tuple[int, int]]:
+    spans, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        cut = text.rfind("\n", start + 1, end)
+        if end < len(text) and cut > start:
+            end = cut + 1
+        spans.append((start, end))
+        start = end
+    return spans
+
+
+def build_corpus(args) -> int:
+    from src.config.settings import settings
+    from src.retrieval.chroma_store import open_chroma
+    from src.retrieval.flat_index import export_from_chroma, flat_index_dir
+    from src.retrieval.index_version import create_index_version, publish_index_version
+    from src.retrieval.lexical import LexicalIndex, lexical_index_dir
+    from src.retrieval.text_store import TextStore, normalize_text, text_store_dir
+
+    rng = random.Random(args.seed)
+    version, build_dir = create_index_version()
+    vs = open_chroma(build_dir)
+    store = TextStore(text_store_dir(build_dir))
+    texts, metadatas, ids, lexical = [], [], [], []
+
+    def flush() -> None:
+        if ids:
+            vs.add_texts(texts, metadatas=metadatas, ids=ids)
+        texts.clear(), metadatas.clear(), ids.clear()
+
+    for i in range(args.docs):
+        source = f"synthetic/policy_{i:05d}.txt"
+        doc_id = f"policy_{i:05d}"
+        text = normalize_text(synthetic_document(rng, args.articles))
+        store.write(source, text)
+        for j, (start, end) in enumerate(chunk_spans(text, args.chunk_size)):
+            chunk_id = f"{doc_id}-{j:04d}"
+            content = text[start:end]
+            texts.append(content)
+            ids.append(chunk_id)
+            metadatas.append(
+                {"doc_id": doc_id, "chunk_id": chunk_id, "source": source, "start_offset": start, "end_offset": end}
+            )
+            lexical.append((chunk_id, content))
+            if len(ids) >= 256:
+                flush()
+    flush()
+    store.close()
+    if settings.vector_backend == "flat":
+        export_from_chroma(vs, flat_index_dir(build_dir))
+    LexicalIndex.build(lexical).save(lexical_index_dir(build_dir))
+    publish_index_version(version)
+    return len(lexical)
+
+
+def make_queries(args) -> list[str]:
+    rng = random.Random(args.seed + 1)
+    queries = []
+    for _ in range(args.requests):
+        if rng.random() < args.chitchat_ratio:
+            queries.append(rng.choice(CHITCHAT))
+        else:
+            queries.append(rng.choice(QUESTIONS).format(t=rng.choice(TOPICS)[0]))
+    return queries
+
+
+def node_breakdown(before: dict, after: dict) -> dict[str, dict]:
+    nodes = {}
+    for (name, labels), hist in after.items():
+        if name != "node_seconds":
+            continue
+        prev = before.get((name, labels))
+        seconds = hist.sum - (prev.sum if prev else 0.0)
+        calls = hist.count - (prev.count if prev else 0)
+        if calls:
+            nodes[dict(labels)["name"]] = {
+                "calls": calls,
+                "total_seconds": round(seconds, 4),
+                "mean_ms": round(seconds / calls * 1000, 2),
+            }
+    return dict(sorted(nodes.items(), key=lambda kv: -kv[1]["total_seconds"]))
+
+
+def summarize(latencies: list[float], errors: int, wall: float, concurrency: int) -> dict:
+    arr = np.asarray(latencies, dtype=np.float64) * 1000
+    pct = np.percentile(arr, [50, 95, 99]) if arr.size else [0.0, 0.0, 0.0]
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(float(pct[0]), 2),
+            "p95": round(float(pct[1]), 2),
+            "p99": round(float(pct[2]), 2),
+            "mean": round(float(arr.mean()), 2) if arr.size else 0.0,
+            "max": round(float(arr.max()), 2) if arr.size else 0.0,
+        },
+    }
+
+
+def current_rss_mb() -> float | None:
+    try:
+        resident = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+
+@contextmanager
+def rss_sampler(interval: float = 0.05):
+    # ru_maxrss is the process high-water mark (corpus build, earlier modes), so sample the
+    # current RSS while this mode runs instead. The API server runs in-process, so this covers it too.
+    result: dict = {"rss_start_mb": current_rss_mb(), "peak_rss_mb": None}
+    peak = result["rss_start_mb"]
+    done = threading.Event()
+
+    def sample() -> None:
+        nonlocal peak
+        while True:
+            rss = current_rss_mb()
+            if rss is not None:
+                peak = max(peak or 0.0, rss)
+            if done.wait(interval):
+                return
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        yield result
+    finally:
+        done.set()
+        thread.join()
+        for key, value in (("rss_start_mb", result["rss_start_mb"]), ("peak_rss_mb", peak)):
+            result[key] = round(value, 1) if value is not None else None
+
+
+def bench_agent(queries: list[str], concurrency: int) -> tuple[list[float], int, float]:
+    from src.agent.graph import run_agent
+
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(query: str) -> None:
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            run_agent(query)
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    return latencies, errors, time.perf_counter() - start
+
+
+@contextmanager
+def api_server():
+    import uvicorn
+
+    from src.api.app import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        wait_for(f"http://127.0.0.1:{port}/health", timeout=120.0)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def bench_api(queries: list[str], concurrency: int, base_url: str) -> tuple[list[float], int, float]:
+    import httpx
+
+    async def run() -> tuple[list[float], int, float]:
+        latencies: list[float] = []
+        errors = 0
+        sem = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+
+            async def one(query: str) -> None:
+                nonlocal errors
+                async with sem:
+                    start = time.perf_counter()
+                    try:
+                        resp = await client.post("/ask", json={"query": query})
+                        resp.raise_for_status()
+                    except httpx.HTTPError:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(q) for q in queries))
+            return latencies, errors, time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+def run_mode(mode: str, args, queries: list[str]) -> dict:
+    from src.runtime.stats import stats
+
+    with ExitStack() as stack:
+        rss = stack.enter_context(rss_sampler())
+        if mode == "api":
+            # One server for warmup and the timed run: the chat client's pool is bound to its loop.
+            base_url = stack.enter_context(api_server())
+            bench = partial(bench_api, base_url=base_url)
+        else:
+            bench = bench_agent
+        if args.warmup:
+            bench(queries[: args.warmup], min(args.concurrency, args.warmup))
+        before = stats.histograms()
+        latencies, errors, wall = bench(queries, args.concurrency)
+        after = stats.histograms()
+    return {
+        **summarize(latencies, errors, wall, args.concurrency),
+        **rss,
+        "nodes": node_breakdown(before, after),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report: dict, baseline_path: Path) -> None:
+    baseline = orjson.loads(baseline_path.read_bytes())
+    for mode, cur in report["results"].items():
+        old = baseline.get("results", {}).get(mode)
+        if old is None:
+            continue
+        print(f"[{mode}] vs {baseline['meta'].get('commit')}:")
+        for key in ("p50", "p95", "p99"):
+            a, b = old["latency_ms"][key], cur["latency_ms"][key]
+            print(f"  {key}: {a:.1f}ms -> {b:.1f}ms ({(b - a) / a * 100 if a else 0.0:+.1f}%)")
+        a, b = old["throughput_rps"], cur["throughput_rps"]
+        print(f"  throughput: {a:.2f} -> {b:.2f} rps ({(b - a) / a * 100 if a else 0.0:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end latency/throughput benchmark")
+    parser.add_argument("--mode", choices=["agent", "api", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before each mode")
+    parser.add_argument("--docs", type=int, default=200, help="synthetic documents in the corpus")
+    parser.add_argument("--articles", type=int, default=40, help="articles per synthetic document")
+    parser.add_argument("--chunk-size", type=int, default=400)
+    parser.add_argument("--chitchat-ratio", type=float, default=0.1)
+    parser.add_argument("--embedding", choices=["fake", "real"], default="fake")
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--vector-backend", choices=["chroma", "flat"], default="chroma")
+    parser.add_argument("--llm-url", help="use an already running LLM endpoint instead of the stand-in")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--with-caches", action="store_true", help="keep the LLM and semantic caches on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="defaults to bench_results/<commit>-<timestamp>.json")
+    parser.add_argument("--baseline", type=Path, help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    workdir = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    proc = None
+    if args.llm_url:
+        llm_url = args.llm_url
+    else:
+        llm_url, proc = start_fake_llm(args)
+
+    try:
+        configure_env(args, workdir, llm_url)
+
+        start = time.perf_counter()
+        chunks = build_corpus(args)
+        print(f"corpus: {args.docs} docs, {chunks} chunks in {time.perf_counter() - start:.1f}s ({workdir})")
+
+        queries = make_queries(args)
+        modes = ["agent", "api"] if args.mode == "both" else [args.mode]
+        results = {}
+        for mode in modes:
+            results[mode] = run_mode(mode, args, queries)
+            lat = results[mode]["latency_ms"]
+            print(
+                f"[{mode}] {results[mode]['throughput_rps']:.2f} rps  p50={lat['p50']:.1f}ms "
+                f"p95={lat['p95']:.1f}ms p99={lat['p99']:.1f}ms errors={results[mode]['errors']} "
+                f"rss={results[mode]['rss_start_mb']}->{results[mode]['peak_rss_mb']}MB"
+            )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+        "results": results,
+    }
+    output = args.output or ROOT / "bench_results" / f"{commit}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    print(f"saved {output}")
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
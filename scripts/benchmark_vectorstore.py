@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+import numpy as np
+import orjson
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def synthetic_vectors(n: int, dim: int, seed: int) -> np.ndarray:
+    # Clustered like real chunk embeddings: many near neighbours, which is where approximate search loses recall.
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 50), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def fill_chroma(chroma, vectors: np.ndarray, batch: int = 4096) -> None:
+    for lo in range(0, len(vectors), batch):
+        ids = [f"chunk-{i:07d}" for i in range(lo, min(lo + batch, len(vectors)))]
+        chroma._collection.add(
+            ids=ids,
+            embeddings=vectors[lo : lo + batch].tolist(),
+            documents=[""] * len(ids),
+            metadatas=[{"doc_id": x, "chunk_id": x, "source": "synthetic"} for x in ids],
+        )
+
+
+def make_queries(vectors: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    base = vectors[rng.integers(0, len(vectors), count)]
+    q = base + noise * rng.normal(size=base.shape).astype(np.float32) / np.sqrt(base.shape[1])
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def measure(store, queries: np.ndarray, k: int, truth: list[set[str]]) -> dict:
+    single: list[float] = []
+    hits: list[list[str]] = []
+    for q in queries:
+        start = time.perf_counter()
+        items = store.search([q.tolist()], k)[0]
+        single.append(time.perf_counter() - start)
+        hits.append([x.chunk_id for x in items])
+    start = time.perf_counter()
+    store.search(queries.tolist(), k)
+    batch = time.perf_counter() - start
+    ms = np.asarray(single) * 1000
+    recall = [len(truth[i] & set(h)) / len(truth[i]) for i, h in enumerate(hits)]
+    return {
+        f"recall@{k}": round(float(np.mean(recall)), 4),
+        "single_ms": {
+            "p50": round(float(np.percentile(ms, 50)), 3),
+            "p95": round(float(np.percentile(ms, 95)), 3),
+            "mean": round(float(ms.mean()), 3),
+        },
+        "batch_qps": round(len(queries) / batch, 1) if batch else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall and latency of the flat vector index against Chroma")
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark N random vectors instead of the current index")
+    parser.add_argument("--dim", type=int, default=512, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.5, help="query = stored vector + noise, then normalized")
+    parser.add_argument("--rescore-factors", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-vs-bench-"))
+    if args.synthetic:
+        # Settings are read at import time.
+        os.environ["CHROMA_PERSIST_DIR"] = str(workdir / "chroma_db")
+    sys.path.insert(0, str(ROOT))
+
+    from langchain_chroma import Chroma
+
+    from src.retrieval.flat_index import FlatIndex, export_from_chroma
+    from src.retrieval.index_version import index_dir
+    from src.retrieval.vectorstore import ChromaVectorStore, FlatVectorStore
+
+    # Queries are vectors already, so Chroma is opened without loading the embedding model.
+    chroma = Chroma(persist_directory=str(index_dir()))
+    if args.synthetic:
+        start = time.perf_counter()
+        fill_chroma(chroma, synthetic_vectors(args.synthetic, args.dim, args.seed))
+        print(f"chroma: inserted {args.synthetic} vectors in {time.perf_counter() - start:.1f}s")
+
+    flat_dir = workdir / "flat"
+    start = time.perf_counter()
+    count = export_from_chroma(chroma, flat_dir)
+    print(f"flat: exported {count} vectors in {time.perf_counter() - start:.1f}s ({flat_dir})")
+    if not count:
+        raise SystemExit(f"no vectors in {index_dir()}; build the index or pass --synthetic")
+
+    exact = FlatIndex.load(flat_dir)
+    queries = make_queries(np.asarray(exact.vectors), args.queries, args.noise, args.seed)
+    truth = [
+        {exact.chunks[row]["metadata"]["chunk_id"] for row, _ in hits}
+        for hits in exact.search(queries, args.k)
+    ]
+
+    stores = {"chroma": ChromaVectorStore(chroma), "flat_f32": FlatVectorStore(exact)}
+    for factor in args.rescore_factors:
+        stores[f"flat_int8_x{factor}"] = FlatVectorStore(FlatIndex.load(flat_dir, int8=True, rescore_factor=factor))
+
+    results = {}
+    for name, store in stores.items():
+        store.search(queries[:5].tolist(), args.k)  # warm caches and page in the mapped files
+        results[name] = measure(store, queries, args.k, truth)
+        print(name, orjson.dumps(results[name]).decode())
+
+    sizes = {p.name: p.stat().st_size for p in flat_dir.iterdir()}
+    report = {
+        "vectors": count,
+        "dim": int(exact.vectors.shape[1]),
+        "queries": args.queries,
+        "k": args.k,
+        "flat_bytes": sizes,
+        "results": results,
+    }
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+        print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
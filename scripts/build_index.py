@@ -1,57 +1,368 @@
 from __future__ import annotations
 
+import argparse
+import bisect
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+import hashlib
+import itertools
+import multiprocessing
+import os
 from pathlib import Path
-import uuid
+import queue
+import threading
+import time
+from typing import Iterator
 
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import orjson
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from tqdm import tqdm
 
-from src.retrieval.chroma_store import get_vectorstore
+from src.config.settings import settings
+from src.retrieval.chroma_store import open_chroma
+from src.retrieval.embeddings import get_embeddings
+from src.retrieval.flat_index import export_from_chroma, flat_index_dir
+from src.retrieval.index_version import (
+    create_index_version,
+    current_index_version,
+    discard_index_version,
+    gc_index_versions,
+    index_root,
+    publish_index_version,
+    version_dir,
+)
+from src.retrieval.lexical import LexicalIndex, lexical_index_dir
+from src.retrieval.text_store import TextStore, normalize_text, text_store_dir
 
 
 RAW_DIR = Path("data/raw")
+SUFFIXES = {".pdf", ".md", ".txt"}
+MANIFEST_FILE = "manifest.json"
+CHROMA_PAGE_SIZE = 1000
+CHECKPOINT_SECONDS = 5.0
+_DONE = object()
 
 
-def load_docs() -> list[Document]:
-    docs: list[Document] = []
-    for p in RAW_DIR.rglob("*"):
-        if p.suffix.lower() == ".pdf":
-            docs.extend(PyPDFLoader(str(p)).load())
-        elif p.suffix.lower() in {".md", ".txt"}:
-            docs.extend(TextLoader(str(p), encoding="utf-8").load())
-    return docs
+@dataclass
+class ParsedFile:
+    key: str
+    digest: str
+    chunks: list[Document] | None
 
 
-def main() -> None:
-    docs = load_docs()
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=80)
-    chunks = splitter.split_documents(docs)
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_chunk_id(source: str, offset: str, content: str) -> str:
+    content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()
+    key = f"{source}|{offset}|{content_hash}"
+    return f"{Path(source).stem or 'doc'}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+def load_manifest(base: Path) -> dict[str, dict]:
+    path = base / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    return orjson.loads(path.read_bytes())
+
+
+def save_manifest(base: Path, manifest: dict[str, dict]) -> None:
+    path = base / MANIFEST_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    os.replace(tmp, path)
+
+
+def load_file(path: Path) -> list[Document]:
+    if path.suffix.lower() == ".pdf":
+        return PyPDFLoader(str(path)).load()
+    return TextLoader(str(path), encoding="utf-8").load()
+
 
+def normalized_document(path: Path) -> tuple[str, list[int]]:
+    # Pages are joined into one normalized text; page_starts maps offsets back to pages.
+    pages = [normalize_text(d.page_content) for d in load_file(path)]
+    page_starts: list[int] = []
+    parts: list[str] = []
+    pos = 0
+    for page in pages:
+        page_starts.append(pos)
+        parts.append(page)
+        pos += len(page) + 2
+    return "\n\n".join(parts), page_starts
+
+
+def split_file(path: Path, text: str, page_starts: list[int]) -> list[Document]:
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=500, chunk_overlap=80, add_start_index=True
+    )
+    doc_id = path.stem or "doc"
+    source = str(path)
     out: list[Document] = []
-    for idx, c in enumerate(chunks):
+    for c in splitter.create_documents([text]):
         content = c.page_content
-        meta = c.metadata or {}
-        doc_id = str(meta.get("doc_id", Path(str(meta.get("source", "unknown"))).stem or "doc"))
-        chunk_id = f"chunk_{idx}"
-        source = str(meta.get("source", "unknown_source"))
-        meta.update(
-            {
-                "doc_id": doc_id,
-                "chunk_id": chunk_id,
-                "source": source,
-                "start_offset": 0,
-                "end_offset": len(content),
-                "uid": str(uuid.uuid4()),
-            }
-        )
+        start = int(c.metadata["start_index"])
+        meta = {
+            "doc_id": doc_id,
+            "chunk_id": make_chunk_id(source, str(start), content),
+            "source": source,
+            "start_offset": start,
+            "end_offset": start + len(content),
+        }
+        if path.suffix.lower() == ".pdf":
+            meta["page"] = bisect.bisect_right(page_starts, start) - 1
         out.append(Document(page_content=content, metadata=meta))
+    return out
+
+
+def parse_file(key: str, known_digest: str | None, texts_dir: Path) -> ParsedFile:
+    # Runs in worker processes: hashing and PDF parsing are the CPU-heavy part.
+    path = Path(key)
+    digest = file_sha256(path)
+    if digest == known_digest:
+        return ParsedFile(key, digest, None)
+    text, page_starts = normalized_document(path)
+    TextStore(texts_dir).write(key, text)
+    return ParsedFile(key, digest, split_file(path, text, page_starts))
+
+
+def parse_files(
+    keys: list[str], manifest: dict[str, dict], workers: int, texts_dir: Path
+) -> Iterator[ParsedFile]:
+    text_store = TextStore(texts_dir)
+    # Spawned rather than forked: the ingest threads are already running (and may hold locks)
+    # when the pool starts, and a forked child would inherit them mid-operation.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        todo = iter(keys)
+
+        def submit(key: str):
+            known = manifest.get(key, {}).get("sha256")
+            if not text_store.path_for(key).exists():
+                # Indexed before the text store existed: re-parse to get real offsets.
+                known = None
+            return pool.submit(parse_file, key, known, texts_dir)
+
+        # Bounded window so parsed chunks never pile up faster than they are embedded.
+        pending = {submit(key) for key in itertools.islice(todo, workers * 2)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                nxt = next(todo, None)
+                if nxt is not None:
+                    pending.add(submit(nxt))
+
+
+def iter_indexed_chunks(vs) -> Iterator[tuple[str, str]]:
+    offset = 0
+    while True:
+        page = vs.get(limit=CHROMA_PAGE_SIZE, offset=offset, include=["documents", "metadatas"])
+        if not page["ids"]:
+            return
+        for metadata, content in zip(page["metadatas"], page["documents"]):
+            yield str(metadata.get("chunk_id", "unknown_chunk")), content
+        offset += len(page["ids"])
+
+
+class IngestPipeline:
+    def __init__(
+        self, vs, base: Path, manifest: dict[str, dict], batch_size: int, queue_size: int, progress
+    ) -> None:
+        self.vs = vs
+        self.base = base
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.progress = progress
+        self.chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.batches: queue.Queue = queue.Queue(maxsize=4)
+        self.lock = threading.Lock()
+        self.remaining: dict[str, int] = {}
+        self.entries: dict[str, dict] = {}
+        self.last_checkpoint = time.monotonic()
+        self.error: BaseException | None = None
+        self.added = 0
+        self.threads = [
+            threading.Thread(target=self._embed_loop, name="ingest-embed", daemon=True),
+            threading.Thread(target=self._upsert_loop, name="ingest-upsert", daemon=True),
+        ]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, key: str, entry: dict, fresh: list[Document]) -> None:
+        self._raise_if_failed()
+        if not fresh:
+            self._complete(key, entry)
+            return
+        with self.lock:
+            self.remaining[key] = len(fresh)
+            self.entries[key] = entry
+        for chunk in fresh:
+            self.chunks.put((key, chunk))
+
+    def close(self) -> None:
+        self.chunks.put(_DONE)
+        for t in self.threads:
+            t.join()
+        # Saved on failure too, so --resume skips the files that did finish.
+        save_manifest(self.base, self.manifest)
+        self._raise_if_failed()
+
+    def _embed_loop(self) -> None:
+        batch: list[tuple[str, Document]] = []
+        while True:
+            item = self.chunks.get()
+            if item is not _DONE:
+                batch.append(item)
+            if batch and (item is _DONE or len(batch) >= self.batch_size):
+                if self.error is None:
+                    try:
+                        texts = [doc.page_content for _, doc in batch]
+                        self.batches.put((batch, get_embeddings().embed_documents(texts)))
+                    except BaseException as exc:
+                        self.error = exc
+                batch = []
+            if item is _DONE:
+                self.batches.put(_DONE)
+                return
+
+    def _upsert_loop(self) -> None:
+        while True:
+            item = self.batches.get()
+            if item is _DONE:
+                return
+            if self.error is not None:
+                continue
+            batch, vectors = item
+            try:
+                self.vs._collection.upsert(
+                    ids=[doc.metadata["chunk_id"] for _, doc in batch],
+                    embeddings=vectors,
+                    documents=[doc.page_content for _, doc in batch],
+                    metadatas=[doc.metadata for _, doc in batch],
+                )
+            except BaseException as exc:
+                self.error = exc
+                continue
+            self.added += len(batch)
+            for key, _ in batch:
+                with self.lock:
+                    self.remaining[key] -= 1
+                    done = self.remaining[key] == 0
+                if done:
+                    self._complete(key, self.entries.pop(key))
+
+    def _complete(self, key: str, entry: dict) -> None:
+        # A file enters the manifest only once all its chunks are stored, so a
+        # crashed run resumes by re-processing exactly the unfinished files.
+        with self.lock:
+            self.manifest[key] = entry
+            self.remaining.pop(key, None)
+            if time.monotonic() - self.last_checkpoint >= CHECKPOINT_SECONDS:
+                save_manifest(self.base, self.manifest)
+                self.last_checkpoint = time.monotonic()
+        self.progress.update(1)
+        self.progress.set_postfix(chunks=self.added)
+
+    def _raise_if_failed(self) -> None:
+        if self.error is not None:
+            raise RuntimeError("ingestion failed") from self.error
+
+
+def ingest(vs, build_dir: Path, manifest: dict[str, dict], args) -> tuple[int, int, int]:
+    keys = [str(p) for p in sorted(RAW_DIR.rglob("*")) if p.suffix.lower() in SUFFIXES]
+    removed = skipped = 0
+
+    texts_dir = text_store_dir(build_dir)
+    text_store = TextStore(texts_dir)
+    for key in sorted(set(manifest) - set(keys)):
+        stale = manifest.pop(key)["chunk_ids"]
+        if stale:
+            vs.delete(ids=stale)
+        text_store.remove(key)
+        removed += len(stale)
+
+    with tqdm(total=len(keys), desc="files", unit="file") as progress:
+        pipeline = IngestPipeline(vs, build_dir, manifest, args.batch_size, args.queue_size, progress)
+        try:
+            for parsed in parse_files(keys, manifest, max(1, args.workers), texts_dir):
+                entry = manifest.get(parsed.key)
+                if parsed.chunks is None:
+                    skipped += 1
+                    progress.update(1)
+                    continue
+                new_ids = [c.metadata["chunk_id"] for c in parsed.chunks]
+                old_ids = set(entry["chunk_ids"]) if entry else set()
+                # Chunks whose (doc, offset, content) did not change keep their id and embedding.
+                fresh = [c for c in parsed.chunks if c.metadata["chunk_id"] not in old_ids]
+                stale = sorted(old_ids - set(new_ids))
+                if stale:
+                    vs.delete(ids=stale)
+                removed += len(stale)
+                pipeline.submit(parsed.key, {"sha256": parsed.digest, "chunk_ids": new_ids}, fresh)
+        finally:
+            pipeline.close()
+    return pipeline.added, removed, skipped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="start from an empty index instead of the current one")
+    parser.add_argument("--resume", metavar="VERSION", help="continue an interrupted build in versions/VERSION")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per embed/upsert batch")
+    parser.add_argument("--queue-size", type=int, default=1024, help="max chunks buffered before embedding")
+    parser.add_argument(
+        "--export-flat",
+        action="store_true",
+        help="also write the memory-mapped flat index (always done when VECTOR_BACKEND=flat)",
+    )
+    args = parser.parse_args()
+
+    # Every build writes a new version directory; serving workers keep reading the current
+    # one until CURRENT is swapped to the finished build.
+    base = current_index_version()
+    if args.resume:
+        version, build_dir = args.resume, version_dir(args.resume)
+        if not build_dir.exists():
+            raise SystemExit(f"no build to resume at {build_dir}")
+    else:
+        version, build_dir = create_index_version(None if args.rebuild else base)
+    print(f"building index version {version} in {build_dir}")
+
+    try:
+        vs = open_chroma(build_dir)
+        added, removed, skipped = ingest(vs, build_dir, load_manifest(build_dir), args)
+    except BaseException:
+        print(f"build interrupted; continue with --resume {version}")
+        raise
+
+    changed = bool(added or removed or args.rebuild or args.resume)
+    export_flat = args.export_flat or settings.vector_backend == "flat"
+    flat = "skipped"
+    if export_flat and (changed or not (flat_index_dir(build_dir) / "chunks.json").exists()):
+        flat = export_from_chroma(vs, flat_index_dir(build_dir))
+    if changed or not lexical_index_dir(build_dir).exists():
+        LexicalIndex.build(iter_indexed_chunks(vs)).save(lexical_index_dir(build_dir))
+    elif flat == "skipped":
+        discard_index_version(version)
+        version = base or "unchanged"
+        print(f"added_chunks=0 removed_chunks=0 unchanged_files={skipped} index_version={version} (not published)")
+        return
 
-    vs = get_vectorstore()
-    if out:
-        vs.add_documents(out)
-        vs.persist()
-    print(f"indexed_chunks={len(out)}")
+    publish_index_version(version)
+    collected = gc_index_versions()
+    print(
+        f"added_chunks={added} removed_chunks={removed} unchanged_files={skipped} "
+        f"flat_chunks={flat} index_version={version} collected_versions={len(collected)} ({index_root()})"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import time
+
+import orjson
+
+from src.config.settings import settings
+from src.eval.retrieval import load_eval_set, load_or_collect, missing_gold_chunks, rewrite_queries, sweep
+
+
+EVAL_FILE = Path("train/data/sample_eval.jsonl")
+CACHE_DIR = Path("rag_cache/eval")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Retrieval hit@k / recall@k / MRR / nDCG over an eval set")
+    parser.add_argument("--eval-file", type=Path, default=EVAL_FILE, help="JSONL with query and gold_chunks")
+    parser.add_argument("--top-k-recall", type=int, nargs="+", default=[settings.top_k_recall])
+    parser.add_argument("--top-k-final", type=int, nargs="+", default=[settings.top_k_final])
+    parser.add_argument("--keyword-bonus", type=float, nargs="+", default=[settings.keyword_bonus])
+    parser.add_argument("--k", type=int, nargs="*", default=[1, 3], help="extra metric cutoffs")
+    parser.add_argument(
+        "--rewrite",
+        action="store_true",
+        help="retrieve with the LLM rewrite and keyword, as the agent does (default: raw query, record keyword)",
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel rewrite calls")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--refresh", action="store_true", help="re-run retrieval even if ranks are cached")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    records = load_eval_set(args.eval_file)
+    missing = missing_gold_chunks(records)
+    if missing:
+        print(
+            f"warning: {len(missing)} gold chunk ids are not in the index and can never be hit "
+            f"(e.g. {', '.join(missing[:3])}); relabel them against the current build"
+        )
+    if args.rewrite:
+        pairs = rewrite_queries(records, args.concurrency)
+    else:
+        pairs = [(r.get("expand_query") or r["query"], r.get("keyword", "")) for r in records]
+    queries, keywords = [q for q, _ in pairs], [k for _, k in pairs]
+
+    # Retrieval runs once at the deepest recall; every other setting is replayed from the cached ranks.
+    start = time.perf_counter()
+    cache, cached = load_or_collect(queries, keywords, max(args.top_k_recall), args.cache_dir, refresh=args.refresh)
+    print(f"ranks for {len(queries)} queries {'loaded' if cached else 'collected'} in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    rows = sweep(
+        cache,
+        [r.get("gold_chunks", []) for r in records],
+        args.top_k_recall,
+        args.top_k_final,
+        args.keyword_bonus,
+        args.k,
+    )
+    print(f"{len(rows)} settings evaluated in {time.perf_counter() - start:.3f}s")
+    for row in rows:
+        current = row["top_k_recall"] == settings.top_k_recall and row["keyword_bonus"] == settings.keyword_bonus
+        metrics = " ".join(f"{name}={value:.4f}" for name, value in row["metrics"].items())
+        print(f"{'*' if current else ' '} top_k_recall={row['top_k_recall']} keyword_bonus={row['keyword_bonus']} {metrics}")
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            "eval_file": str(args.eval_file),
+            "queries": len(records),
+            "rewrite": args.rewrite,
+            "hybrid_retrieval": settings.hybrid_retrieval,
+            "rrf_k": settings.rrf_k,
+            "results": rows,
+        }
+        args.output.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+        print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
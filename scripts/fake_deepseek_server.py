@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import argparse
+
+import uvicorn
+
+from src.bench.fake_deepseek import create_app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible DeepSeek stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="completion generation rate")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative jitter on the first-token latency")
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.tokens_per_second, args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
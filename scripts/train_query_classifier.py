@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+
+import numpy as np
+
+from src.agent.query_classifier import QueryClassifier
+from src.config.settings import settings
+from src.retrieval.embeddings import get_embeddings
+from src.runtime.trace_sink import iter_trace_events
+
+
+LABELS_FILE = Path("train/data/classify_labels.jsonl")
+
+
+def labels_from_files(paths: list[Path]) -> dict[str, bool]:
+    labels: dict[str, bool] = {}
+    for path in paths:
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                row = json.loads(line)
+                labels[row["query"].strip()] = bool(row["is_policy_related"])
+    return labels
+
+
+def labels_from_traces() -> dict[str, bool]:
+    # Only LLM decisions are used; training on the fast path's own output would reinforce its mistakes.
+    labels: dict[str, bool] = {}
+    for event in iter_trace_events():
+        if event.get("type") != "tool_call" or event.get("tool") != "classify_query":
+            continue
+        if event.get("output", {}).get("method", "llm") != "llm":
+            continue
+        labels[event["args"]["query"].strip()] = bool(event["output"]["is_policy_related"])
+    return labels
+
+
+def evaluate(clf: QueryClassifier, x: np.ndarray, y: np.ndarray) -> dict:
+    proba = clf.predict_proba(x)
+    decided = (proba >= settings.fast_classifier_policy_threshold) | (
+        proba <= settings.fast_classifier_chitchat_threshold
+    )
+    correct = (proba >= 0.5) == (y > 0.5)
+    return {
+        "samples": int(len(y)),
+        "accuracy": float(correct.mean()) if len(y) else 0.0,
+        "fast_path_rate": float(decided.mean()) if len(y) else 0.0,
+        "fast_path_accuracy": float(correct[decided].mean()) if decided.any() else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", type=Path, nargs="*", default=[LABELS_FILE])
+    parser.add_argument("--no-traces", action="store_true", help="ignore classify decisions in TRACE_DIR")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--l2", type=float, default=1e-2, help="higher = less confident, more LLM fallbacks")
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--output", type=Path, default=Path(settings.fast_classifier_path))
+    args = parser.parse_args()
+
+    # Hand labels win over trace history for the same query.
+    labels = {} if args.no_traces else labels_from_traces()
+    from_traces = len(labels)
+    labels.update(labels_from_files([p for p in args.labels if p.exists()]))
+    queries = sorted(labels)
+    y = np.array([labels[q] for q in queries], dtype=np.float64)
+    if len(set(y.tolist())) < 2:
+        raise SystemExit("need labelled examples of both classes")
+
+    x = np.asarray(get_embeddings().embed_documents(queries), dtype=np.float32)
+    order = np.random.default_rng(args.seed).permutation(len(queries))
+    split = int(len(order) * (1 - args.holdout))
+    train, test = order[:split], order[split:]
+    holdout = {}
+    if len(test):
+        holdout = evaluate(QueryClassifier.fit(x[train], y[train], args.l2, args.epochs), x[test], y[test])
+
+    meta = {
+        "embedding_model": settings.embedding_model_path,
+        "dim": int(x.shape[1]),
+        "samples": len(queries),
+        "positive": int(y.sum()),
+        "from_traces": from_traces,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "holdout": holdout,
+    }
+    clf = QueryClassifier.fit(x, y, args.l2, args.epochs, meta=meta)
+    clf.save(args.output)
+    print(json.dumps({"saved": str(args.output), **meta, "train": evaluate(clf, x, y)}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
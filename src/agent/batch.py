@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+import logging
+from typing import AsyncIterator
+
+from src.agent.graph import arun_agent, run_agent
+from src.agent.tools import search_candidates_batch
+from src.config.settings import settings
+from src.retrieval.embeddings import get_query_embedder
+from src.runtime.stats import stats
+
+
+logger = logging.getLogger(__name__)
+
+
+def _group(queries: list[str]) -> dict[str, list[int]]:
+    # Identical queries run once; their result is reported at every position.
+    positions: dict[str, list[int]] = {}
+    for index, query in enumerate(queries):
+        positions.setdefault(query.strip(), []).append(index)
+    return positions
+
+
+def _prefetch(queries: list[str]) -> dict[str, list[dict]]:
+    # One encode for every query, and one Chroma query for the speculative candidates.
+    try:
+        if not settings.speculative_retrieval:
+            get_query_embedder().embed_queries(queries)
+            return {}
+        candidates = search_candidates_batch(queries)
+    except Exception:
+        logger.exception("batch prefetch failed, falling back to per-query retrieval")
+        stats.incr("batch_prefetch_failed")
+        return {}
+    return {q: [asdict(x) for x in items] for q, items in zip(queries, candidates)}
+
+
+def _item(index: int, query: str, result: dict | None, error: Exception | None) -> dict:
+    if error is not None:
+        return {"index": index, "query": query, "ok": False, "error": f"{type(error).__name__}: {error}"}
+    return {"index": index, "query": query, "ok": True, **result}
+
+
+def _failed(query: str, exc: Exception) -> None:
+    logger.warning("batch item failed for query %r: %s", query, exc)
+    stats.incr("batch_item_failed")
+
+
+def run_agent_batch(queries: list[str], concurrency: int | None = None) -> list[dict]:
+    positions = _group(queries)
+    prefetched = _prefetch(list(positions))
+
+    def one(query: str) -> tuple[dict | None, Exception | None]:
+        try:
+            return run_agent(query, speculative_items=prefetched.get(query)), None
+        except Exception as exc:
+            _failed(query, exc)
+            return None, exc
+
+    with ThreadPoolExecutor(max_workers=concurrency or settings.batch_concurrency) as pool:
+        outcomes = dict(zip(positions, pool.map(one, positions)))
+    stats.incr("batch_queries", len(queries))
+    stats.incr("batch_unique_queries", len(positions))
+    return [_item(i, q, *outcomes[q.strip()]) for i, q in enumerate(queries)]
+
+
+async def astream_agent_batch(
+    queries: list[str], concurrency: int | None = None
+) -> AsyncIterator[dict]:
+    positions = _group(queries)
+    prefetched = await asyncio.to_thread(_prefetch, list(positions))
+    sem = asyncio.Semaphore(concurrency or settings.batch_concurrency)
+
+    async def one(query: str) -> tuple[str, dict | None, Exception | None]:
+        async with sem:
+            try:
+                return query, await arun_agent(query, speculative_items=prefetched.get(query)), None
+            except Exception as exc:
+                _failed(query, exc)
+                return query, None, exc
+
+    stats.incr("batch_queries", len(queries))
+    stats.incr("batch_unique_queries", len(positions))
+    tasks = [asyncio.create_task(one(q)) for q in positions]
+    try:
+        for done in asyncio.as_completed(tasks):
+            query, result, error = await done
+            for index in positions[query]:
+                yield _item(index, queries[index], result, error)
+    finally:
+        # Stop outstanding work if the consumer goes away mid-stream.
+        for task in tasks:
+            task.cancel()
+
+
+async def arun_agent_batch(queries: list[str], concurrency: int | None = None) -> list[dict]:
+    items = [x async for x in astream_agent_batch(queries, concurrency)]
+    return sorted(items, key=lambda x: x["index"])
@@ -1,33 +1,89 @@
 from __future__ import annotations
 
+import asyncio
+from dataclasses import asdict
 from datetime import datetime, timezone
+from functools import lru_cache, wraps
 import json
-from pathlib import Path
+import re
+import time
+from typing import AsyncIterator
 import uuid
 
 from pydantic import BaseModel, Field
 
-from langgraph.graph import END, StateGraph
+import numpy as np
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, START, StateGraph
 
-from src.agent.prompts import ANSWER_PROMPT, CLASSIFY_PROMPT, FALLBACK_ANSWER, SYSTEM_PROMPT
+from src.agent.packing import EVIDENCE_FIELDS, pack_evidence
+from src.agent.query_classifier import get_query_classifier
+from src.agent.semantic_cache import CacheHit, get_answer_cache
+from src.agent.session_memory import get_session_store
+from src.agent.prompts import (
+    ANSWER_PROMPT,
+    ANSWER_STREAM_PROMPT,
+    CLASSIFY_PROMPT,
+    FALLBACK_ANSWER,
+    INSUFFICIENT_EVIDENCE,
+    SYSTEM_PROMPT,
+)
 from src.agent.state import AgentState
 from src.agent.tools import (
     EvidenceItem,
     ExpandKeywordOutput,
     RetrieveItemOutput,
     SelectiveReadOutput,
+    aexpand_and_keyword,
+    asearch_candidates,
+    asummary_related_doc,
     expand_and_keyword,
-    retrieval_augment,
+    extract_related_sentences,
+    format_history,
+    normalize_query,
+    rank_candidates,
+    search_candidates,
     summary_related_doc,
 )
 from src.config.settings import settings
-from src.llm.deepseek_client import get_chat_model, invoke_structured
+from src.llm.deepseek_client import (
+    ainvoke_structured,
+    get_chat_model,
+    invoke_structured,
+    record_llm_call,
+)
+from src.retrieval.embeddings import embed_query, get_query_embedder
+from src.retrieval.index_version import serving_index_version
+from src.retrieval.text_store import get_text_store
+from src.retrieval.rerank import RetrievedItem, candidate_overlap, merge_candidates
+from src.runtime.spans import collect_spans, record_span, summarize_spans
+from src.runtime.stats import TOKEN_BUCKETS, stats
+from src.runtime.trace_sink import get_trace_sink
+
+
+class ClassifyOutput(BaseModel):
+    is_policy_related: bool = Field(...)
+
+
+class Citation(BaseModel):
+    doc_id: str
+    chunk_id: str
+    source: str
+    quote: str
+
+
+class AgentAnswerOutput(BaseModel):
+    answer: str
+    citations: list[Citation]
+    is_answerable: bool
+
+
+STREAM_TAG = "answer_stream"
+_CITATION_MARK = re.compile(r"\[([^\[\]]+)\]")
 
 
 def _append_trace(trace_id: str, event: dict) -> None:
-    path = Path(settings.trace_dir) / f"{trace_id}.jsonl"
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    get_trace_sink().emit(trace_id, event)
 
 
 def _log_tool(state: AgentState, tool_name: str, args: dict, output: dict) -> None:
@@ -40,62 +96,263 @@ def _log_tool(state: AgentState, tool_name: str, args: dict, output: dict) -> No
             "args": args,
             "output": output,
             "attempt": state.get("attempts", 1),
+            "index_version": state.get("index_version", ""),
         },
     )
 
 
-def classify_query_node(state: AgentState) -> AgentState:
-    class ClassifyOutput(BaseModel):
-        is_policy_related: bool = Field(...)
+def _prompt_history(state: AgentState) -> list[dict]:
+    if settings.session_prompt_turns <= 0:
+        return []
+    turns = state.get("history", [])[-settings.session_prompt_turns :]
+    return [{"query": x["query"], "answer": x["answer"][:300]} for x in turns]
+
 
-    messages = [
+def _classify_messages(state: AgentState) -> list[dict]:
+    prompt = CLASSIFY_PROMPT.format(query=state["query"])
+    history = _prompt_history(state)
+    if history:
+        prompt = format_history(history) + "\n\n" + prompt
+    return [
         {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": CLASSIFY_PROMPT.format(query=state["query"])},
+        {"role": "user", "content": prompt},
     ]
-    res = invoke_structured(messages, ClassifyOutput)
-    return {"is_policy_related": res.is_policy_related}
 
 
-def rewrite_keyword_node(state: AgentState) -> AgentState:
-    res: ExpandKeywordOutput = expand_and_keyword(state["query"])
+def _fast_classify(state: AgentState) -> tuple[bool | None, float | None]:
+    # A follow-up such as "那第二次呢？" only makes sense with its history, which the classifier never sees.
+    if not settings.fast_classifier_enabled or state.get("history"):
+        return None, None
+    clf = get_query_classifier()
+    if not clf.ready:
+        return None, None
+    # The query vector is usually in the embedder's cache already (semantic cache, speculation).
+    proba = float(clf.predict_proba(embed_query(state["query"]))[0])
+    if proba >= settings.fast_classifier_policy_threshold:
+        label = True
+    elif proba <= settings.fast_classifier_chitchat_threshold:
+        label = False
+    else:
+        stats.incr("classify_fast_path_miss")
+        return None, proba
+    stats.incr("classify_fast_path_hit")
+    return label, proba
+
+
+def _classify_update(
+    state: AgentState, is_policy_related: bool, method: str, proba: float | None
+) -> AgentState:
+    output = {"is_policy_related": is_policy_related, "method": method}
+    if proba is not None:
+        output["policy_proba"] = round(proba, 4)
+    _log_tool(state, "classify_query", {"query": state["query"]}, output)
+    return {"is_policy_related": is_policy_related}
+
+
+def triage_node(state: AgentState) -> AgentState:
+    label, proba = _fast_classify(state)
+    if label is not None:
+        return _classify_update(state, label, "fast", proba)
+    return {} if proba is None else {"policy_proba": proba}
+
+
+async def atriage_node(state: AgentState) -> AgentState:
+    return await asyncio.to_thread(triage_node, state)
+
+
+def classify_query_node(state: AgentState) -> AgentState:
+    res = invoke_structured(_classify_messages(state), ClassifyOutput)
+    return _classify_update(state, res.is_policy_related, "llm", state.get("policy_proba"))
+
+
+async def aclassify_query_node(state: AgentState) -> AgentState:
+    res = await ainvoke_structured(_classify_messages(state), ClassifyOutput)
+    return _classify_update(state, res.is_policy_related, "llm", state.get("policy_proba"))
+
+
+def _rewrite_update(state: AgentState, res: ExpandKeywordOutput) -> AgentState:
     output = {"expand_query": res.expand_query, "keyword": res.keyword}
-    _log_tool(state, "expand_and_keyword", {"query": state["query"]}, output)
+    args = {"query": state["query"]}
+    if state.get("tried_queries"):
+        args["tried_queries"] = state["tried_queries"]
+    _log_tool(state, "expand_and_keyword", args, output)
     return {
         "expand_query": res.expand_query,
         "keyword": res.keyword,
-        "used_tools": state.get("used_tools", []) + ["expand_and_keyword"],
+        "used_tools": ["expand_and_keyword"],
     }
 
 
-def retrieve_node(state: AgentState) -> AgentState:
-    query = state.get("expand_query") or state["query"]
-    keyword = state.get("keyword", "")
-    res = retrieval_augment(query, keyword)
+def rewrite_keyword_node(state: AgentState) -> AgentState:
+    res = expand_and_keyword(state["query"], state.get("tried_queries"), _prompt_history(state))
+    return _rewrite_update(state, res)
+
+
+async def arewrite_keyword_node(state: AgentState) -> AgentState:
+    res = await aexpand_and_keyword(state["query"], state.get("tried_queries"), _prompt_history(state))
+    return _rewrite_update(state, res)
+
+
+def speculate_node(state: AgentState) -> AgentState:
+    # Prefetched together with the rest of a batch, or a follow-up whose raw text is not searchable.
+    if "speculative_items" in state or state.get("history"):
+        return {}
+    items = search_candidates(state["query"])
+    return {"speculative_items": [asdict(x) for x in items]}
+
+
+async def aspeculate_node(state: AgentState) -> AgentState:
+    if "speculative_items" in state or state.get("history"):
+        return {}
+    items = await asearch_candidates(state["query"])
+    return {"speculative_items": [asdict(x) for x in items]}
+
+
+def _retrieve_args(state: AgentState) -> tuple[str, str]:
+    return state.get("expand_query") or state["query"], state.get("keyword", "")
+
+
+def _recall_k(state: AgentState) -> int:
+    # Each retry searches deeper instead of repeating the same top-k.
+    return settings.top_k_recall * state.get("attempts", 1)
+
+
+def _speculation(state: AgentState, query: str) -> tuple[list[RetrievedItem] | None, bool]:
+    # Speculative candidates only describe the raw query on the first attempt.
+    if state.get("attempts", 1) > 1 or "speculative_items" not in state:
+        return None, False
+    items = [RetrievedItem(**x) for x in state["speculative_items"]]
+    return items, normalize_query(query) != normalize_query(state["query"])
+
+
+def _resolve_speculation(
+    speculative: list[RetrievedItem], fresh: list[RetrievedItem] | None
+) -> tuple[list[RetrievedItem], str]:
+    if fresh is None:
+        stats.incr("speculation_hit")
+        return speculative, "hit"
+    stats.incr("speculation_miss")
+    overlap = candidate_overlap(speculative, fresh)
+    stats.incr("speculation_overlap_sum", overlap)
+    # One list may be RRF-fused and the other raw vector order when only one query had lexical hits.
+    if any(x.fused for x in speculative) != any(x.fused for x in fresh):
+        stats.incr("speculation_scoring_mismatch")
+        return fresh, "discarded"
+    if overlap >= settings.speculative_merge_overlap:
+        stats.incr("speculation_merged")
+        return merge_candidates(speculative, fresh), "merged"
+    return fresh, "discarded"
+
+
+def _retrieve_update(
+    state: AgentState,
+    query: str,
+    keyword: str,
+    candidates: list[RetrievedItem],
+    speculation: str | None,
+) -> AgentState:
+    seen = state.get("seen_chunk_ids", [])
+    excluded = set(seen)
+    res = rank_candidates([x for x in candidates if x.chunk_id not in excluded], keyword)
     output = {"items": [x.model_dump() for x in res.items]}
-    _log_tool(state, "retrieval_augment", {"query": query, "keyword": keyword}, output)
+    args = {"query": query, "keyword": keyword}
+    if speculation is not None:
+        args["speculation"] = speculation
+    if excluded:
+        args["excluded"] = len(excluded)
+    _log_tool(state, "retrieval_augment", args, output)
     return {
         "retrieved_items": output["items"],
-        "used_tools": state.get("used_tools", []) + ["retrieval_augment"],
+        "seen_chunk_ids": seen + [x["chunk_id"] for x in output["items"]],
+        "tried_queries": state.get("tried_queries", []) + [query],
+        "used_tools": ["retrieval_augment"],
     }
 
 
-def selective_read_node(state: AgentState) -> AgentState:
-    items = [RetrieveItemOutput(**x) for x in state.get("retrieved_items", [])]
+def retrieve_node(state: AgentState) -> AgentState:
+    query, keyword = _retrieve_args(state)
+    speculative, needs_search = _speculation(state, query)
+    if speculative is None:
+        candidates = search_candidates(query, _recall_k(state))
+        return _retrieve_update(state, query, keyword, candidates, None)
+    fresh = search_candidates(query) if needs_search else None
+    candidates, speculation = _resolve_speculation(speculative, fresh)
+    return _retrieve_update(state, query, keyword, candidates, speculation)
+
+
+async def aretrieve_node(state: AgentState) -> AgentState:
+    query, keyword = _retrieve_args(state)
+    speculative, needs_search = _speculation(state, query)
+    if speculative is None:
+        candidates = await asearch_candidates(query, _recall_k(state))
+        return _retrieve_update(state, query, keyword, candidates, None)
+    fresh = await asearch_candidates(query) if needs_search else None
+    candidates, speculation = _resolve_speculation(speculative, fresh)
+    return _retrieve_update(state, query, keyword, candidates, speculation)
+
+
+def _read_items(state: AgentState) -> list[RetrieveItemOutput]:
+    return [RetrieveItemOutput(**x) for x in state.get("retrieved_items", [])]
+
+
+def _excerpt(item: RetrieveItemOutput) -> str:
+    if settings.context_expand_chars <= 0:
+        return item.content
+    expanded = get_text_store().expand(
+        item.source, item.start_offset, item.end_offset, settings.context_expand_chars
+    )
+    return expanded or item.content
+
+
+def _with_previous_evidence(state: AgentState, evidence: list[dict]) -> list[dict]:
+    # Evidence from earlier attempts stays available to the answer step.
+    return state.get("evidence", []) + evidence
+
+
+def _direct_evidence(state: AgentState, items: list[RetrieveItemOutput]) -> AgentState | None:
     total_chars = sum(len(x.content) for x in items)
-    if total_chars <= settings.selective_read_char_threshold:
-        evidence = [
-            EvidenceItem(
-                doc_id=x.doc_id,
-                chunk_id=x.chunk_id,
-                source=x.source,
-                excerpt=x.content,
-            ).model_dump()
-            for x in items
-        ]
-        return {"evidence": evidence}
+    if total_chars > settings.selective_read_char_threshold:
+        return None
+    return {"evidence": _with_previous_evidence(state, _chunk_evidence(items))}
 
-    res: SelectiveReadOutput = summary_related_doc(state["query"], items)
-    output = {"evidence": [x.model_dump() for x in res.evidence]}
+
+def _chunk_evidence(items: list[RetrieveItemOutput]) -> list[dict]:
+    return [
+        EvidenceItem(
+            doc_id=x.doc_id,
+            chunk_id=x.chunk_id,
+            source=x.source,
+            excerpt=_excerpt(x),
+        ).model_dump()
+        for x in items
+    ]
+
+
+def _verify_evidence(
+    evidence: list[EvidenceItem], items: list[RetrieveItemOutput]
+) -> list[EvidenceItem]:
+    # Excerpts must be verbatim copies; check them against the source span.
+    spans = {x.chunk_id: x for x in items}
+    store = get_text_store()
+    verified: list[EvidenceItem] = []
+    for ev in evidence:
+        item = spans.get(ev.chunk_id)
+        if item is None:
+            continue
+        found = store.contains(item.source, item.start_offset, item.end_offset, ev.excerpt)
+        if found is None:
+            found = "".join(ev.excerpt.split()) in "".join(item.content.split())
+        if found:
+            verified.append(ev)
+    stats.incr("evidence_unverified", len(evidence) - len(verified))
+    return verified
+
+
+def _selective_read_update(
+    state: AgentState, items: list[RetrieveItemOutput], res: SelectiveReadOutput
+) -> AgentState:
+    verified = _verify_evidence(res.evidence, items)
+    output = {"evidence": [x.model_dump() for x in verified]}
     _log_tool(
         state,
         "summary_related_doc",
@@ -103,56 +360,110 @@ def selective_read_node(state: AgentState) -> AgentState:
         output,
     )
     return {
-        "evidence": output["evidence"],
-        "used_tools": state.get("used_tools", []) + ["summary_related_doc"],
+        "evidence": _with_previous_evidence(state, output["evidence"] or _chunk_evidence(items)),
+        "used_tools": ["summary_related_doc"],
     }
 
 
-def answer_node(state: AgentState) -> AgentState:
-    class Citation(BaseModel):
-        doc_id: str
-        chunk_id: str
-        source: str
-        quote: str
+def _extractive_evidence(state: AgentState, items: list[RetrieveItemOutput]) -> AgentState | None:
+    if settings.selective_read_mode != "extractive":
+        return None
+    res = extract_related_sentences(state["query"], state.get("keyword", ""), items)
+    if not res.evidence:
+        stats.incr("selective_read_llm_fallback")
+        return None
+    stats.incr("selective_read_extractive")
+    output = {"evidence": [x.model_dump() for x in res.evidence]}
+    _log_tool(
+        state,
+        "extract_related_sentences",
+        {"query": state["query"], "keyword": state.get("keyword", ""), "related_count": len(items)},
+        output,
+    )
+    return {
+        "evidence": _with_previous_evidence(state, output["evidence"]),
+        "used_tools": ["extract_related_sentences"],
+    }
 
-    class AgentAnswerOutput(BaseModel):
-        answer: str
-        citations: list[Citation]
-        is_answerable: bool
 
-    if not state.get("is_policy_related", False):
-        model = get_chat_model()
-        content = model.invoke(
-            [
-                {"role": "system", "content": "你是一个中文问答助手。"},
-                {"role": "user", "content": state["query"]},
-            ]
-        ).content
-        return {
-            "answer": content,
-            "citations": [],
-            "is_answerable": True,
-        }
+def selective_read_node(state: AgentState) -> AgentState:
+    items = _read_items(state)
+    direct = _direct_evidence(state, items)
+    if direct is not None:
+        return direct
+    extracted = _extractive_evidence(state, items)
+    if extracted is not None:
+        return extracted
+    return _selective_read_update(state, items, summary_related_doc(state["query"], items))
+
+
+async def aselective_read_node(state: AgentState) -> AgentState:
+    items = _read_items(state)
+    direct = _direct_evidence(state, items)
+    if direct is not None:
+        return direct
+    extracted = await asyncio.to_thread(_extractive_evidence, state, items)
+    if extracted is not None:
+        return extracted
+    res = await asummary_related_doc(state["query"], items)
+    return _selective_read_update(state, items, res)
 
+
+def pack_node(state: AgentState) -> AgentState:
     evidence = state.get("evidence", [])
     if not evidence:
-        return {"answer": FALLBACK_ANSWER, "citations": [], "is_answerable": False}
+        return {}
+    packed, report = pack_evidence(
+        evidence,
+        state.get("retrieved_items", []),
+        settings.pack_token_budget,
+        settings.pack_duplicate_threshold,
+    )
+    stats.incr("pack_merged_chunks", report["merged"])
+    stats.incr("pack_dropped_duplicates", report["duplicates"])
+    stats.incr("pack_dropped_over_budget", report["dropped"])
+    stats.incr("pack_truncated", report["truncated"])
+    stats.observe("pack_evidence_tokens", report["tokens_after"], buckets=TOKEN_BUCKETS)
+    _log_tool(
+        state,
+        "pack_evidence",
+        {"query": state["query"], "token_budget": settings.pack_token_budget},
+        report,
+    )
+    return {"evidence": packed}
 
-    messages = [
-        {"role": "system", "content": ANSWER_PROMPT},
-        {
-            "role": "user",
-            "content": json.dumps(
-                {
-                    "query": state["query"],
-                    "evidence": evidence,
-                    "requirements": "严格引用证据，中文回答",
-                },
-                ensure_ascii=False,
-            ),
-        },
+
+def _chitchat_messages(state: AgentState) -> list[dict]:
+    messages = [{"role": "system", "content": "你是一个中文问答助手。"}]
+    for turn in _prompt_history(state):
+        messages.append({"role": "user", "content": turn["query"]})
+        messages.append({"role": "assistant", "content": turn["answer"]})
+    messages.append({"role": "user", "content": state["query"]})
+    return messages
+
+
+def _chitchat_update(content: str) -> AgentState:
+    return {"answer": content, "citations": [], "is_answerable": True}
+
+
+def _answer_messages(
+    state: AgentState, evidence: list[dict], prompt: str = ANSWER_PROMPT
+) -> list[dict]:
+    payload = {
+        "query": state["query"],
+        "evidence": [{k: ev[k] for k in EVIDENCE_FIELDS} for ev in evidence],
+        "requirements": "严格引用证据，中文回答",
+    }
+    history = _prompt_history(state)
+    if history:
+        payload["history"] = history
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
     ]
-    res = invoke_structured(messages, AgentAnswerOutput)
+
+
+def _answer_update(res: AgentAnswerOutput) -> AgentState:
     return {
         "answer": res.answer,
         "citations": [x.model_dump() for x in res.citations],
@@ -160,6 +471,251 @@ def answer_node(state: AgentState) -> AgentState:
     }
 
 
+def _no_evidence_update() -> AgentState:
+    return {"answer": FALLBACK_ANSWER, "citations": [], "is_answerable": False}
+
+
+def _log_answer(state: AgentState, update: AgentState) -> AgentState:
+    _log_tool(
+        state,
+        "answer",
+        {"query": state["query"], "evidence_count": len(state.get("evidence", []))},
+        {
+            "answer": update["answer"],
+            "citations": update["citations"],
+            "is_answerable": update["is_answerable"],
+        },
+    )
+    return update
+
+
+def _chitchat(state: AgentState) -> str:
+    start = time.perf_counter()
+    message = get_chat_model().invoke(_chitchat_messages(state))
+    record_llm_call("chitchat", time.perf_counter() - start, message)
+    return message.content
+
+
+async def _achitchat(state: AgentState) -> str:
+    start = time.perf_counter()
+    message = await get_chat_model().ainvoke(_chitchat_messages(state))
+    record_llm_call("chitchat", time.perf_counter() - start, message)
+    return message.content
+
+
+def _answer(state: AgentState) -> AgentState:
+    if not state.get("is_policy_related", False):
+        return _chitchat_update(_chitchat(state))
+
+    evidence = state.get("evidence", [])
+    if not evidence:
+        return _no_evidence_update()
+
+    res = invoke_structured(_answer_messages(state, evidence), AgentAnswerOutput)
+    return _answer_update(res)
+
+
+def answer_node(state: AgentState) -> AgentState:
+    return _log_answer(state, _answer(state))
+
+
+def _streaming(config: RunnableConfig | None) -> bool:
+    return bool((config or {}).get("configurable", {}).get("stream_answer"))
+
+
+async def _astream_text(messages: list[dict], name: str) -> str:
+    # Tagged so astream_agent can forward these tokens and ignore other LLM calls.
+    model = get_chat_model().with_config(tags=[STREAM_TAG])
+    start = time.perf_counter()
+    message = None
+    async for chunk in model.astream(messages):
+        message = chunk if message is None else message + chunk
+    record_llm_call(name, time.perf_counter() - start, message)
+    return message.content if message is not None else ""
+
+
+def _citation_index(evidence: list[dict]) -> dict[str, dict]:
+    by_key: dict[str, dict] = {}
+    for ev in evidence:
+        by_key[f"{ev['doc_id']}:{ev['chunk_id']}"] = ev
+        by_key.setdefault(ev["chunk_id"], ev)
+        # A packed excerpt spans several chunks; a mark naming any of them resolves to it.
+        for chunk_id in ev.get("merged_chunk_ids", []):
+            by_key.setdefault(f"{ev['doc_id']}:{chunk_id}", ev)
+            by_key.setdefault(chunk_id, ev)
+    return by_key
+
+
+class CitationMarkFilter:
+    # Removes [doc_id:chunk_id] marks that resolve to evidence from streamed text; a mark may
+    # arrive split across chunks, so text from an unclosed "[" is held back (up to max_pending).
+    def __init__(self, keys, max_pending: int = 64) -> None:
+        self.keys = keys
+        self.max_pending = max_pending
+        self._buf = ""
+
+    def feed(self, text: str) -> str:
+        buf, out = self._buf + text, []
+        while True:
+            start = buf.find("[")
+            if start < 0:
+                out.append(buf)
+                buf = ""
+                break
+            out.append(buf[:start])
+            buf = buf[start:]
+            end = buf.find("]")
+            if end < 0:
+                if len(buf) <= self.max_pending:
+                    break
+                out.append(buf[0])
+                buf = buf[1:]
+                continue
+            if buf[1:end].strip() not in self.keys:
+                out.append(buf[: end + 1])
+            buf = buf[end + 1 :]
+        self._buf = buf
+        return "".join(out)
+
+    def flush(self) -> str:
+        text, self._buf = self._buf, ""
+        return text
+
+
+def parse_stream_citations(answer: str, evidence: list[dict]) -> list[dict]:
+    by_key = _citation_index(evidence)
+    citations: list[dict] = []
+    seen: set[str] = set()
+    for mark in _CITATION_MARK.findall(answer):
+        ev = by_key.get(mark.strip())
+        if ev is None or ev["chunk_id"] in seen:
+            continue
+        seen.add(ev["chunk_id"])
+        citations.append(
+            Citation(
+                doc_id=ev["doc_id"],
+                chunk_id=ev["chunk_id"],
+                source=ev["source"],
+                quote=ev["excerpt"],
+            ).model_dump()
+        )
+    return citations
+
+
+def _stream_answer_update(answer: str, evidence: list[dict]) -> AgentState:
+    marks = CitationMarkFilter(_citation_index(evidence))
+    text = (marks.feed(answer) + marks.flush()).strip()
+    return {
+        "answer": text,
+        "citations": parse_stream_citations(answer, evidence),
+        # An answer without marks is still an answer; only the agreed reply means "no basis".
+        "is_answerable": bool(text) and not text.startswith(INSUFFICIENT_EVIDENCE),
+    }
+
+
+async def _aanswer(state: AgentState, config: RunnableConfig | None) -> AgentState:
+    streaming = _streaming(config)
+    if not state.get("is_policy_related", False):
+        if streaming:
+            return _chitchat_update(await _astream_text(_chitchat_messages(state), "chitchat"))
+        return _chitchat_update(await _achitchat(state))
+
+    evidence = state.get("evidence", [])
+    if not evidence:
+        return _no_evidence_update()
+
+    if streaming:
+        answer = await _astream_text(
+            _answer_messages(state, evidence, ANSWER_STREAM_PROMPT), "answer_stream"
+        )
+        return _stream_answer_update(answer, evidence)
+
+    res = await ainvoke_structured(_answer_messages(state, evidence), AgentAnswerOutput)
+    return _answer_update(res)
+
+
+async def aanswer_node(state: AgentState, config: RunnableConfig | None = None) -> AgentState:
+    return _log_answer(state, await _aanswer(state, config))
+
+
+def _reusable_turn(state: AgentState) -> dict | None:
+    if state.get("attempts", 1) > 1 or not state.get("is_policy_related", False):
+        return None
+    for turn in reversed(state.get("history", [])):
+        if turn.get("items"):
+            # Chunk text and offsets from an older index may no longer exist.
+            return turn if turn.get("index_version") == serving_index_version() else None
+    return None
+
+
+def plan_node(state: AgentState) -> AgentState:
+    turn = _reusable_turn(state)
+    if turn is None:
+        return {}
+    query, _ = _retrieve_args(state)
+    previous = turn["expand_query"] or turn["query"]
+    a, b = np.asarray(get_query_embedder().embed_queries([query, previous]), dtype=np.float32)
+    similarity = float(a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) or 1.0))
+    if similarity < settings.session_reuse_threshold:
+        stats.incr("session_reuse_miss")
+        return {}
+    # Same topic as the previous turn: answer from its chunks; a retry still searches fresh.
+    stats.incr("session_reuse_hit")
+    chunk_ids = [x["chunk_id"] for x in turn["items"]]
+    _log_tool(
+        state,
+        "session_memory",
+        {"query": query, "previous_query": previous},
+        {"similarity": round(similarity, 4), "chunk_ids": chunk_ids},
+    )
+    return {
+        "retrieved_items": turn["items"],
+        "seen_chunk_ids": state.get("seen_chunk_ids", []) + chunk_ids,
+        "session_reused": True,
+        "used_tools": ["session_memory"],
+    }
+
+
+def _fan_out() -> list[str]:
+    # classify, rewrite and speculative retrieval only depend on the query, so they run in the
+    # same superstep; plan joins them and skips retrieval for non-policy queries.
+    return ["classify", "rewrite", *(["speculate"] if settings.speculative_retrieval else [])]
+
+
+def route_after_triage(state: AgentState) -> list[str]:
+    if "is_policy_related" not in state:
+        return _fan_out()
+    if not state["is_policy_related"]:
+        # Chit-chat needs neither the rewrite call nor retrieval.
+        return ["answer"]
+    return [x for x in _fan_out() if x != "classify"]
+
+
+def route_after_plan(state: AgentState) -> str:
+    if not state.get("is_policy_related", False):
+        if state.get("speculative_items"):
+            stats.incr("speculation_unused")
+        return "answer"
+    if state.get("session_reused") and state.get("attempts", 1) == 1:
+        return "selective_read"
+    tried = {normalize_query(x) for x in state.get("tried_queries", [])}
+    query, _ = _retrieve_args(state)
+    if normalize_query(query) in tried:
+        stats.incr("retry_skipped_duplicate_query")
+        return "end"
+    return "retrieve"
+
+
+def route_after_retrieve(state: AgentState) -> str:
+    if state.get("retrieved_items"):
+        return "selective_read"
+    if state.get("attempts", 1) > 1:
+        stats.incr("retry_skipped_no_new_chunks")
+        return "end"
+    # Nothing to read or pack; answer falls back without evidence.
+    return "answer"
+
+
 def retry_or_end(state: AgentState) -> str:
     if state.get("is_answerable", False):
         return "end"
@@ -172,21 +728,85 @@ def increment_attempt_node(state: AgentState) -> AgentState:
     return {"attempts": state.get("attempts", 1) + 1}
 
 
+def _timed(name: str, func):
+    if asyncio.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def awrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record_span("node", name, time.perf_counter() - start)
+
+        return awrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_span("node", name, time.perf_counter() - start)
+
+    return wrapper
+
+
+def _node(name: str, func, afunc=None) -> RunnableLambda:
+    # One compiled graph serves both invoke() and ainvoke().
+    return RunnableLambda(
+        _timed(name, func),
+        afunc=_timed(name, afunc) if afunc is not None else None,
+        name=name,
+    )
+
+
 def build_graph():
     graph = StateGraph(AgentState)
 
-    graph.add_node("classify", classify_query_node)
-    graph.add_node("rewrite", rewrite_keyword_node)
-    graph.add_node("retrieve", retrieve_node)
-    graph.add_node("selective_read", selective_read_node)
-    graph.add_node("answer", answer_node)
-    graph.add_node("retry_inc", increment_attempt_node)
+    graph.add_node("classify", _node("classify", classify_query_node, aclassify_query_node))
+    graph.add_node("rewrite", _node("rewrite", rewrite_keyword_node, arewrite_keyword_node))
+    graph.add_node("retrieve", _node("retrieve", retrieve_node, aretrieve_node))
+    graph.add_node("selective_read", _node("selective_read", selective_read_node, aselective_read_node))
+    graph.add_node("pack", _node("pack", pack_node))
+    graph.add_node("answer", _node("answer", answer_node, aanswer_node))
+    graph.add_node("plan", _node("plan", plan_node))
+    graph.add_node("retry_inc", _node("retry_inc", increment_attempt_node))
 
-    graph.set_entry_point("classify")
-    graph.add_edge("classify", "rewrite")
-    graph.add_edge("rewrite", "retrieve")
-    graph.add_edge("retrieve", "selective_read")
-    graph.add_edge("selective_read", "answer")
+    if settings.speculative_retrieval:
+        # Retrieval on the raw query overlaps with the rewrite LLM call.
+        graph.add_node("speculate", _node("speculate", speculate_node, aspeculate_node))
+    for name in _fan_out():
+        graph.add_edge(name, "plan")
+    if settings.fast_classifier_enabled:
+        # A confident local label decides before any LLM call or search is started.
+        graph.add_node("triage", _node("triage", triage_node, atriage_node))
+        graph.add_edge(START, "triage")
+        graph.add_conditional_edges("triage", route_after_triage, [*_fan_out(), "answer"])
+    else:
+        for name in _fan_out():
+            graph.add_edge(START, name)
+    graph.add_conditional_edges(
+        "plan",
+        route_after_plan,
+        {
+            "retrieve": "retrieve",
+            "selective_read": "selective_read",
+            "answer": "answer",
+            "end": END,
+        },
+    )
+    graph.add_conditional_edges(
+        "retrieve",
+        route_after_retrieve,
+        {
+            "selective_read": "selective_read",
+            "answer": "answer",
+            "end": END,
+        },
+    )
+    graph.add_edge("selective_read", "pack")
+    graph.add_edge("pack", "answer")
 
     graph.add_conditional_edges(
         "answer",
@@ -201,24 +821,245 @@ def build_graph():
     return graph.compile()
 
 
-def run_agent(query: str, session_id: str | None = None) -> dict:
-    trace_id = str(uuid.uuid4())
-    app = build_graph()
-    init_state: AgentState = {
-        "trace_id": trace_id,
+@lru_cache(maxsize=1)
+def get_graph():
+    return build_graph()
+
+
+def _init_state(
+    query: str,
+    session_id: str | None,
+    speculative_items: list[dict] | None = None,
+    history: list[dict] | None = None,
+) -> AgentState:
+    state: AgentState = {
+        "trace_id": str(uuid.uuid4()),
         "query": query,
         "session_id": session_id,
+        "index_version": serving_index_version(),
         "attempts": 1,
         "used_tools": [],
         "retrieved_items": [],
         "evidence": [],
         "citations": [],
+        "seen_chunk_ids": [],
+        "tried_queries": [],
+        "history": history or [],
     }
-    out = app.invoke(init_state)
+    if speculative_items is not None:
+        state["speculative_items"] = speculative_items
+    return state
+
+
+def _load_history(session_id: str | None) -> list[dict]:
+    if not session_id or settings.session_backend == "off":
+        return []
+    return get_session_store().history(session_id)
+
+
+def _remember(session_id: str | None, query: str, result: dict, out: dict) -> None:
+    if not session_id or settings.session_backend == "off":
+        return
+    items = out.get("retrieved_items", [])
+    get_session_store().append(
+        session_id,
+        {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "query": query,
+            "expand_query": out.get("expand_query", ""),
+            "answer": result["answer"],
+            "chunk_ids": [x["chunk_id"] for x in items or result["citations"]],
+            "items": items,
+            "index_version": result["index_version"],
+        },
+    )
+
+
+def _result(init_state: AgentState, out: dict) -> dict:
     return {
         "answer": out.get("answer", FALLBACK_ANSWER),
         "citations": out.get("citations", []),
-        "trace_id": trace_id,
+        "trace_id": init_state["trace_id"],
         "attempts": out.get("attempts", 1),
         "used_tools": out.get("used_tools", []),
+        "index_version": init_state["index_version"],
     }
+
+
+def _cache_lookup(query: str, use_cache: bool = True) -> tuple[list[float] | None, CacheHit | None]:
+    if not (use_cache and settings.semantic_cache_enabled):
+        return None, None
+    vector = embed_query(query)
+    return vector, get_answer_cache().lookup(vector, serving_index_version())
+
+
+def _cache_hit_result(query: str, hit: CacheHit) -> dict:
+    trace_id = str(uuid.uuid4())
+    index_version = serving_index_version()
+    _append_trace(
+        trace_id,
+        {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "type": "semantic_cache_hit",
+            "query": query,
+            "cached_query": hit.query,
+            "cached_trace_id": hit.result["trace_id"],
+            "similarity": hit.similarity,
+            "index_version": index_version,
+        },
+    )
+    return {
+        **hit.result,
+        "trace_id": trace_id,
+        "attempts": 0,
+        "used_tools": ["semantic_cache"],
+        "index_version": index_version,
+    }
+
+
+def _cache_store(query: str, vector: list[float] | None, out: dict, result: dict, latency: float) -> None:
+    # Only grounded policy answers are reusable; chit-chat and fallbacks are not.
+    if vector is None or not out.get("is_policy_related") or not out.get("is_answerable"):
+        return
+    get_answer_cache().store(query, vector, result, latency, result["index_version"])
+
+
+def _log_request(result: dict, spans: list[dict], latency: float, path: str) -> None:
+    stats.observe("request_seconds", latency, {"name": path})
+    _append_trace(
+        result["trace_id"],
+        {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "type": "request_summary",
+            "path": path,
+            "index_version": result["index_version"],
+            "latency_ms": round(latency * 1000, 2),
+            "breakdown": summarize_spans(spans),
+            "spans": spans,
+        },
+    )
+
+
+def run_agent(
+    query: str,
+    session_id: str | None = None,
+    speculative_items: list[dict] | None = None,
+    use_cache: bool = True,
+) -> dict:
+    start = time.perf_counter()
+    with collect_spans() as spans:
+        history = _load_history(session_id)
+        # A follow-up's meaning depends on its history, so it neither reads nor fills the answer cache.
+        vector, hit = _cache_lookup(query, use_cache and not history)
+        out: dict = {}
+        if hit is not None:
+            result = _cache_hit_result(query, hit)
+        else:
+            init_state = _init_state(query, session_id, speculative_items, history)
+            out = get_graph().invoke(init_state)
+            result = _result(init_state, out)
+            _cache_store(query, vector, out, result, time.perf_counter() - start)
+        _remember(session_id, query, result, out)
+    _log_request(result, spans, time.perf_counter() - start, "cache" if hit else "graph")
+    return result
+
+
+async def arun_agent(
+    query: str,
+    session_id: str | None = None,
+    speculative_items: list[dict] | None = None,
+    use_cache: bool = True,
+) -> dict:
+    start = time.perf_counter()
+    with collect_spans() as spans:
+        history = await asyncio.to_thread(_load_history, session_id)
+        vector, hit = await asyncio.to_thread(_cache_lookup, query, use_cache and not history)
+        out: dict = {}
+        if hit is not None:
+            result = _cache_hit_result(query, hit)
+        else:
+            init_state = _init_state(query, session_id, speculative_items, history)
+            out = await get_graph().ainvoke(init_state)
+            result = _result(init_state, out)
+            _cache_store(query, vector, out, result, time.perf_counter() - start)
+        await asyncio.to_thread(_remember, session_id, query, result, out)
+    _log_request(result, spans, time.perf_counter() - start, "cache" if hit else "graph")
+    return result
+
+
+def _merge_update(out: dict, update: dict) -> None:
+    for key, value in update.items():
+        if key == "used_tools":
+            out[key] = out.get(key, []) + value
+        else:
+            out[key] = value
+
+
+def _node_event(node: str, update: dict) -> dict | None:
+    if node in ("triage", "classify") and "is_policy_related" in update:
+        return {"event": "classified", "is_policy_related": update["is_policy_related"]}
+    if node == "rewrite":
+        return {"event": "rewritten", "expand_query": update["expand_query"], "keyword": update["keyword"]}
+    if node == "plan" and update.get("session_reused"):
+        items = update["retrieved_items"]
+        return {"event": "session_reused", "chunk_ids": [x["chunk_id"] for x in items]}
+    if node == "retrieve":
+        items = update["retrieved_items"]
+        return {"event": "retrieved", "count": len(items), "chunk_ids": [x["chunk_id"] for x in items]}
+    if node == "selective_read":
+        return {"event": "evidence", "count": len(update["evidence"])}
+    if node == "retry_inc":
+        return {"event": "retry", "attempt": update["attempts"]}
+    return None
+
+
+async def astream_agent(query: str, session_id: str | None = None) -> AsyncIterator[dict]:
+    start = time.perf_counter()
+    with collect_spans() as spans:
+        history = await asyncio.to_thread(_load_history, session_id)
+        vector, hit = await asyncio.to_thread(_cache_lookup, query, not history)
+        out: dict = {}
+        if hit is not None:
+            result = _cache_hit_result(query, hit)
+        else:
+            init_state = _init_state(query, session_id, history=history)
+            out = dict(init_state)
+            streamed_attempt: int | None = None
+            marks = CitationMarkFilter({})
+            async for mode, payload in get_graph().astream(
+                init_state,
+                config={"configurable": {"stream_answer": True}},
+                stream_mode=["updates", "messages"],
+            ):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if STREAM_TAG not in metadata.get("tags", []) or not chunk.content:
+                        continue
+                    attempt = out.get("attempts", 1)
+                    if attempt != streamed_attempt:
+                        if streamed_attempt is not None:
+                            # A retry answers again; clients discard the text streamed so far.
+                            yield {"event": "reset", "attempt": attempt}
+                        streamed_attempt = attempt
+                        marks = CitationMarkFilter(_citation_index(out.get("evidence", [])))
+                    text = marks.feed(chunk.content)
+                    if text:
+                        yield {"event": "token", "text": text}
+                    continue
+                for node, update in payload.items():
+                    if node == "answer":
+                        text = marks.flush()
+                        if text:
+                            yield {"event": "token", "text": text}
+                    if not update:
+                        continue
+                    _merge_update(out, update)
+                    event = _node_event(node, update)
+                    if event is not None:
+                        yield event
+
+            result = _result(init_state, out)
+            _cache_store(query, vector, out, result, time.perf_counter() - start)
+        await asyncio.to_thread(_remember, session_id, query, result, out)
+    _log_request(result, spans, time.perf_counter() - start, "cache" if hit else "graph")
+    yield {"event": "final", **result}
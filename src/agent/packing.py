@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import re
+
+
+EVIDENCE_FIELDS = ("doc_id", "chunk_id", "source", "excerpt")
+_SENTENCE_END = re.compile(r"[。！？!?；;\n]")
+
+
+def estimate_tokens(text: str) -> int:
+    # Conservative for DeepSeek's tokenizer: about one token per CJK character.
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+def _bigrams(text: str) -> set[str]:
+    squashed = "".join(text.split())
+    return {squashed[i : i + 2] for i in range(len(squashed) - 1)} or {squashed}
+
+
+def near_duplicate(a: str, b: str, threshold: float) -> bool:
+    ga, gb = _bigrams(a), _bigrams(b)
+    # Containment rather than Jaccard, so a short excerpt inside a longer one counts.
+    return len(ga & gb) / min(len(ga), len(gb)) >= threshold
+
+
+@dataclass
+class _Span:
+    rank: int
+    evidence: dict
+    start: int | None = None
+    end: int | None = None
+    chunk_ids: list[str] = field(default_factory=list)
+
+
+def _locate(evidence: list[dict], items: list[dict]) -> list[_Span]:
+    by_id = {x["chunk_id"]: (rank, x) for rank, x in enumerate(items)}
+    spans: list[_Span] = []
+    for i, ev in enumerate(evidence):
+        rank, item = by_id.get(ev["chunk_id"], (len(items) + i, None))
+        chunk_ids = list(ev.get("merged_chunk_ids") or [ev["chunk_id"]])
+        span = _Span(rank, {k: ev[k] for k in EVIDENCE_FIELDS}, chunk_ids=chunk_ids)
+        if item is not None:
+            # Excerpts are either sentences inside the chunk or the chunk plus expanded context.
+            inner = item["content"].find(ev["excerpt"])
+            outer = ev["excerpt"].find(item["content"]) if inner < 0 else -1
+            if inner >= 0:
+                span.start = item["start_offset"] + inner
+            elif outer >= 0:
+                span.start = item["start_offset"] - outer
+            if span.start is not None:
+                span.end = span.start + len(ev["excerpt"])
+        spans.append(span)
+    return spans
+
+
+def _merge(spans: list[_Span]) -> tuple[list[_Span], int]:
+    located = sorted(
+        (s for s in spans if s.start is not None),
+        key=lambda s: (s.evidence["doc_id"], s.evidence["source"], s.start),
+    )
+    merged: list[_Span] = []
+    count = 0
+    for span in located:
+        prev = merged[-1] if merged else None
+        same_doc = prev is not None and (prev.evidence["doc_id"], prev.evidence["source"]) == (
+            span.evidence["doc_id"],
+            span.evidence["source"],
+        )
+        if not same_doc or span.start > prev.end:
+            merged.append(span)
+            continue
+        # Overlapping or adjacent spans of one document: stitch them into one excerpt.
+        count += 1
+        if span.end > prev.end:
+            prev.evidence["excerpt"] += span.evidence["excerpt"][prev.end - span.start :]
+            prev.end = span.end
+        if span.rank < prev.rank:
+            # The best-ranked chunk's id is the one the answer will cite.
+            prev.rank = span.rank
+            prev.evidence["chunk_id"] = span.evidence["chunk_id"]
+        prev.chunk_ids.extend(x for x in span.chunk_ids if x not in prev.chunk_ids)
+    return merged + [s for s in spans if s.start is None], count
+
+
+def _truncate(text: str, tokens: int) -> str:
+    cut = text
+    while cut and estimate_tokens(cut) > tokens:
+        cut = cut[: int(len(cut) * 0.9)]
+    ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    return cut[: ends[-1]].rstrip() if ends else cut
+
+
+def pack_evidence(
+    evidence: list[dict],
+    items: list[dict],
+    token_budget: int,
+    duplicate_threshold: float = 0.8,
+    min_truncated_tokens: int = 64,
+) -> tuple[list[dict], dict]:
+    spans, merged = _merge(_locate(evidence, items))
+    spans.sort(key=lambda s: s.rank)
+
+    kept: list[_Span] = []
+    duplicates = 0
+    for span in spans:
+        if any(near_duplicate(span.evidence["excerpt"], k.evidence["excerpt"], duplicate_threshold) for k in kept):
+            duplicates += 1
+            continue
+        kept.append(span)
+
+    packed: list[dict] = []
+    used = truncated = 0
+    for span in kept:
+        ev = span.evidence
+        tokens = estimate_tokens(ev["excerpt"])
+        remaining = token_budget - used
+        if token_budget > 0 and tokens > remaining:
+            if remaining < min_truncated_tokens and packed:
+                break
+            ev["excerpt"] = _truncate(ev["excerpt"], max(remaining, min_truncated_tokens))
+            tokens = estimate_tokens(ev["excerpt"])
+            truncated += 1
+        if len(span.chunk_ids) > 1:
+            ev["merged_chunk_ids"] = span.chunk_ids
+        packed.append(ev)
+        used += tokens
+        if token_budget > 0 and used >= token_budget:
+            break
+
+    report = {
+        "input": len(evidence),
+        "merged": merged,
+        "duplicates": duplicates,
+        "truncated": truncated,
+        "dropped": len(kept) - len(packed),
+        "tokens_before": sum(estimate_tokens(x["excerpt"]) for x in evidence),
+        "tokens_after": used,
+    }
+    return packed, report
@@ -19,6 +19,18 @@ EXPAND_KEYWORD_PROMPT = """
 问题：{query}
 """.strip()
 
+EXPAND_KEYWORD_RETRY_PROMPT = """
+以下改写已经检索过，但没有找到充分依据。请换一个角度重新改写用户问题（不要与已尝试的改写重复），并提取一个最关键关键词。
+已尝试的改写：
+{tried}
+问题：{query}
+""".strip()
+
+HISTORY_PROMPT = """
+之前的对话如下，当前问题可能省略了其中提到的对象，请结合上下文理解；改写时补全为可以单独检索的问题。
+{history}
+""".strip()
+
 SELECTIVE_READ_PROMPT = """
 你会收到用户问题与多个原文片段。
 请只复制与问题强相关的原文句子，不要改写，不要总结。
@@ -32,4 +44,15 @@ ANSWER_PROMPT = """
 3. citations 必须来自 evidence，不可杜撰。
 """.strip()
 
+# The streamed answer has no is_answerable field; this exact reply is the model's "not answerable".
+INSUFFICIENT_EVIDENCE = "未在文档中检索到充分依据"
+
+ANSWER_STREAM_PROMPT = f"""
+基于证据回答用户问题，直接输出回答正文。
+要求：
+1. 仅依据 evidence 作答。
+2. 引用证据时，在相应句末用 [doc_id:chunk_id] 标注来源，标注必须来自 evidence，不可杜撰。
+3. 如果证据不足，只输出“{INSUFFICIENT_EVIDENCE}”。
+""".strip()
+
 FALLBACK_ANSWER = "没有在文档中检索到相关内容，所以无法准确回答。"
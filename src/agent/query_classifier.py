@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+from src.config.settings import settings
+from src.runtime.resources import registry
+
+
+class QueryClassifier:
+    def __init__(self, weights: np.ndarray | None, bias: float = 0.0, meta: dict | None = None) -> None:
+        self.weights = weights
+        self.bias = bias
+        self.meta = meta or {}
+
+    @property
+    def ready(self) -> bool:
+        return self.weights is not None
+
+    @classmethod
+    def fit(
+        cls,
+        vectors: np.ndarray,
+        labels: np.ndarray,
+        l2: float = 1e-3,
+        epochs: int = 500,
+        lr: float = 1.0,
+        meta: dict | None = None,
+    ) -> "QueryClassifier":
+        # L2-regularised logistic regression, classes weighted to equal total mass.
+        x = np.asarray(vectors, dtype=np.float64)
+        y = np.asarray(labels, dtype=np.float64)
+        pos = max(float(y.sum()), 1.0)
+        neg = max(float(len(y) - y.sum()), 1.0)
+        sample_weight = np.where(y > 0.5, len(y) / (2 * pos), len(y) / (2 * neg))
+        w = np.zeros(x.shape[1])
+        b = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(x @ w + b)))
+            g = (p - y) * sample_weight / len(y)
+            w -= lr * (x.T @ g + l2 * w)
+            b -= lr * float(g.sum())
+        return cls(w.astype(np.float32), b, meta)
+
+    def predict_proba(self, vectors) -> np.ndarray:
+        x = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        return 1.0 / (1.0 + np.exp(-(x @ self.weights + self.bias)))
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as f:
+            np.savez(
+                f,
+                weights=self.weights,
+                bias=np.float64(self.bias),
+                meta=np.frombuffer(orjson.dumps(self.meta), dtype=np.uint8),
+            )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "QueryClassifier":
+        path = Path(path)
+        if not path.exists():
+            return cls(None)
+        with np.load(path) as data:
+            meta = orjson.loads(data["meta"].tobytes())
+            clf = cls(data["weights"], float(data["bias"]), meta)
+        # Weights only make sense for the embedding model they were trained on.
+        if meta.get("embedding_model") not in (None, settings.embedding_model_path):
+            return cls(None, meta=meta)
+        return clf
+
+
+registry.register(
+    "query_classifier", lambda: QueryClassifier.load(settings.fast_classifier_path)
+)
+
+
+def get_query_classifier() -> QueryClassifier:
+    return registry.get("query_classifier")
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+
+import numpy as np
+
+from src.config.settings import settings
+from src.runtime.resources import registry
+from src.runtime.stats import stats
+
+
+@dataclass
+class CacheHit:
+    query: str
+    result: dict
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    row: int
+    query: str
+    result: dict
+    latency: float
+
+
+class SemanticCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._vectors: np.ndarray | None = None
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._created = np.zeros(max_entries, dtype=np.float64)
+        self._row_keys: list[str | None] = [None] * max_entries
+        self._version = ""
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, vector: list[float], version: str = "") -> CacheHit | None:
+        vec = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._check_version(version)
+            hit = self._nearest(vec)
+            if hit is None:
+                stats.incr("semantic_cache_miss")
+                return None
+            key, similarity = hit
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+        stats.incr("semantic_cache_hit")
+        stats.incr("semantic_cache_saved_seconds", entry.latency)
+        return CacheHit(query=entry.query, result=entry.result, similarity=similarity)
+
+    def store(
+        self, query: str, vector: list[float], result: dict, latency: float, version: str = ""
+    ) -> None:
+        vec = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vec.shape[0]), dtype=np.float32)
+            key = " ".join(query.split())
+            if key in self._entries:
+                self._evict(key)
+            if len(self._entries) >= self.max_entries:
+                self._evict(next(iter(self._entries)))
+            row = int(np.flatnonzero(~self._used)[0])
+            self._vectors[row] = vec
+            self._used[row] = True
+            self._created[row] = time.monotonic()
+            self._row_keys[row] = key
+            self._entries[key] = _Entry(row, query, result, latency)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        self._entries.clear()
+        self._used[:] = False
+        self._row_keys = [None] * self.max_entries
+
+    def _nearest(self, vec: np.ndarray) -> tuple[str, float] | None:
+        self._expire()
+        if not self._entries or self._vectors is None:
+            return None
+        sims = self._vectors @ vec
+        sims[~self._used] = -np.inf
+        row = int(np.argmax(sims))
+        if sims[row] < self.threshold:
+            return None
+        return self._row_keys[row], float(sims[row])
+
+    def _expire(self) -> None:
+        # 0 means entries never expire, as for the LLM cache.
+        if self.ttl_seconds <= 0:
+            return
+        deadline = time.monotonic() - self.ttl_seconds
+        for row in np.flatnonzero(self._used & (self._created < deadline)):
+            self._evict(self._row_keys[row])
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._used[entry.row] = False
+        self._row_keys[entry.row] = None
+
+    def _check_version(self, version: str) -> None:
+        # Answers cite chunk ids, so they are only valid for the index they came from.
+        if version == self._version:
+            return
+        if self._entries:
+            stats.incr("semantic_cache_invalidations")
+        self._reset()
+        self._version = version
+
+
+registry.register(
+    "answer_cache",
+    lambda: SemanticCache(
+        max_entries=settings.semantic_cache_max_entries,
+        ttl_seconds=settings.semantic_cache_ttl_seconds,
+        threshold=settings.semantic_cache_threshold,
+    ),
+    stateful=True,
+)
+
+
+def get_answer_cache() -> SemanticCache:
+    return registry.get("answer_cache")
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import threading
+import time
+
+import orjson
+
+from src.config.settings import settings
+from src.runtime.resources import registry
+from src.runtime.stats import stats
+
+
+class MemorySessionStore:
+    # Per-process turns, LRU over sessions; sessions idle past the TTL are dropped.
+    def __init__(self, max_sessions: int, max_turns: int, ttl_seconds: float) -> None:
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def history(self, session_id: str) -> list[dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            touched, turns = entry
+            if self.ttl_seconds > 0 and time.monotonic() - touched > self.ttl_seconds:
+                del self._sessions[session_id]
+                return []
+            self._sessions.move_to_end(session_id)
+            return list(turns)
+
+    def append(self, session_id: str, turn: dict) -> None:
+        with self._lock:
+            _, turns = self._sessions.pop(session_id, (0.0, []))
+            turns = (turns + [turn])[-self.max_turns :]
+            self._sessions[session_id] = (time.monotonic(), turns)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                stats.incr("session_evicted")
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+
+class RedisSessionStore:
+    # One Redis list per session, shared by all workers. Idle sessions expire after the TTL;
+    # eviction across sessions is left to the server's maxmemory policy (e.g. allkeys-lru).
+    def __init__(self, url: str, max_turns: int, ttl_seconds: float, prefix: str = "rag:session:") -> None:
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("SESSION_BACKEND=redis needs the redis package: pip install redis") from exc
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def history(self, session_id: str) -> list[dict]:
+        return [orjson.loads(x) for x in self._client.lrange(self.prefix + session_id, 0, -1)]
+
+    def append(self, session_id: str, turn: dict) -> None:
+        key = self.prefix + session_id
+        pipe = self._client.pipeline()
+        pipe.rpush(key, orjson.dumps(turn))
+        pipe.ltrim(key, -self.max_turns, -1)
+        if self.ttl_seconds > 0:
+            pipe.expire(key, int(self.ttl_seconds))
+        pipe.execute()
+
+    def clear(self, session_id: str) -> None:
+        self._client.delete(self.prefix + session_id)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def _load_session_store() -> MemorySessionStore | RedisSessionStore:
+    if settings.session_backend == "redis":
+        return RedisSessionStore(
+            settings.session_redis_url, settings.session_max_turns, settings.session_ttl_seconds
+        )
+    return MemorySessionStore(
+        settings.session_max_sessions, settings.session_max_turns, settings.session_ttl_seconds
+    )
+
+
+registry.register(
+    "session_store", _load_session_store, close=lambda store: store.close(), stateful=True
+)
+
+
+def get_session_store() -> MemorySessionStore | RedisSessionStore:
+    return registry.get("session_store")
@@ -1,22 +1,38 @@
 from __future__ import annotations
 
-from typing import Any, TypedDict
+import operator
+from typing import Annotated, Any, TypedDict
 
 
 class AgentState(TypedDict, total=False):
     trace_id: str
     query: str
     session_id: str | None
+    # Index version serving when the request started; recorded on every trace event.
+    index_version: str
+    # Earlier turns of the session, oldest first (see session_memory).
+    history: list[dict[str, Any]]
     is_policy_related: bool
+    # Fast classifier probability when it was not confident enough to decide.
+    policy_proba: float
 
     expand_query: str
     keyword: str
 
+    speculative_items: list[dict[str, Any]]
     retrieved_items: list[dict[str, Any]]
     evidence: list[dict[str, Any]]
 
+    # Carried across retries so later attempts only look at new material.
+    seen_chunk_ids: list[str]
+    tried_queries: list[str]
+
+    # Set when plan hands the previous turn's chunks to selective_read instead of retrieving.
+    session_reused: bool
+
     attempts: int
-    used_tools: list[str]
+    # Appended by reducer so parallel branches can both record tool use.
+    used_tools: Annotated[list[str], operator.add]
 
     answer: str
     citations: list[dict[str, Any]]
@@ -1,12 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import re
+
+import numpy as np
 from pydantic import BaseModel, Field
 
 from src.config.settings import settings
-from src.llm.deepseek_client import invoke_structured
-from src.retrieval.chroma_store import get_vectorstore
-from src.retrieval.rerank import RetrievedItem, apply_keyword_bonus
-from src.agent.prompts import EXPAND_KEYWORD_PROMPT, SELECTIVE_READ_PROMPT
+from src.llm.deepseek_client import ainvoke_structured, invoke_structured
+from src.retrieval.embeddings import embed_query, get_embeddings, get_query_embedder
+from src.retrieval.lexical import get_lexical_index
+from src.retrieval.rerank import RetrievedItem, apply_keyword_bonus, reciprocal_rank_fusion
+from src.retrieval.vectorstore import get_vectorstore
+from src.runtime.spans import span
+from src.agent.prompts import (
+    EXPAND_KEYWORD_PROMPT,
+    EXPAND_KEYWORD_RETRY_PROMPT,
+    HISTORY_PROMPT,
+    SELECTIVE_READ_PROMPT,
+)
 
 
 class ExpandKeywordOutput(BaseModel):
@@ -40,52 +52,217 @@ class SelectiveReadOutput(BaseModel):
     evidence: list[EvidenceItem]
 
 
-def expand_and_keyword(query: str) -> ExpandKeywordOutput:
-    messages = [
+class _SummarySchema(BaseModel):
+    evidence: list[EvidenceItem]
+
+
+def format_history(turns: list[dict]) -> str:
+    lines = []
+    for turn in turns:
+        lines.append(f"用户：{turn['query']}")
+        lines.append(f"助手：{turn['answer']}")
+    return HISTORY_PROMPT.format(history="\n".join(lines))
+
+
+def _expand_messages(
+    query: str, tried: list[str] | None = None, history: list[dict] | None = None
+) -> list[dict]:
+    if tried:
+        prompt = EXPAND_KEYWORD_RETRY_PROMPT.format(
+            query=query, tried="\n".join(f"- {x}" for x in tried)
+        )
+    else:
+        prompt = EXPAND_KEYWORD_PROMPT.format(query=query)
+    if history:
+        prompt = format_history(history) + "\n\n" + prompt
+    return [
         {"role": "system", "content": "你负责改写query并提取关键词。"},
-        {"role": "user", "content": EXPAND_KEYWORD_PROMPT.format(query=query)},
+        {"role": "user", "content": prompt},
     ]
-    return invoke_structured(messages, ExpandKeywordOutput)
 
 
-def retrieval_augment(query: str, keyword: str) -> RetrieveOutput:
+def expand_and_keyword(
+    query: str, tried: list[str] | None = None, history: list[dict] | None = None
+) -> ExpandKeywordOutput:
+    return invoke_structured(_expand_messages(query, tried, history), ExpandKeywordOutput)
+
+
+async def aexpand_and_keyword(
+    query: str, tried: list[str] | None = None, history: list[dict] | None = None
+) -> ExpandKeywordOutput:
+    return await ainvoke_structured(_expand_messages(query, tried, history), ExpandKeywordOutput)
+
+
+def normalize_query(query: str) -> str:
+    return "".join(query.split()).rstrip("？?。.!！").lower()
+
+
+def _vector_candidates(query: str, k: int) -> list[RetrievedItem]:
     vectorstore = get_vectorstore()
-    docs = vectorstore.similarity_search_with_score(query, k=settings.top_k_recall)
+    with span("retrieval", "vector"):
+        return vectorstore.search([embed_query(query)], k)[0]
 
+
+def fetch_chunks(chunk_ids: list[str]) -> list[RetrievedItem]:
+    if not chunk_ids:
+        return []
+    with span("retrieval", "fetch"):
+        return get_vectorstore().fetch(chunk_ids)
+
+
+def _fuse_candidates(
+    vector_items: list[RetrievedItem], lexical_ids: list[str], k: int
+) -> list[RetrievedItem]:
+    by_id = {x.chunk_id: x for x in vector_items}
+    fused = reciprocal_rank_fusion(
+        [[x.chunk_id for x in vector_items], lexical_ids], settings.rrf_k
+    )[:k]
+    missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+    by_id.update({x.chunk_id: x for x in fetch_chunks(missing)})
+
+    # Fused distance: 0 for a chunk ranked first by both retrievers, lower is better.
+    best = 2.0 / (settings.rrf_k + 1)
     items: list[RetrievedItem] = []
-    for doc, distance in docs:
-        metadata = doc.metadata or {}
-        items.append(
-            RetrievedItem(
-                doc_id=str(metadata.get("doc_id", "unknown_doc")),
-                chunk_id=str(metadata.get("chunk_id", "unknown_chunk")),
-                source=str(metadata.get("source", "unknown_source")),
-                start_offset=int(metadata.get("start_offset", 0)),
-                end_offset=int(metadata.get("end_offset", 0)),
-                content=doc.page_content,
-                distance=float(distance),
-            )
-        )
+    for chunk_id, score in fused:
+        item = by_id.get(chunk_id)
+        if item is not None:
+            item.distance = 1.0 - score / best
+            item.fused = True
+            items.append(item)
+    return items
+
+
+def _hybrid_candidates(query: str, items: list[RetrievedItem], k: int) -> list[RetrievedItem]:
+    if not settings.hybrid_retrieval:
+        return items
+    with span("retrieval", "lexical"):
+        lexical = get_lexical_index().search(query, k)
+    if not lexical:
+        return items
+    return _fuse_candidates(items, [chunk_id for chunk_id, _ in lexical], k)
+
+
+def search_candidates(query: str, k: int | None = None) -> list[RetrievedItem]:
+    k = k or settings.top_k_recall
+    return _hybrid_candidates(query, _vector_candidates(query, k), k)
+
+
+def search_candidates_batch(queries: list[str], k: int | None = None) -> list[list[RetrievedItem]]:
+    # One encode for all queries and one vector-store search for all vectors.
+    k = k or settings.top_k_recall
+    vectors = get_query_embedder().embed_queries(queries)
+    with span("retrieval", "vector_batch"):
+        results = get_vectorstore().search(vectors, k)
+    return [_hybrid_candidates(query, items, k) for query, items in zip(queries, results)]
+
+
+async def asearch_candidates(query: str, k: int | None = None) -> list[RetrievedItem]:
+    # Embedding + vector search are blocking; keep them off the event loop.
+    return await asyncio.to_thread(search_candidates, query, k)
 
+
+def rank_candidates(items: list[RetrievedItem], keyword: str) -> RetrieveOutput:
     ranked = apply_keyword_bonus(items, keyword)[: settings.top_k_final]
     return RetrieveOutput(
         items=[RetrieveItemOutput(**item.__dict__) for item in ranked]
     )
 
 
-def summary_related_doc(query: str, related_items: list[RetrieveItemOutput]) -> SelectiveReadOutput:
+def retrieval_augment(query: str, keyword: str) -> RetrieveOutput:
+    return rank_candidates(search_candidates(query), keyword)
+
+
+async def aretrieval_augment(query: str, keyword: str) -> RetrieveOutput:
+    return rank_candidates(await asearch_candidates(query), keyword)
+
+
+def _summary_messages(query: str, related_items: list[RetrieveItemOutput]) -> list[dict]:
     related_doc = "\n\n".join(
         [f"[{i.doc_id}:{i.chunk_id}] {i.content}" for i in related_items]
     )
-
-    class _SummarySchema(BaseModel):
-        evidence: list[EvidenceItem]
-
-    messages = [
+    return [
         {"role": "system", "content": SELECTIVE_READ_PROMPT},
         {
             "role": "user",
             "content": f"用户问题：{query}\n\n原文片段：\n{related_doc}",
         },
     ]
-    return invoke_structured(messages, _SummarySchema)
+
+
+def summary_related_doc(query: str, related_items: list[RetrieveItemOutput]) -> SelectiveReadOutput:
+    return invoke_structured(_summary_messages(query, related_items), _SummarySchema)
+
+
+async def asummary_related_doc(
+    query: str, related_items: list[RetrieveItemOutput]
+) -> SelectiveReadOutput:
+    return await ainvoke_structured(_summary_messages(query, related_items), _SummarySchema)
+
+
+_SENTENCE = re.compile(r"[^\u3002\uff01\uff1f!?\uff1b;\n]+[\u3002\uff01\uff1f!?\uff1b;]?")
+
+
+def split_sentences(text: str) -> list[tuple[int, int]]:
+    spans: list[tuple[int, int]] = []
+    for match in _SENTENCE.finditer(text):
+        start, end = match.span()
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end - start >= settings.extractive_min_sentence_chars:
+            spans.append((start, end))
+    return spans
+
+
+def _sentence_evidence(item: RetrieveItemOutput, start: int, end: int) -> EvidenceItem:
+    return EvidenceItem(
+        doc_id=item.doc_id,
+        chunk_id=item.chunk_id,
+        source=item.source,
+        excerpt=item.content[start:end],
+    )
+
+
+def extract_related_sentences(
+    query: str, keyword: str, related_items: list[RetrieveItemOutput]
+) -> SelectiveReadOutput:
+    spans = [
+        (i, start, end)
+        for i, item in enumerate(related_items)
+        for start, end in split_sentences(item.content)
+    ]
+    if not spans:
+        return SelectiveReadOutput(evidence=[])
+    texts = [related_items[i].content[start:end] for i, start, end in spans]
+    # Sentences go straight to the model: they would only evict real queries from the query cache.
+    vectors = np.asarray([embed_query(query), *get_embeddings().embed_documents(texts)], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    scores = vectors[1:] @ vectors[0]
+    if keyword:
+        scores += settings.extractive_keyword_weight * np.array([keyword in t for t in texts])
+
+    chosen: list[int] = []
+    used = 0
+    for j in np.argsort(-scores, kind="stable"):
+        if scores[j] < settings.extractive_min_score:
+            break
+        if used + len(texts[j]) > settings.extractive_budget_chars:
+            continue
+        chosen.append(int(j))
+        used += len(texts[j])
+
+    # Consecutive sentences of one chunk become a single verbatim excerpt.
+    evidence: list[EvidenceItem] = []
+    run: list[int] | None = None
+    for j in sorted(chosen):
+        i, start, end = spans[j]
+        if run is not None and run[0] == i and run[3] == j - 1:
+            run[2], run[3] = end, j
+            continue
+        if run is not None:
+            evidence.append(_sentence_evidence(related_items[run[0]], run[1], run[2]))
+        run = [i, start, end, j]
+    if run is not None:
+        evidence.append(_sentence_evidence(related_items[run[0]], run[1], run[2]))
+    return SelectiveReadOutput(evidence=evidence)
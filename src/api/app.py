@@ -1,9 +1,22 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Annotated
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import orjson
 from pydantic import BaseModel, Field
 
-from src.agent.graph import run_agent
+from src.agent.batch import arun_agent_batch, astream_agent_batch
+from src.agent.graph import arun_agent, astream_agent
+from src.config.settings import settings
+from src.retrieval.index_version import current_index_version, serving_index_version
+from src.runtime.prometheus import render_prometheus
+from src.runtime.resources import registry
+from src.runtime.stats import stats
+from src.runtime.trace_sink import get_trace_sink
 
 
 class AskRequest(BaseModel):
@@ -24,17 +37,114 @@ class AskResponse(BaseModel):
     trace_id: str
     attempts: int
     used_tools: list[str]
+    index_version: str = ""
+
+
+class BatchAskRequest(BaseModel):
+    queries: list[Annotated[str, Field(min_length=1)]] = Field(
+        ..., min_length=1, max_length=settings.batch_max_queries
+    )
+    stream: bool = False
+
+
+class BatchAskItem(BaseModel):
+    index: int
+    query: str
+    ok: bool
+    answer: str | None = None
+    citations: list[Citation] = []
+    trace_id: str | None = None
+    attempts: int | None = None
+    used_tools: list[str] = []
+    index_version: str | None = None
+    error: str | None = None
+
+
+class BatchAskResponse(BaseModel):
+    results: list[BatchAskItem]
 
 
-app = FastAPI(title="Agentic RAG QA System", version="0.1.0")
+class ReloadRequest(BaseModel):
+    # Omitted: models and index stores. Caches, sessions and sinks are only reloaded when named.
+    resources: list[str] | None = None
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await asyncio.to_thread(registry.warmup)
+    yield
+    await asyncio.to_thread(get_trace_sink().close)
+
+
+app = FastAPI(title="Agentic RAG QA System", version="0.1.0", lifespan=lifespan)
 
 
 @app.get("/health")
 def health() -> dict:
-    return {"status": "ok"}
+    ready = registry.is_ready()
+    return {
+        "status": "ok" if ready else "degraded",
+        "ready": ready,
+        "index_version": serving_index_version(),
+        "published_index_version": current_index_version(),
+        "resources": registry.status(),
+    }
+
+
+@app.get("/stats")
+def get_stats() -> dict:
+    return stats.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/admin/reload")
+def reload_resources(req: ReloadRequest | None = None) -> dict:
+    names = req.resources if req is not None else None
+    unknown = sorted(set(names or ()) - set(registry.names()))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown resources: {', '.join(unknown)}")
+    return {"resources": registry.reload(names)}
 
 
 @app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest) -> AskResponse:
-    result = run_agent(req.query, req.session_id)
+async def ask(req: AskRequest) -> AskResponse:
+    result = await arun_agent(req.query, req.session_id)
     return AskResponse(**result)
+
+
+def _sse(event: dict) -> bytes:
+    data = dict(event)
+    name = data.pop("event")
+    return b"event: " + name.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest) -> StreamingResponse:
+    async def events():
+        try:
+            async for event in astream_agent(req.query, req.session_id):
+                yield _sse(event)
+        except Exception as exc:
+            yield _sse({"event": "error", "message": str(exc)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/ask/batch", response_model=None)
+async def ask_batch(req: BatchAskRequest) -> BatchAskResponse | StreamingResponse:
+    if not req.stream:
+        return BatchAskResponse(results=await arun_agent_batch(req.queries))
+
+    async def lines():
+        async for item in astream_agent_batch(req.queries):
+            yield orjson.dumps(BatchAskItem(**item).model_dump()) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
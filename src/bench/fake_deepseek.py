@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+CHITCHAT_MARKERS = ("你好", "谢谢", "天气", "笑话", "你是谁")
+
+_QUESTION = re.compile(r"(?:问题[：:])\s*(.+)")
+_SPAN = re.compile(r"^\[([^\[\]:\n]+):([^\[\]\n]+)\] (.+)$", re.M)
+_SENTENCE = re.compile(r"[^。！？!?\n]+[。！？!?]?")
+
+
+def count_tokens(text: str) -> int:
+    # Roughly one token per CJK character or per three ASCII characters.
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+class _Context:
+    def __init__(self, messages: list[dict]) -> None:
+        user = [str(m.get("content") or "") for m in messages if m.get("role") == "user"]
+        text = user[-1] if user else ""
+        self.retry = "已尝试" in text
+        self.query = text.strip()
+        self.records: list[dict] = []
+
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            self.query = str(payload.get("query", ""))
+            self.records = [x for x in payload.get("evidence", []) if isinstance(x, dict)]
+        else:
+            questions = _QUESTION.findall(text)
+            if questions:
+                self.query = questions[-1].strip()
+            self.records = [
+                {"doc_id": m[1], "chunk_id": m[2], "source": "", "excerpt": m[3]}
+                for m in _SPAN.finditer(text)
+            ]
+
+    @property
+    def policy_related(self) -> bool:
+        return not any(x in self.query for x in CHITCHAT_MARKERS)
+
+    def record(self, index: int) -> dict:
+        return self.records[index % len(self.records)] if self.records else {}
+
+    def sentence(self, index: int) -> str:
+        excerpt = str(self.record(index).get("excerpt", ""))
+        match = _SENTENCE.search(excerpt)
+        return match.group(0).strip() if match else excerpt
+
+    def answer_text(self, marks: bool = False) -> str:
+        if not self.policy_related:
+            return "你好，我是校规问答助手，有校规相关的问题可以问我。"
+        if not self.records:
+            return "未在文档中检索到充分依据"
+        parts = []
+        for i in range(min(2, len(self.records))):
+            rec = self.record(i)
+            mark = f"[{rec.get('doc_id')}:{rec.get('chunk_id')}]" if marks else ""
+            parts.append(f"根据相关规定，{self.sentence(i)}{mark}")
+        return "\n".join(parts)
+
+
+def _resolve(schema: dict, defs: dict) -> dict:
+    ref = schema.get("$ref")
+    if ref:
+        return defs[ref.rsplit("/", 1)[-1]]
+    if "anyOf" in schema:
+        options = [x for x in schema["anyOf"] if x.get("type") != "null"]
+        return _resolve(options[0] if options else schema["anyOf"][0], defs)
+    return schema
+
+
+def _string(name: str, ctx: _Context, index: int) -> str:
+    rec = ctx.record(index)
+    if name in {"doc_id", "chunk_id", "source"}:
+        return str(rec.get(name, ""))
+    if name in {"excerpt", "quote"}:
+        return ctx.sentence(index)
+    if name == "answer":
+        return ctx.answer_text()
+    if name == "keyword":
+        return ctx.query[:4]
+    if name == "expand_query":
+        return f"{ctx.query} 相关规定" if ctx.retry else ctx.query
+    return ctx.query
+
+
+def sample_from_schema(
+    schema: dict, ctx: _Context, name: str = "", index: int = 0, defs: dict | None = None
+) -> Any:
+    defs = {**(defs or {}), **schema.get("$defs", {})}
+    schema = _resolve(schema, defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type", "object")
+    if kind == "object":
+        return {
+            key: sample_from_schema(sub, ctx, key, index, defs)
+            for key, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        count = min(2, len(ctx.records)) if ctx.records else 1
+        return [sample_from_schema(schema.get("items", {}), ctx, name, i, defs) for i in range(count)]
+    if kind == "boolean":
+        return ctx.policy_related if name.startswith("is_") else True
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return 0.0
+    return _string(name, ctx, index)
+
+
+def _pieces(text: str, size: int = 4) -> list[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+
+def create_app(
+    latency_ms: float = 200.0,
+    tokens_per_second: float = 100.0,
+    jitter: float = 0.2,
+) -> FastAPI:
+    app = FastAPI(title="Fake DeepSeek")
+
+    def first_token_delay() -> float:
+        return max(0.0, latency_ms / 1000 * (1 + random.uniform(-jitter, jitter)))
+
+    def generation_delay(tokens: int) -> float:
+        return tokens / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    def reply(body: dict) -> tuple[dict, str]:
+        ctx = _Context(body.get("messages", []))
+        tools = body.get("tools") or []
+        forced = body.get("tool_choice")
+        if tools:
+            fn = tools[0]["function"]
+            if isinstance(forced, dict):
+                wanted = forced.get("function", {}).get("name")
+                fn = next((t["function"] for t in tools if t["function"]["name"] == wanted), fn)
+            arguments = json.dumps(sample_from_schema(fn.get("parameters", {}), ctx), ensure_ascii=False)
+            call = {
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": fn["name"], "arguments": arguments},
+            }
+            return {"role": "assistant", "content": "", "tool_calls": [call]}, arguments
+
+        fmt = body.get("response_format") or {}
+        if fmt.get("type") == "json_schema":
+            content = json.dumps(sample_from_schema(fmt["json_schema"]["schema"], ctx), ensure_ascii=False)
+        elif fmt.get("type") == "json_object":
+            content = "{}"
+        else:
+            marks = "[doc_id:chunk_id]" in str(body.get("messages", [{}])[0].get("content", ""))
+            content = ctx.answer_text(marks=marks)
+        return {"role": "assistant", "content": content}, content
+
+    def usage(body: dict, output: str) -> dict:
+        prompt = sum(count_tokens(str(m.get("content") or "")) for m in body.get("messages", []))
+        completion = count_tokens(output)
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    async def stream(body: dict, message: dict, output: str) -> AsyncIterator[bytes]:
+        cid = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model")}
+
+        def chunk(delta: dict, finish: str | None = None, **extra) -> bytes:
+            data = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            return b"data: " + json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+        await asyncio.sleep(first_token_delay())
+        yield chunk({"role": "assistant", "content": ""})
+        if message.get("tool_calls"):
+            await asyncio.sleep(generation_delay(count_tokens(output)))
+            calls = [{"index": 0, **message["tool_calls"][0]}]
+            yield chunk({"tool_calls": calls})
+            finish = "tool_calls"
+        else:
+            for piece in _pieces(output):
+                await asyncio.sleep(generation_delay(count_tokens(piece)))
+                yield chunk({"content": piece})
+            finish = "stop"
+        yield chunk({}, finish)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield b"data: " + json.dumps({**base, "choices": [], "usage": usage(body, output)}).encode() + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    async def completions(request: Request):
+        body = await request.json()
+        message, output = reply(body)
+        if body.get("stream"):
+            return StreamingResponse(stream(body, message, output), media_type="text/event-stream")
+
+        await asyncio.sleep(first_token_delay() + generation_delay(count_tokens(output)))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                }
+            ],
+            "usage": usage(body, output),
+        }
+
+    # The OpenAI client appends /chat/completions to whatever base URL is configured.
+    app.add_api_route("/chat/completions", completions, methods=["POST"])
+    app.add_api_route("/v1/chat/completions", completions, methods=["POST"])
+
+    @app.get("/health")
+    def health() -> dict:
+        return {"status": "ok"}
+
+    return app
@@ -10,26 +10,97 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
 @dataclass(frozen=True)
 class Settings:
     deepseek_api_key: str = os.getenv("DEEPSEEK_API_KEY", "")
     deepseek_base_url: str = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     deepseek_model: str = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
+    llm_cache_enabled: bool = _env_bool("LLM_CACHE_ENABLED", True)
+    llm_cache_path: str = os.getenv("LLM_CACHE_PATH", "./rag_cache/llm_cache.sqlite3")
+    llm_cache_memory_entries: int = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+    llm_cache_ttl_seconds: float = float(os.getenv("LLM_CACHE_TTL_SECONDS", "604800"))
+
     embedding_model_path: str = os.getenv(
         "EMBEDDING_MODEL_PATH",
         "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
     )
     embedding_device: str = os.getenv("EMBEDDING_DEVICE", "cpu")
+    embed_batch_max_size: int = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+    embed_batch_max_wait_ms: float = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+    embed_cache_size: int = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+    embed_timeout_seconds: float = float(os.getenv("EMBED_TIMEOUT_SECONDS", "30"))
 
     chroma_persist_dir: str = os.getenv("CHROMA_PERSIST_DIR", "./rag_cache/chroma_db")
+    # Builds publish new version directories under CHROMA_PERSIST_DIR; workers poll for the switch.
+    index_poll_seconds: float = float(os.getenv("INDEX_POLL_SECONDS", "2.0"))
+    index_swap_grace_seconds: float = float(os.getenv("INDEX_SWAP_GRACE_SECONDS", "30"))
+    index_keep_versions: int = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+    # chroma | flat; flat serves queries from a memory-mapped export of the Chroma collection.
+    vector_backend: str = os.getenv("VECTOR_BACKEND", "chroma")
+    # Scan int8 codes, then rescore the best k * factor rows with the float32 vectors.
+    flat_index_int8: bool = _env_bool("FLAT_INDEX_INT8", False)
+    flat_index_rescore_factor: int = int(os.getenv("FLAT_INDEX_RESCORE_FACTOR", "4"))
     trace_dir: str = os.getenv("TRACE_DIR", "./train/data/traces")
+    trace_queue_size: int = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+    trace_batch_size: int = int(os.getenv("TRACE_BATCH_SIZE", "256"))
+    trace_flush_seconds: float = float(os.getenv("TRACE_FLUSH_SECONDS", "1.0"))
+    trace_segment_max_mb: int = int(os.getenv("TRACE_SEGMENT_MAX_MB", "64"))
+    trace_segment_max_seconds: float = float(os.getenv("TRACE_SEGMENT_MAX_SECONDS", "3600"))
+    trace_on_full: str = os.getenv("TRACE_ON_FULL", "drop")
 
     top_k_recall: int = int(os.getenv("TOP_K_RECALL", "10"))
     top_k_final: int = int(os.getenv("TOP_K_FINAL", "5"))
     keyword_bonus: float = float(os.getenv("KEYWORD_BONUS", "0.1"))
     max_attempts: int = int(os.getenv("MAX_ATTEMPTS", "3"))
     selective_read_char_threshold: int = int(os.getenv("SELECTIVE_READ_CHAR_THRESHOLD", "1000"))
+    # extractive | llm; extractive falls back to the LLM when no sentence clears the minimum score.
+    selective_read_mode: str = os.getenv("SELECTIVE_READ_MODE", "extractive")
+    extractive_budget_chars: int = int(os.getenv("EXTRACTIVE_BUDGET_CHARS", "800"))
+    extractive_min_score: float = float(os.getenv("EXTRACTIVE_MIN_SCORE", "0.25"))
+    extractive_keyword_weight: float = float(os.getenv("EXTRACTIVE_KEYWORD_WEIGHT", "0.1"))
+    extractive_min_sentence_chars: int = int(os.getenv("EXTRACTIVE_MIN_SENTENCE_CHARS", "4"))
+    context_expand_chars: int = int(os.getenv("CONTEXT_EXPAND_CHARS", "0"))
+    # Evidence handed to the answer step; 0 disables the budget (merging and dedup still apply).
+    pack_token_budget: int = int(os.getenv("PACK_TOKEN_BUDGET", "1500"))
+    pack_duplicate_threshold: float = float(os.getenv("PACK_DUPLICATE_THRESHOLD", "0.8"))
+
+    fast_classifier_enabled: bool = _env_bool("FAST_CLASSIFIER_ENABLED", True)
+    fast_classifier_path: str = os.getenv("FAST_CLASSIFIER_PATH", "./rag_cache/query_classifier.npz")
+    # P(policy) at or above the upper bound / at or below the lower bound skips the LLM call.
+    fast_classifier_policy_threshold: float = float(os.getenv("FAST_CLASSIFIER_POLICY_THRESHOLD", "0.9"))
+    fast_classifier_chitchat_threshold: float = float(os.getenv("FAST_CLASSIFIER_CHITCHAT_THRESHOLD", "0.1"))
+
+    hybrid_retrieval: bool = _env_bool("HYBRID_RETRIEVAL", True)
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+
+    speculative_retrieval: bool = _env_bool("SPECULATIVE_RETRIEVAL", True)
+    speculative_merge_overlap: float = float(os.getenv("SPECULATIVE_MERGE_OVERLAP", "0.5"))
+
+    semantic_cache_enabled: bool = _env_bool("SEMANTIC_CACHE_ENABLED", True)
+    semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+    semantic_cache_ttl_seconds: float = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+
+    # memory | redis | off; redis (or any server speaking its protocol) shares sessions across workers.
+    session_backend: str = os.getenv("SESSION_BACKEND", "memory")
+    session_redis_url: str = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+    session_max_sessions: int = int(os.getenv("SESSION_MAX_SESSIONS", "1024"))
+    session_max_turns: int = int(os.getenv("SESSION_MAX_TURNS", "8"))
+    session_ttl_seconds: float = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    session_prompt_turns: int = int(os.getenv("SESSION_PROMPT_TURNS", "3"))
+    # Cosine similarity between the rewritten follow-up and the last retrieval query needed to reuse its chunks.
+    session_reuse_threshold: float = float(os.getenv("SESSION_REUSE_THRESHOLD", "0.75"))
+
+    batch_concurrency: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    batch_max_queries: int = int(os.getenv("BATCH_MAX_QUERIES", "500"))
 
 
 settings = Settings()
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+from src.agent.tools import expand_and_keyword
+from src.config.settings import settings
+from src.retrieval.embeddings import get_query_embedder
+from src.retrieval.index_version import current_index_version
+from src.retrieval.lexical import get_lexical_index
+from src.retrieval.vectorstore import get_vectorstore
+
+
+# Rank of a candidate that one retriever did not return.
+MISSING = np.iinfo(np.int32).max
+
+
+@dataclass
+class RankCache:
+    # One row per eval query, one column per candidate: vector hits in rank order, then
+    # lexical-only hits in lexical rank order (the insertion order reciprocal_rank_fusion sees).
+    queries: list[str]
+    keywords: list[str]
+    chunk_ids: np.ndarray  # (Q, C) str, "" pads
+    vector_rank: np.ndarray  # (Q, C) int32, MISSING when not a vector hit
+    lexical_rank: np.ndarray  # (Q, C) int32, MISSING when not a lexical hit
+    distance: np.ndarray  # (Q, C) float64 vector distance, inf when not a vector hit
+    keyword_hit: np.ndarray  # (Q, C) bool
+    depth: int
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as f:
+            np.savez(
+                f,
+                queries=np.asarray(self.queries, dtype=str),
+                keywords=np.asarray(self.keywords, dtype=str),
+                chunk_ids=self.chunk_ids,
+                vector_rank=self.vector_rank,
+                lexical_rank=self.lexical_rank,
+                distance=self.distance,
+                keyword_hit=self.keyword_hit,
+                depth=np.int64(self.depth),
+            )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "RankCache":
+        with np.load(path) as data:
+            return cls(
+                queries=data["queries"].tolist(),
+                keywords=data["keywords"].tolist(),
+                chunk_ids=data["chunk_ids"],
+                vector_rank=data["vector_rank"],
+                lexical_rank=data["lexical_rank"],
+                distance=data["distance"],
+                keyword_hit=data["keyword_hit"],
+                depth=int(data["depth"]),
+            )
+
+
+def load_eval_set(path: str | Path) -> list[dict]:
+    with Path(path).open("rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
+
+
+def missing_gold_chunks(records: list[dict]) -> list[str]:
+    # Chunk ids hash the source path, offset and content, so labels go stale when the corpus is re-chunked.
+    gold = sorted({c for r in records for c in r.get("gold_chunks", [])})
+    if not gold:
+        return []
+    found = {x.chunk_id for x in get_vectorstore().fetch(gold)}
+    return [c for c in gold if c not in found]
+
+
+def rewrite_queries(records: list[dict], concurrency: int = 8) -> list[tuple[str, str]]:
+    # Same rewrite the agent retrieves with; records that carry expand_query/keyword keep them.
+    def one(record: dict) -> tuple[str, str]:
+        if "expand_query" in record:
+            return record["expand_query"], record.get("keyword", "")
+        res = expand_and_keyword(record["query"])
+        return res.expand_query or record["query"], res.keyword
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return list(pool.map(one, records))
+
+
+def collect_ranks(
+    queries: list[str], keywords: list[str], depth: int, hybrid: bool | None = None, batch_size: int = 256
+) -> RankCache:
+    hybrid = settings.hybrid_retrieval if hybrid is None else hybrid
+    store = get_vectorstore()
+    vector_hits = []
+    for lo in range(0, len(queries), batch_size):
+        vectors = get_query_embedder().embed_queries(queries[lo : lo + batch_size])
+        vector_hits.extend(store.search(vectors, depth))
+    lexical_hits = [get_lexical_index().search(q, depth) if hybrid else [] for q in queries]
+
+    content = {x.chunk_id: x.content for hits in vector_hits for x in hits}
+    missing = sorted({c for hits in lexical_hits for c, _ in hits} - content.keys())
+    if missing:
+        content.update({x.chunk_id: x.content for x in store.fetch(missing)})
+
+    rows = []
+    for hits, lexical in zip(vector_hits, lexical_hits):
+        vector_rank = {x.chunk_id: i for i, x in enumerate(hits)}
+        lexical_rank = {c: i for i, (c, _) in enumerate(lexical)}
+        # Lexical hits the store cannot return are dropped by the live pipeline as well.
+        order = [x.chunk_id for x in hits] + [c for c in lexical_rank if c not in vector_rank and c in content]
+        rows.append((order, vector_rank, lexical_rank, {x.chunk_id: x.distance for x in hits}))
+
+    n, width = len(queries), max([len(r[0]) for r in rows] + [1])
+    chunk_ids = np.full((n, width), "", dtype=object)
+    vector = np.full((n, width), MISSING, dtype=np.int32)
+    lexical = np.full((n, width), MISSING, dtype=np.int32)
+    distance = np.full((n, width), np.inf)
+    hit = np.zeros((n, width), dtype=bool)
+    for i, ((order, vector_rank, lexical_rank, distances), keyword) in enumerate(zip(rows, keywords)):
+        kw = keyword.lower().strip()
+        for j, chunk_id in enumerate(order):
+            chunk_ids[i, j] = chunk_id
+            vector[i, j] = vector_rank.get(chunk_id, MISSING)
+            lexical[i, j] = lexical_rank.get(chunk_id, MISSING)
+            distance[i, j] = distances.get(chunk_id, np.inf)
+            hit[i, j] = bool(kw) and kw in content[chunk_id].lower()
+    return RankCache(queries, keywords, chunk_ids.astype(str), vector, lexical, distance, hit, depth)
+
+
+def cache_key(queries: list[str], keywords: list[str], depth: int, hybrid: bool) -> str:
+    payload = {
+        "index_version": current_index_version(),
+        "embedding_model": settings.embedding_model_path,
+        "vector_backend": settings.vector_backend,
+        "flat_index_int8": settings.flat_index_int8,
+        "hybrid": hybrid,
+        "depth": depth,
+        "queries": queries,
+        "keywords": keywords,
+    }
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+
+
+def load_or_collect(
+    queries: list[str],
+    keywords: list[str],
+    depth: int,
+    cache_dir: str | Path,
+    hybrid: bool | None = None,
+    refresh: bool = False,
+) -> tuple[RankCache, bool]:
+    hybrid = settings.hybrid_retrieval if hybrid is None else hybrid
+    path = Path(cache_dir) / f"ranks-{cache_key(queries, keywords, depth, hybrid)}.npz"
+    if path.exists() and not refresh:
+        return RankCache.load(path), True
+    cache = collect_ranks(queries, keywords, depth, hybrid)
+    cache.save(path)
+    return cache, False
+
+
+def rank(
+    cache: RankCache,
+    top_k_recall: int,
+    top_k_final: int,
+    keyword_bonus: float,
+    rrf_k: int | None = None,
+) -> np.ndarray:
+    # Column indexes into cache.chunk_ids of the final top_k_final per query (-1 pads), as
+    # search_candidates + rank_candidates would return them with these settings.
+    rrf_k = settings.rrf_k if rrf_k is None else rrf_k
+    vector_in = cache.vector_rank < top_k_recall
+    lexical_in = cache.lexical_rank < top_k_recall
+    score = np.where(vector_in, 1.0 / (rrf_k + cache.vector_rank.astype(np.float64) + 1), 0.0)
+    score += np.where(lexical_in, 1.0 / (rrf_k + cache.lexical_rank.astype(np.float64) + 1), 0.0)
+    # Queries without lexical hits keep plain vector order and distances.
+    fused = lexical_in.any(axis=1, keepdims=True)
+    candidate = np.where(fused, vector_in | lexical_in, vector_in)
+
+    key = np.where(fused, -score, cache.vector_rank)
+    key = np.where(candidate, key, np.inf)
+    first = np.argsort(key, axis=1, kind="stable")[:, :top_k_recall]
+    selected = np.take_along_axis(candidate, first, axis=1)
+
+    best = 2.0 / (rrf_k + 1)
+    distance = np.where(fused, 1.0 - score / best, cache.distance)
+    distance = distance - keyword_bonus * cache.keyword_hit
+    distance = np.where(selected, np.take_along_axis(distance, first, axis=1), np.inf)
+    second = np.argsort(distance, axis=1, kind="stable")[:, :top_k_final]
+    ranked = np.take_along_axis(first, second, axis=1)
+    return np.where(np.take_along_axis(selected, second, axis=1), ranked, -1)
+
+
+def relevance(cache: RankCache, ranked: np.ndarray, gold: list[list[str]]) -> np.ndarray:
+    ids = np.take_along_axis(cache.chunk_ids, np.maximum(ranked, 0), axis=1)
+    out = np.zeros(ranked.shape, dtype=bool)
+    for i, chunk_ids in enumerate(gold):
+        out[i] = np.isin(ids[i], chunk_ids) & (ranked[i] >= 0)
+    return out
+
+
+def retrieval_metrics(relevant: np.ndarray, n_gold: np.ndarray, ks: list[int]) -> dict[str, float]:
+    # relevant: (Q, n) bool in rank order; n_gold: (Q,) gold chunks per query, all > 0.
+    if not len(relevant):
+        return {}
+    n = relevant.shape[1]
+    discount = 1.0 / np.log2(np.arange(2, n + 2))
+    first = np.where(relevant.any(axis=1), relevant.argmax(axis=1), n)
+    gains = np.cumsum(relevant * discount, axis=1)
+    ideal = np.cumsum(discount)
+    hits = np.cumsum(relevant, axis=1)
+    out: dict[str, float] = {}
+    for k in sorted(set(ks)):
+        c = min(k, n) - 1
+        if c < 0:
+            continue
+        out[f"hit@{k}"] = float((hits[:, c] > 0).mean())
+        out[f"recall@{k}"] = float((hits[:, c] / n_gold).mean())
+        out[f"mrr@{k}"] = float(np.where(first <= c, 1.0 / (first + 1), 0.0).mean())
+        out[f"ndcg@{k}"] = float((gains[:, c] / ideal[np.minimum(n_gold, c + 1) - 1]).mean())
+    return out
+
+
+def sweep(
+    cache: RankCache,
+    gold: list[list[str]],
+    top_k_recall: list[int],
+    top_k_final: list[int],
+    keyword_bonus: list[float],
+    ks: list[int] | None = None,
+) -> list[dict]:
+    # Queries without gold chunks (unanswerable) carry no retrieval signal and are skipped.
+    keep = np.asarray([bool(g) for g in gold])
+    sub = RankCache(
+        [q for q, k in zip(cache.queries, keep) if k],
+        [w for w, k in zip(cache.keywords, keep) if k],
+        cache.chunk_ids[keep],
+        cache.vector_rank[keep],
+        cache.lexical_rank[keep],
+        cache.distance[keep],
+        cache.keyword_hit[keep],
+        cache.depth,
+    )
+    gold = [g for g in gold if g]
+    n_gold = np.asarray([len(set(g)) for g in gold])
+    cutoffs = sorted(set(top_k_final) | set(ks or []))
+    rows = []
+    for recall_k, bonus in product(sorted(set(top_k_recall)), sorted(set(keyword_bonus))):
+        if recall_k > cache.depth:
+            raise ValueError(f"top_k_recall={recall_k} exceeds the cached depth {cache.depth}")
+        ranked = rank(sub, recall_k, max(cutoffs), bonus)
+        rows.append(
+            {
+                "top_k_recall": recall_k,
+                "keyword_bonus": bonus,
+                "queries": len(gold),
+                "metrics": retrieval_metrics(relevance(sub, ranked, gold), n_gold, cutoffs),
+            }
+        )
+    return rows
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+import orjson
+from pydantic import BaseModel
+
+from src.runtime.stats import stats
+
+
+def make_cache_key(
+    model: str, temperature: float, messages: list[dict], schema: type[BaseModel]
+) -> str:
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": [
+            {"role": m["role"], "content": str(m["content"]).strip()} for m in messages
+        ],
+        "schema": {"name": schema.__name__, "json": schema.model_json_schema()},
+    }
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: str | Path | None, max_memory: int = 1024, ttl_seconds: float = 0) -> None:
+        self.max_memory = max_memory
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None and not self._expired(hit[0]):
+                self._memory.move_to_end(key)
+                stats.incr("llm_cache_hit_memory")
+                return orjson.loads(hit[1])
+            row = None
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None or self._expired(row[1]):
+                stats.incr("llm_cache_miss")
+                return None
+            self._remember(key, row[1], row[0])
+        stats.incr("llm_cache_hit_disk")
+        return orjson.loads(row[0])
+
+    def set(self, key: str, value: dict) -> None:
+        blob = orjson.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, blob)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, blob, now),
+                )
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, created_at: float, blob: bytes) -> None:
+        self._memory[key] = (created_at, blob)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
@@ -1,26 +1,106 @@
 from __future__ import annotations
 
-from typing import Type, TypeVar
+import asyncio
+import time
+from typing import Any, Type, TypeVar
 
 from pydantic import BaseModel
 
 from src.config.settings import settings
+from src.llm.cache import LLMCache, make_cache_key
+from src.runtime.resources import registry
+from src.runtime.spans import record_span
+from src.runtime.stats import TOKEN_BUCKETS, stats
 
 
 T = TypeVar("T", bound=BaseModel)
 
+TEMPERATURE = 0
 
-def get_chat_model():
+
+def _load_chat_model():
     from langchain_deepseek import ChatDeepSeek
 
     return ChatDeepSeek(
         model=settings.deepseek_model,
         api_key=settings.deepseek_api_key,
         base_url=settings.deepseek_base_url,
-        temperature=0,
+        temperature=TEMPERATURE,
+        stream_usage=True,
     )
 
 
-def invoke_structured(messages: list[dict], schema: Type[T]) -> T:
-    model = get_chat_model().with_structured_output(schema)
-    return model.invoke(messages)
+registry.register("chat_model", _load_chat_model)
+registry.register(
+    "llm_cache",
+    lambda: LLMCache(
+        settings.llm_cache_path or None,
+        max_memory=settings.llm_cache_memory_entries,
+        ttl_seconds=settings.llm_cache_ttl_seconds,
+    ),
+    close=lambda cache: cache.close(),
+    stateful=True,
+)
+
+
+def get_chat_model():
+    return registry.get("chat_model")
+
+
+def get_llm_cache() -> LLMCache:
+    return registry.get("llm_cache")
+
+
+def _cache_key(messages: list[dict], schema: Type[T], use_cache: bool) -> str | None:
+    if not (use_cache and settings.llm_cache_enabled):
+        return None
+    return make_cache_key(settings.deepseek_model, TEMPERATURE, messages, schema)
+
+
+def record_llm_call(name: str, seconds: float, message: Any = None) -> None:
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt = int(usage.get("input_tokens", 0))
+    completion = int(usage.get("output_tokens", 0))
+    record_span("llm", name, seconds, prompt_tokens=prompt, completion_tokens=completion)
+    stats.observe("llm_prompt_tokens", prompt, {"name": name}, TOKEN_BUCKETS)
+    stats.observe("llm_completion_tokens", completion, {"name": name}, TOKEN_BUCKETS)
+
+
+def _parsed(schema: Type[T], res: dict, seconds: float) -> T:
+    # include_raw keeps the AIMessage so its usage_metadata can be recorded.
+    record_llm_call(schema.__name__, seconds, res["raw"])
+    if res["parsing_error"] is not None:
+        raise res["parsing_error"]
+    return res["parsed"]
+
+
+def invoke_structured(messages: list[dict], schema: Type[T], use_cache: bool = True) -> T:
+    start = time.perf_counter()
+    key = _cache_key(messages, schema, use_cache)
+    if key is not None:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            record_span("llm_cache", schema.__name__, time.perf_counter() - start)
+            return schema.model_validate(cached)
+
+    model = get_chat_model().with_structured_output(schema, include_raw=True)
+    res = _parsed(schema, model.invoke(messages), time.perf_counter() - start)
+    if key is not None:
+        get_llm_cache().set(key, res.model_dump())
+    return res
+
+
+async def ainvoke_structured(messages: list[dict], schema: Type[T], use_cache: bool = True) -> T:
+    start = time.perf_counter()
+    key = _cache_key(messages, schema, use_cache)
+    if key is not None:
+        cached = await asyncio.to_thread(get_llm_cache().get, key)
+        if cached is not None:
+            record_span("llm_cache", schema.__name__, time.perf_counter() - start)
+            return schema.model_validate(cached)
+
+    model = get_chat_model().with_structured_output(schema, include_raw=True)
+    res = _parsed(schema, await model.ainvoke(messages), time.perf_counter() - start)
+    if key is not None:
+        await asyncio.to_thread(get_llm_cache().set, key, res.model_dump())
+    return res
@@ -1,13 +1,33 @@
 from __future__ import annotations
 
+from pathlib import Path
+
 from langchain_chroma import Chroma
 
 from src.config.settings import settings
-from src.retrieval.embeddings import get_embeddings
+from src.retrieval.embeddings import get_query_embedder
+from src.retrieval.index_version import serving_index_dir
+from src.runtime.resources import registry
+
+
+def open_chroma(path: Path) -> Chroma:
+    return Chroma(persist_directory=str(path), embedding_function=get_query_embedder())
+
+
+def _load_chroma() -> Chroma:
+    return open_chroma(serving_index_dir())
+
+
+registry.register(
+    "chroma",
+    _load_chroma,
+    warmup=lambda vs: vs.get(limit=1),
+    depends_on=("query_embedder",),
+    # The flat backend serves queries without Chroma; it is only opened if something asks for it.
+    lazy=settings.vector_backend != "chroma",
+)
 
 
-def get_vectorstore() -> Chroma:
-    return Chroma(
-        persist_directory=settings.chroma_persist_dir,
-        embedding_function=get_embeddings(),
-    )
+def get_chroma() -> Chroma:
+    # The writable store used by indexing; queries go through vectorstore.get_vectorstore().
+    return registry.get("chroma")
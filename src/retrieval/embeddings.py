@@ -1,13 +1,201 @@
 from __future__ import annotations
 
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 
 from src.config.settings import settings
+from src.runtime.resources import registry
+from src.runtime.stats import stats
 
 
-def get_embeddings() -> HuggingFaceEmbeddings:
+def _load_embeddings() -> HuggingFaceEmbeddings:
     return HuggingFaceEmbeddings(
         model_name=settings.embedding_model_path,
         model_kwargs={"device": settings.embedding_device},
         encode_kwargs={"normalize_embeddings": True},
     )
+
+
+class BatchingEmbedder(Embeddings):
+    _STOP = object()
+
+    def __init__(
+        self,
+        base: Embeddings,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        cache_size: int = 4096,
+        timeout: float | None = None,
+    ) -> None:
+        self.base = base
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._pending: dict[str, Future] = {}
+        self._worker: threading.Thread | None = None
+        self._closed = False
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.submit(text).result(timeout=self.timeout)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.wait_for(asyncio.wrap_future(self.submit(text)), self.timeout)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        # A known batch is encoded in one call here rather than in max_batch slices by the worker.
+        owned: list[tuple[str, Future]] = []
+        futures: list[Future] = []
+        with self._lock:
+            for text in texts:
+                key = " ".join(text.split())
+                future, new = self._claim(key)
+                if new:
+                    owned.append((key, future))
+                futures.append(future)
+        if owned:
+            self._encode(owned)
+        return [f.result() for f in futures]
+
+    def submit(self, text: str) -> Future:
+        key = " ".join(text.split())
+        with self._lock:
+            future, new = self._claim(key)
+            if not new:
+                return future
+            if not self._closed:
+                # Enqueued under the lock so nothing can land behind _STOP.
+                self._ensure_worker()
+                self._queue.put((key, future))
+                return future
+        # Closed by a reload while a request still holds this instance: encode inline.
+        self._encode([(key, future)])
+        return future
+
+    def _claim(self, key: str) -> tuple[Future, bool]:
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+            stats.incr("embed_cache_hit")
+            done: Future = Future()
+            done.set_result(vector)
+            return done, False
+        # Identical strings already waiting share one encode.
+        future = self._pending.get(key)
+        if future is not None:
+            return future, False
+        future = Future()
+        self._pending[key] = future
+        return future, True
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._queue.put(self._STOP)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is self._STOP:
+                self._fail_queued()
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._queue.put(item)
+                    break
+                batch.append(item)
+            self._encode(batch)
+
+    def _fail_queued(self) -> None:
+        error = RuntimeError("query embedder closed")
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is self._STOP:
+                continue
+            key, future = item
+            with self._lock:
+                self._pending.pop(key, None)
+            future.set_exception(error)
+
+    def _encode(self, batch: list[tuple[str, Future]]) -> None:
+        texts = [key for key, _ in batch]
+        stats.incr("embed_batches")
+        stats.incr("embed_batch_items", len(texts))
+        try:
+            vectors = self.base.embed_documents(texts)
+        except Exception as exc:
+            with self._lock:
+                for key, _ in batch:
+                    self._pending.pop(key, None)
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        with self._lock:
+            for key, vector in zip(texts, vectors):
+                self._pending.pop(key, None)
+                self._cache[key] = vector
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+
+registry.register(
+    "embeddings",
+    _load_embeddings,
+    warmup=lambda emb: emb.embed_query("学生手册"),
+)
+registry.register(
+    "query_embedder",
+    lambda: BatchingEmbedder(
+        get_embeddings(),
+        max_batch=settings.embed_batch_max_size,
+        max_wait_ms=settings.embed_batch_max_wait_ms,
+        cache_size=settings.embed_cache_size,
+        timeout=settings.embed_timeout_seconds,
+    ),
+    depends_on=("embeddings",),
+    close=lambda embedder: embedder.close(),
+)
+
+
+def get_embeddings() -> HuggingFaceEmbeddings:
+    return registry.get("embeddings")
+
+
+def get_query_embedder() -> BatchingEmbedder:
+    return registry.get("query_embedder")
+
+
+def embed_query(text: str) -> list[float]:
+    return get_query_embedder().embed_query(text)
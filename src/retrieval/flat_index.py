@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+import orjson
+
+from src.retrieval.index_version import serving_index_dir
+
+
+# Rows converted to float32 at a time when scanning int8 codes.
+_BLOCK_ROWS = 65536
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1.0, norms)
+
+
+def quantize(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Symmetric per-row int8: row ~= codes * scale.
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    # New inode per file: workers that still map the old one keep reading valid data.
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+class FlatIndex:
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        chunks: list[dict],
+        codes: np.ndarray | None = None,
+        scales: np.ndarray | None = None,
+        rescore_factor: int = 4,
+    ) -> None:
+        self.vectors = vectors
+        self.chunks = chunks
+        self.codes = codes
+        self.scales = scales
+        self.rescore_factor = max(1, rescore_factor)
+        self.rows = {x["metadata"].get("chunk_id", ""): i for i, x in enumerate(chunks)}
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @classmethod
+    def empty(cls) -> "FlatIndex":
+        return cls(
+            np.zeros((0, 0), dtype=np.float32),
+            [],
+            np.zeros((0, 0), dtype=np.int8),
+            np.zeros(0, dtype=np.float32),
+        )
+
+    @classmethod
+    def build(cls, rows: Iterable[tuple[dict, str, Sequence[float]]]) -> "FlatIndex":
+        chunks: list[dict] = []
+        vectors: list[Sequence[float]] = []
+        for metadata, content, vector in rows:
+            chunks.append({"metadata": metadata, "content": content})
+            vectors.append(vector)
+        if not chunks:
+            return cls.empty()
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        return cls(matrix, chunks, *quantize(matrix))
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        _save_npy(path / "vectors.npy", np.ascontiguousarray(self.vectors))
+        _save_npy(path / "codes.npy", self.codes)
+        _save_npy(path / "scales.npy", self.scales)
+        tmp = path / "chunks.json.tmp"
+        tmp.write_bytes(orjson.dumps(self.chunks))
+        os.replace(tmp, path / "chunks.json")
+
+    @classmethod
+    def load(cls, path: str | Path, int8: bool = False, rescore_factor: int = 4) -> "FlatIndex":
+        path = Path(path)
+        if not (path / "chunks.json").exists():
+            return cls.empty()
+        return cls(
+            np.load(path / "vectors.npy", mmap_mode="r"),
+            orjson.loads((path / "chunks.json").read_bytes()),
+            np.load(path / "codes.npy", mmap_mode="r") if int8 else None,
+            np.load(path / "scales.npy") if int8 else None,
+            rescore_factor,
+        )
+
+    def _int8_scores(self, queries: np.ndarray) -> np.ndarray:
+        out = np.empty((len(self), len(queries)), dtype=np.float32)
+        for lo in range(0, len(self), _BLOCK_ROWS):
+            hi = lo + _BLOCK_ROWS
+            out[lo:hi] = np.asarray(self.codes[lo:hi], dtype=np.float32) @ queries.T
+        out *= self.scales[:, None]
+        return out
+
+    def search(self, vectors: Sequence[Sequence[float]], k: int) -> list[list[tuple[int, float]]]:
+        queries = _normalize(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        n = len(self)
+        k = min(k, n)
+        if k <= 0:
+            return [[] for _ in queries]
+        if self.codes is not None:
+            # Coarse top-(k * factor) on int8 codes, then exact scores for those rows only.
+            pool = min(n, k * self.rescore_factor)
+            approx = self._int8_scores(queries)
+            candidates = np.argpartition(-approx, pool - 1, axis=0)[:pool]
+            exact = np.asarray(self.vectors[candidates.ravel()], dtype=np.float32)
+            scores = np.einsum("pbd,bd->pb", exact.reshape(*candidates.shape, -1), queries)
+        else:
+            full = np.asarray(self.vectors) @ queries.T
+            candidates = np.argpartition(-full, k - 1, axis=0)[:k]
+            scores = np.take_along_axis(full, candidates, axis=0)
+        order = np.argsort(-scores, axis=0, kind="stable")[:k]
+        top = np.take_along_axis(candidates, order, axis=0)
+        top_scores = np.take_along_axis(scores, order, axis=0)
+        # Squared L2 between unit vectors, the same distance Chroma reports.
+        return [
+            [(int(row), float(2.0 - 2.0 * s)) for row, s in zip(top[:, b], top_scores[:, b])]
+            for b in range(len(queries))
+        ]
+
+    def fetch(self, chunk_ids: list[str]) -> list[int]:
+        return [self.rows[x] for x in chunk_ids if x in self.rows]
+
+
+def flat_index_dir(base: Path | None = None) -> Path:
+    return (base or serving_index_dir()) / "flat"
+
+
+def iter_chroma_rows(vs, page_size: int = 1000) -> Iterable[tuple[dict, str, list[float]]]:
+    offset = 0
+    while True:
+        page = vs.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not len(page["ids"]):
+            return
+        yield from zip(page["metadatas"], page["documents"], page["embeddings"])
+        offset += len(page["ids"])
+
+
+def export_from_chroma(vs, path: str | Path | None = None) -> int:
+    index = FlatIndex.build(iter_chroma_rows(vs))
+    index.save(path or flat_index_dir())
+    return len(index)
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+import uuid
+
+from src.config.settings import settings
+from src.runtime.resources import registry
+from src.runtime.stats import stats
+
+
+# CHROMA_PERSIST_DIR/
+#   CURRENT              name of the published version, swapped atomically
+#   versions/<version>/  chroma files, manifest.json, texts/, lexical/, flat/
+# A tree without CURRENT is a pre-versioning index and is served from the root itself.
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+LEGACY_VERSION_FILE = "INDEX_VERSION"
+# Resources that read files of one version; reloaded together when CURRENT changes.
+INDEX_RESOURCES = ("chroma", "vectorstore", "lexical_index", "text_store")
+
+logger = logging.getLogger(__name__)
+
+_cached: tuple[Path, int, str] | None = None
+
+
+def index_root() -> Path:
+    return Path(settings.chroma_persist_dir)
+
+
+def _pointer() -> Path:
+    root = index_root()
+    current = root / CURRENT_FILE
+    return current if current.exists() else root / LEGACY_VERSION_FILE
+
+
+def current_index_version() -> str:
+    global _cached
+    path = _pointer()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return ""
+    if _cached is None or _cached[:2] != (path, mtime):
+        _cached = (path, mtime, path.read_text(encoding="utf-8").strip())
+    return _cached[2]
+
+
+def version_dir(version: str) -> Path:
+    return index_root() / VERSIONS_DIR / version
+
+
+def index_dir(version: str | None = None) -> Path:
+    root = index_root()
+    if not (root / CURRENT_FILE).exists():
+        return root
+    return version_dir(current_index_version() if version is None else version)
+
+
+def create_index_version(base: str | None = None) -> tuple[str, Path]:
+    # Names sort by creation time, which garbage collection relies on.
+    version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S.%f}-{uuid.uuid4().hex[:8]}"
+    target = version_dir(version)
+    source = index_dir(base) if base is not None else None
+    if source is not None and source.exists():
+        # Copy, not hardlink: Chroma and the text store update their files in place.
+        ignore = shutil.ignore_patterns(VERSIONS_DIR, CURRENT_FILE, LEGACY_VERSION_FILE, "*.tmp")
+        shutil.copytree(source, target, ignore=ignore)
+    else:
+        target.mkdir(parents=True)
+    return version, target
+
+
+def publish_index_version(version: str) -> None:
+    path = index_root() / CURRENT_FILE
+    tmp = path.with_name(CURRENT_FILE + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def discard_index_version(version: str) -> None:
+    shutil.rmtree(version_dir(version), ignore_errors=True)
+
+
+def gc_index_versions(keep: int | None = None) -> list[str]:
+    # Keep the current version and the newest `keep - 1` before it; versions newer than the
+    # current one may be builds in progress and are left alone.
+    keep = settings.index_keep_versions if keep is None else keep
+    current = current_index_version()
+    versions_dir = index_root() / VERSIONS_DIR
+    if not current or not versions_dir.exists():
+        return []
+    older = sorted(p.name for p in versions_dir.iterdir() if p.is_dir() and p.name < current)
+    removed = older[: max(0, len(older) - max(0, keep - 1))]
+    for version in removed:
+        discard_index_version(version)
+    return removed
+
+
+class IndexWatcher:
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.version = current_index_version()
+        # Version being loaded during a swap; factories read it, requests keep reporting `version`.
+        self.loading: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def refresh(self) -> bool:
+        with self._lock:
+            version = current_index_version()
+            if version == self.version:
+                return False
+            names = registry.loaded(INDEX_RESOURCES)
+            self.loading = version
+            try:
+                # Replacements load from the new version; the old instances stay usable for
+                # in-flight requests for a grace period.
+                status = registry.reload(names, close_after=settings.index_swap_grace_seconds)
+            finally:
+                self.loading = None
+            failed = [name for name in INDEX_RESOURCES if status.get(name, {}).get("error")]
+            if failed:
+                # Keep the old version so the next poll retries the swap.
+                stats.incr("index_swap_errors")
+                raise RuntimeError(f"reloading {failed} for index version {version} failed")
+            logger.info("index version %s -> %s, reloaded %s", self.version, version, names)
+            self.version = version
+            stats.incr("index_swaps")
+            return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("index refresh failed")
+
+
+registry.register(
+    "index_watcher",
+    lambda: IndexWatcher(settings.index_poll_seconds),
+    warmup=lambda watcher: watcher.start(),
+    close=lambda watcher: watcher.close(),
+    stateful=True,
+)
+
+
+def get_index_watcher() -> IndexWatcher:
+    return registry.get("index_watcher")
+
+
+def serving_index_version() -> str:
+    # The version this process's index resources were loaded from.
+    return get_index_watcher().version
+
+
+def serving_index_dir() -> Path:
+    watcher = get_index_watcher()
+    path = index_dir(watcher.loading or watcher.version)
+    return path if path.exists() else index_dir()
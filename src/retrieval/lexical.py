@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from collections import Counter
+import math
+from pathlib import Path
+import re
+from typing import Iterable
+
+import numpy as np
+import orjson
+
+from src.retrieval.index_version import serving_index_dir
+from src.runtime.resources import registry
+
+
+_RUN_RE = re.compile(r"[\u3400-\u9fff0-9]+|[a-z]+")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens: list[str] = []
+    for run in _RUN_RE.findall(text.lower()):
+        if run.isascii() and run.isalpha():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(
+        self,
+        vocab: dict[str, int],
+        chunk_ids: list[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+        max_df_ratio: float = 0.5,
+        max_df_min_docs: int = 1000,
+    ) -> None:
+        self.vocab = vocab
+        self.chunk_ids = chunk_ids
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(chunk_ids)
+        self.avgdl = float(doc_len.mean()) if self.n_docs else 0.0
+        # On a small corpus a term in half the chunks can still be the only one that matches.
+        if self.n_docs >= max_df_min_docs:
+            self.max_df = max(1, int(self.n_docs * max_df_ratio))
+        else:
+            self.max_df = self.n_docs
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    @classmethod
+    def empty(cls) -> "LexicalIndex":
+        return cls(
+            {},
+            [],
+            np.zeros(1, dtype=np.int64),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.uint16),
+            np.zeros(0, dtype=np.int32),
+        )
+
+    @classmethod
+    def build(cls, chunks: Iterable[tuple[str, str]]) -> "LexicalIndex":
+        postings: dict[str, list[tuple[int, int]]] = {}
+        chunk_ids: list[str] = []
+        doc_len: list[int] = []
+        for doc, (chunk_id, text) in enumerate(chunks):
+            counts = Counter(tokenize(text))
+            chunk_ids.append(chunk_id)
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        terms = sorted(postings)
+        vocab = {term: i for i, term in enumerate(terms)}
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        doc_ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+        for i, term in enumerate(terms):
+            block = np.asarray(postings[term], dtype=np.int64)
+            doc_ids[offsets[i] : offsets[i + 1]] = block[:, 0]
+            tfs[offsets[i] : offsets[i + 1]] = np.minimum(block[:, 1], np.iinfo(np.uint16).max)
+        return cls(vocab, chunk_ids, offsets, doc_ids, tfs, np.asarray(doc_len, dtype=np.int32))
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "offsets.npy", self.offsets)
+        np.save(path / "doc_ids.npy", self.doc_ids)
+        np.save(path / "tfs.npy", self.tfs)
+        np.save(path / "doc_len.npy", self.doc_len)
+        (path / "vocab.json").write_bytes(orjson.dumps(self.vocab))
+        (path / "chunk_ids.json").write_bytes(orjson.dumps(self.chunk_ids))
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LexicalIndex":
+        path = Path(path)
+        if not (path / "vocab.json").exists():
+            return cls.empty()
+        return cls(
+            orjson.loads((path / "vocab.json").read_bytes()),
+            orjson.loads((path / "chunk_ids.json").read_bytes()),
+            np.load(path / "offsets.npy", mmap_mode="r"),
+            np.load(path / "doc_ids.npy", mmap_mode="r"),
+            np.load(path / "tfs.npy", mmap_mode="r"),
+            np.load(path / "doc_len.npy"),
+        )
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        ids_parts: list[np.ndarray] = []
+        score_parts: list[np.ndarray] = []
+        for tid in term_ids:
+            lo, hi = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            df = hi - lo
+            # Terms present in most chunks carry no signal and dominate the cost.
+            if df > self.max_df:
+                continue
+            docs = np.asarray(self.doc_ids[lo:hi])
+            tf = np.asarray(self.tfs[lo:hi], dtype=np.float32)
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+            ids_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1) / norm)
+        if not ids_parts:
+            return []
+
+        n_postings = sum(len(x) for x in ids_parts)
+        if n_postings * 8 > self.n_docs:
+            # Long posting lists: scatter into a dense accumulator (docs are unique per term).
+            dense = np.zeros(self.n_docs, dtype=np.float32)
+            for docs, scores in zip(ids_parts, score_parts):
+                dense[docs] += scores
+            uniq = np.arange(self.n_docs)
+            totals = dense
+        else:
+            uniq, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate(score_parts))
+        if len(totals) > k:
+            top = np.argpartition(-totals, k)[:k]
+        else:
+            top = np.arange(len(totals))
+        top = top[np.argsort(-totals[top], kind="stable")]
+        top = top[totals[top] > 0]
+        return [(self.chunk_ids[int(uniq[i])], float(totals[i])) for i in top]
+
+
+def lexical_index_dir(base: Path | None = None) -> Path:
+    return (base or serving_index_dir()) / "lexical"
+
+
+registry.register("lexical_index", lambda: LexicalIndex.load(lexical_index_dir()))
+
+
+def get_lexical_index() -> LexicalIndex:
+    return registry.get("lexical_index")
@@ -15,6 +15,8 @@ class RetrievedItem:
     content: str
     distance: float
     hit_keyword: bool = False
+    # RRF-fused distance (see _fuse_candidates) rather than a raw vector distance; the two do not compare.
+    fused: bool = False
 
 
 def apply_keyword_bonus(items: list[RetrievedItem], keyword: str) -> list[RetrievedItem]:
@@ -28,3 +30,28 @@ def apply_keyword_bonus(items: list[RetrievedItem], keyword: str) -> list[Retrie
             item.distance -= settings.keyword_bonus
 
     return sorted(items, key=lambda x: x.distance)
+
+
+def candidate_overlap(a: list[RetrievedItem], b: list[RetrievedItem]) -> float:
+    ids_a = {x.chunk_id for x in a}
+    ids_b = {x.chunk_id for x in b}
+    if not ids_a or not ids_b:
+        return 0.0
+    return len(ids_a & ids_b) / min(len(ids_a), len(ids_b))
+
+
+def merge_candidates(a: list[RetrievedItem], b: list[RetrievedItem]) -> list[RetrievedItem]:
+    merged: dict[str, RetrievedItem] = {}
+    for item in [*a, *b]:
+        prev = merged.get(item.chunk_id)
+        if prev is None or item.distance < prev.distance:
+            merged[item.chunk_id] = item
+    return sorted(merged.values(), key=lambda x: x.distance)
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
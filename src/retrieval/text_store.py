@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+from pathlib import Path
+import re
+import threading
+
+from src.retrieval.index_version import serving_index_dir
+from src.runtime.resources import registry
+
+
+# Fixed-width encoding: character offsets map directly to byte offsets.
+_ENCODING = "utf-32-le"
+_WIDTH = 4
+
+
+def normalize_text(text: str) -> str:
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\u3000", " ")
+    lines = [" ".join(line.split()) for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def _squash(text: str) -> str:
+    return "".join(text.split())
+
+
+class TextStore:
+    def __init__(self, root: str | Path, max_open: int = 256) -> None:
+        self.root = Path(root)
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._maps: OrderedDict[str, mmap.mmap] = OrderedDict()
+
+    def path_for(self, source: str) -> Path:
+        return self.root / f"{hashlib.sha1(source.encode('utf-8')).hexdigest()}.u32"
+
+    def write(self, source: str, text: str) -> None:
+        path = self.path_for(source)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_bytes(text.encode(_ENCODING))
+        os.replace(tmp, path)
+
+    def remove(self, source: str) -> None:
+        self.path_for(source).unlink(missing_ok=True)
+
+    def length(self, source: str) -> int | None:
+        with self._lock:
+            mm = self._open(source)
+            return None if mm is None else len(mm) // _WIDTH
+
+    def slice(self, source: str, start: int, end: int) -> str | None:
+        # Bytes are copied out under the lock: another thread's open may evict and close this map.
+        with self._lock:
+            mm = self._open(source)
+            if mm is None:
+                return None
+            size = len(mm) // _WIDTH
+            start, end = max(0, start), min(size, end)
+            if start >= end:
+                return ""
+            data = mm[start * _WIDTH : end * _WIDTH]
+        return data.decode(_ENCODING)
+
+    def expand(self, source: str, start: int, end: int, chars: int) -> str | None:
+        return self.slice(source, start - chars, end + chars)
+
+    def contains(self, source: str, start: int, end: int, quote: str) -> bool | None:
+        span = self.slice(source, start, end)
+        if span is None:
+            return None
+        return _squash(quote) in _squash(span)
+
+    def close(self) -> None:
+        with self._lock:
+            for mm in self._maps.values():
+                mm.close()
+            self._maps.clear()
+
+    def _open(self, source: str) -> mmap.mmap | None:
+        # Caller holds self._lock; the map is only valid until it is released.
+        mm = self._maps.get(source)
+        if mm is not None:
+            self._maps.move_to_end(source)
+            return mm
+        path = self.path_for(source)
+        if not path.exists() or path.stat().st_size == 0:
+            return None
+        with path.open("rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[source] = mm
+        while len(self._maps) > self.max_open:
+            self._maps.popitem(last=False)[1].close()
+        return mm
+
+
+def text_store_dir(base: Path | None = None) -> Path:
+    return (base or serving_index_dir()) / "texts"
+
+
+registry.register(
+    "text_store",
+    lambda: TextStore(text_store_dir()),
+    close=lambda store: store.close(),
+)
+
+
+def get_text_store() -> TextStore:
+    return registry.get("text_store")
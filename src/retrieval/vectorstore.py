@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import Protocol, Sequence
+
+from src.config.settings import settings
+from src.retrieval.chroma_store import get_chroma
+from src.retrieval.flat_index import FlatIndex, flat_index_dir
+from src.retrieval.rerank import RetrievedItem
+from src.runtime.resources import registry
+
+
+def to_item(metadata: dict | None, content: str, distance: float) -> RetrievedItem:
+    metadata = metadata or {}
+    return RetrievedItem(
+        doc_id=str(metadata.get("doc_id", "unknown_doc")),
+        chunk_id=str(metadata.get("chunk_id", "unknown_chunk")),
+        source=str(metadata.get("source", "unknown_source")),
+        start_offset=int(metadata.get("start_offset", 0)),
+        end_offset=int(metadata.get("end_offset", 0)),
+        content=content,
+        distance=distance,
+    )
+
+
+class VectorStore(Protocol):
+    # Distances are squared L2 between unit vectors (lower is better), one list per query vector.
+    def search(self, vectors: Sequence[Sequence[float]], k: int) -> list[list[RetrievedItem]]: ...
+
+    def fetch(self, chunk_ids: list[str]) -> list[RetrievedItem]: ...
+
+
+class ChromaVectorStore:
+    def __init__(self, chroma) -> None:
+        self.chroma = chroma
+
+    def search(self, vectors: Sequence[Sequence[float]], k: int) -> list[list[RetrievedItem]]:
+        res = self.chroma._collection.query(
+            query_embeddings=[list(v) for v in vectors],
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            [to_item(m, doc, float(d)) for m, doc, d in zip(metadatas, documents, distances)]
+            for metadatas, documents, distances in zip(res["metadatas"], res["documents"], res["distances"])
+        ]
+
+    def fetch(self, chunk_ids: list[str]) -> list[RetrievedItem]:
+        res = self.chroma.get(where={"chunk_id": {"$in": chunk_ids}})
+        return [to_item(m, doc, 0.0) for m, doc in zip(res["metadatas"], res["documents"])]
+
+
+class FlatVectorStore:
+    def __init__(self, index: FlatIndex) -> None:
+        self.index = index
+
+    def _item(self, row: int, distance: float) -> RetrievedItem:
+        chunk = self.index.chunks[row]
+        return to_item(chunk["metadata"], chunk["content"], distance)
+
+    def search(self, vectors: Sequence[Sequence[float]], k: int) -> list[list[RetrievedItem]]:
+        return [[self._item(row, d) for row, d in hits] for hits in self.index.search(vectors, k)]
+
+    def fetch(self, chunk_ids: list[str]) -> list[RetrievedItem]:
+        return [self._item(row, 0.0) for row in self.index.fetch(chunk_ids)]
+
+
+def _load_vectorstore() -> VectorStore:
+    if settings.vector_backend == "flat":
+        return FlatVectorStore(
+            FlatIndex.load(flat_index_dir(), settings.flat_index_int8, settings.flat_index_rescore_factor)
+        )
+    return ChromaVectorStore(get_chroma())
+
+
+registry.register(
+    "vectorstore",
+    _load_vectorstore,
+    depends_on=("chroma",) if settings.vector_backend == "chroma" else (),
+)
+
+
+def get_vectorstore() -> VectorStore:
+    return registry.get("vectorstore")
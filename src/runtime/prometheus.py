@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from collections import defaultdict
+import re
+
+from src.runtime.stats import Histogram, LabelSet, Stats, stats
+
+
+PREFIX = "rag_"
+_INVALID = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _metric(name: str) -> str:
+    return PREFIX + _INVALID.sub("_", name)
+
+
+def _value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: LabelSet) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _histogram_lines(metric: str, labels: LabelSet, hist: Histogram) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*hist.buckets, float("inf")), hist.counts):
+        cumulative += count
+        lines.append(f"{metric}_bucket{_labels((*labels, ('le', _value(bound))))} {cumulative}")
+    lines.append(f"{metric}_sum{_labels(labels)} {_value(hist.sum)}")
+    lines.append(f"{metric}_count{_labels(labels)} {hist.count}")
+    return lines
+
+
+def render_prometheus(source: Stats = stats) -> str:
+    lines: list[str] = []
+    for name, value in sorted(source.snapshot().items()):
+        metric = _metric(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {_value(value)}")
+
+    families: dict[str, list[tuple[LabelSet, Histogram]]] = defaultdict(list)
+    for (name, labels), hist in source.histograms().items():
+        families[name].append((labels, hist))
+    for name in sorted(families):
+        metric = _metric(name)
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, hist in sorted(families[name], key=lambda x: x[0]):
+            lines.extend(_histogram_lines(metric, labels, hist))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Resource:
+    factory: Callable[[], Any]
+    warmup: Callable[[Any], None] | None = None
+    close: Callable[[Any], None] | None = None
+    depends_on: tuple[str, ...] = ()
+    # Holds state that a rebuild would lose (caches, sessions, sinks); only reloaded when named.
+    stateful: bool = False
+    # Only built on first use: skipped by warmup, readiness and default reloads until then.
+    lazy: bool = False
+    instance: Any = None
+    load_seconds: float | None = None
+    loaded_at: float | None = None
+    error: str | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ResourceRegistry:
+    def __init__(self) -> None:
+        self._resources: dict[str, _Resource] = {}
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        warmup: Callable[[Any], None] | None = None,
+        depends_on: Iterable[str] = (),
+        close: Callable[[Any], None] | None = None,
+        stateful: bool = False,
+        lazy: bool = False,
+    ) -> None:
+        self._resources.setdefault(
+            name,
+            _Resource(
+                factory=factory,
+                warmup=warmup,
+                close=close,
+                depends_on=tuple(depends_on),
+                stateful=stateful,
+                lazy=lazy,
+            ),
+        )
+
+    def names(self, include_stateful: bool = True, include_lazy: bool = True) -> list[str]:
+        return [
+            name
+            for name, res in self._resources.items()
+            if (include_stateful or not res.stateful) and (include_lazy or not res.lazy or res.instance is not None)
+        ]
+
+    def get(self, name: str) -> Any:
+        res = self._resources[name]
+        instance = res.instance
+        if instance is not None:
+            return instance
+        with res.lock:
+            if res.instance is None:
+                res.instance = self._build(name, res)
+            return res.instance
+
+    def warmup(self, names: Iterable[str] | None = None) -> dict[str, dict]:
+        for name in names or self.names(include_lazy=False):
+            try:
+                self.get(name)
+            except Exception:
+                logger.exception("warmup failed for resource %s", name)
+        return self.status()
+
+    def reload(self, names: Iterable[str] | None = None, close_after: float = 0.0) -> dict[str, dict]:
+        pending = list(names) if names is not None else self.names(include_stateful=False, include_lazy=False)
+        for name in self._with_dependents(pending):
+            res = self._resources[name]
+            with res.lock:
+                old = res.instance
+                try:
+                    # Build the replacement first so in-flight callers keep the old instance.
+                    res.instance = self._build(name, res)
+                except Exception:
+                    logger.exception("reload failed for resource %s", name)
+                    continue
+            if old is not None and res.close is not None:
+                if close_after > 0:
+                    # Requests that fetched the old instance just before the swap may still be using it.
+                    timer = threading.Timer(close_after, res.close, args=(old,))
+                    timer.daemon = True
+                    timer.start()
+                else:
+                    res.close(old)
+        return self.status()
+
+    def loaded(self, names: Iterable[str]) -> list[str]:
+        return [name for name in names if name in self._resources and self._resources[name].instance is not None]
+
+    def is_ready(self) -> bool:
+        return all(res.instance is not None for res in self._resources.values() if not res.lazy)
+
+    def status(self) -> dict[str, dict]:
+        return {
+            name: {
+                "ready": res.instance is not None,
+                "lazy": res.lazy,
+                "load_seconds": res.load_seconds,
+                "loaded_at": res.loaded_at,
+                "error": res.error,
+            }
+            for name, res in self._resources.items()
+        }
+
+    def _build(self, name: str, res: _Resource) -> Any:
+        start = time.perf_counter()
+        try:
+            instance = res.factory()
+            if res.warmup is not None:
+                res.warmup(instance)
+        except Exception as exc:
+            res.error = repr(exc)
+            raise
+        res.load_seconds = time.perf_counter() - start
+        res.loaded_at = time.time()
+        res.error = None
+        logger.info("resource %s loaded in %.2fs", name, res.load_seconds)
+        return instance
+
+    def _with_dependents(self, names: list[str]) -> list[str]:
+        ordered: list[str] = []
+        for name in self._resources:
+            res = self._resources[name]
+            if name in names or (
+                not res.stateful and any(dep in ordered for dep in res.depends_on)
+            ):
+                ordered.append(name)
+        return ordered
+
+
+registry = ResourceRegistry()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from typing import Iterator
+
+from src.runtime.stats import stats
+
+
+# Spans of the request being served; LangGraph and asyncio.to_thread copy the
+# context into worker threads and tasks, so they all append to the same list.
+_current: ContextVar[list[dict] | None] = ContextVar("request_spans", default=None)
+
+
+@contextmanager
+def collect_spans() -> Iterator[list[dict]]:
+    spans: list[dict] = []
+    token = _current.set(spans)
+    try:
+        yield spans
+    finally:
+        _current.reset(token)
+
+
+def record_span(kind: str, name: str, seconds: float, **fields) -> None:
+    stats.observe(f"{kind}_seconds", seconds, {"name": name})
+    spans = _current.get()
+    if spans is not None:
+        spans.append({"kind": kind, "name": name, "ms": round(seconds * 1000, 2), **fields})
+
+
+@contextmanager
+def span(kind: str, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(kind, name, time.perf_counter() - start)
+
+
+def summarize_spans(spans: list[dict]) -> dict:
+    summary: dict = {
+        "nodes_ms": {},
+        "llm_calls": 0,
+        "llm_cache_hits": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "llm_ms": 0.0,
+        "retrieval_ms": 0.0,
+    }
+    for s in spans:
+        if s["kind"] == "node":
+            summary["nodes_ms"][s["name"]] = round(summary["nodes_ms"].get(s["name"], 0.0) + s["ms"], 2)
+        elif s["kind"] == "llm":
+            summary["llm_calls"] += 1
+            summary["prompt_tokens"] += s.get("prompt_tokens", 0)
+            summary["completion_tokens"] += s.get("completion_tokens", 0)
+            summary["llm_ms"] = round(summary["llm_ms"] + s["ms"], 2)
+        elif s["kind"] == "llm_cache":
+            summary["llm_cache_hits"] += 1
+        elif s["kind"] == "retrieval":
+            summary["retrieval_ms"] = round(summary["retrieval_ms"] + s["ms"], 2)
+    return summary
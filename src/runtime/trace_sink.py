@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import atexit
+from datetime import datetime, timezone
+import gzip
+import logging
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Callable, Iterator
+import zlib
+
+import orjson
+
+from src.config.settings import settings
+from src.runtime.resources import registry
+from src.runtime.stats import stats
+
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx"
+_STOP = object()
+
+
+class TraceSink:
+    def __init__(
+        self,
+        root: str | Path,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_seconds: float = 1.0,
+        segment_max_bytes: int = 64 << 20,
+        segment_max_seconds: float = 3600.0,
+        on_full: str = "drop",
+    ) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.on_full = on_full
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._segment: Path | None = None
+        self._segment_opened = 0.0
+        self._segment_seq = 0
+        self._segment_ids: set[str] = set()
+        self._closed = False
+        self._taps: list[Callable[[dict], None]] = []
+        self._worker = threading.Thread(target=self._run, name="trace-sink", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def emit(self, trace_id: str, event: dict) -> None:
+        record = {"trace_id": trace_id, **event}
+        for tap in self._taps:
+            tap(record)
+        if self._closed:
+            stats.incr("trace_events_dropped")
+            return
+        if self.on_full == "block":
+            # Bounded waits, so a sink closed while the queue is full never blocks the caller forever.
+            while not self._closed:
+                try:
+                    self._queue.put(record, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            stats.incr("trace_events_dropped")
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            stats.incr("trace_events_dropped")
+
+    def add_tap(self, tap: Callable[[dict], None]) -> None:
+        # In-process consumers see every event as it is emitted, without reading segments back.
+        self._taps = [*self._taps, tap]
+
+    def remove_tap(self, tap: Callable[[dict], None]) -> None:
+        self._taps = [x for x in self._taps if x is not tap]
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._worker.join()
+        # Events that raced past the closed check landed behind _STOP and will never be written.
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._queue.task_done()
+            stats.incr("trace_events_dropped")
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_seconds
+            while item is not _STOP and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            records = [x for x in batch if x is not _STOP]
+            try:
+                if records:
+                    self._write(records)
+            except Exception:
+                logger.exception("failed to write %d trace events", len(records))
+                stats.incr("trace_events_dropped", len(records))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if item is _STOP:
+                return
+
+    def _write(self, records: list[dict]) -> None:
+        segment = self._current_segment()
+        payload = b"".join(orjson.dumps(r) + b"\n" for r in records)
+        # Each batch is a complete gzip member, so a crash never corrupts earlier batches.
+        with segment.open("ab") as f:
+            f.write(gzip.compress(payload, compresslevel=zlib.Z_DEFAULT_COMPRESSION))
+        new_ids = {r["trace_id"] for r in records} - self._segment_ids
+        if new_ids:
+            with segment.with_name(segment.name[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX).open("a") as f:
+                f.write("".join(f"{trace_id}\n" for trace_id in sorted(new_ids)))
+            self._segment_ids |= new_ids
+        stats.incr("trace_events_written", len(records))
+        stats.incr("trace_batches_written")
+
+    def _current_segment(self) -> Path:
+        now = time.monotonic()
+        if self._segment is not None:
+            too_big = self._segment.stat().st_size >= self.segment_max_bytes
+            too_old = now - self._segment_opened >= self.segment_max_seconds
+            if not (too_big or too_old):
+                return self._segment
+        self._segment_seq += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._segment = self.root / f"traces-{stamp}-{os.getpid()}-{self._segment_seq:04d}{SEGMENT_SUFFIX}"
+        self._segment_opened = now
+        self._segment_ids = set()
+        return self._segment
+
+
+def _segments_for(root: Path, trace_ids: set[str] | None) -> list[Path]:
+    segments = sorted(root.glob(f"*{SEGMENT_SUFFIX}"))
+    if trace_ids is None:
+        return segments
+    selected: list[Path] = []
+    for segment in segments:
+        index = segment.with_name(segment.name[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+        if not index.exists() or trace_ids & set(index.read_text().split()):
+            selected.append(segment)
+    return selected
+
+
+def _read_segment(segment: Path) -> Iterator[dict]:
+    try:
+        with gzip.open(segment, "rb") as f:
+            for line in f:
+                yield orjson.loads(line)
+    except EOFError:
+        # Segment still being written or truncated by a crash: keep what was readable.
+        return
+
+
+def iter_trace_events(root: str | Path | None = None) -> Iterator[dict]:
+    root = Path(root or settings.trace_dir)
+    for segment in _segments_for(root, None):
+        yield from _read_segment(segment)
+
+
+def load_traces(trace_ids: set[str], root: str | Path | None = None) -> dict[str, list[dict]]:
+    root = Path(root or settings.trace_dir)
+    found: dict[str, list[dict]] = {trace_id: [] for trace_id in trace_ids}
+    for trace_id in trace_ids:
+        # Per-request files written before the sink existed.
+        legacy = root / f"{trace_id}.jsonl"
+        if legacy.exists():
+            found[trace_id].extend(
+                orjson.loads(x) for x in legacy.read_bytes().splitlines() if x.strip()
+            )
+    for segment in _segments_for(root, trace_ids):
+        for event in _read_segment(segment):
+            if event.get("trace_id") in found:
+                found[event["trace_id"]].append(event)
+    return found
+
+
+def read_trace(trace_id: str, root: str | Path | None = None) -> list[dict]:
+    return load_traces({trace_id}, root)[trace_id]
+
+
+registry.register(
+    "trace_sink",
+    lambda: TraceSink(
+        settings.trace_dir,
+        max_queue=settings.trace_queue_size,
+        batch_size=settings.trace_batch_size,
+        flush_seconds=settings.trace_flush_seconds,
+        segment_max_bytes=settings.trace_segment_max_mb << 20,
+        segment_max_seconds=settings.trace_segment_max_seconds,
+        on_full=settings.trace_on_full,
+    ),
+    close=lambda sink: sink.close(),
+    stateful=True,
+)
+
+
+def get_trace_sink() -> TraceSink:
+    return registry.get("trace_sink")
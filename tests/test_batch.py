@@ -0,0 +1,43 @@
+import asyncio
+
+from src.agent import batch
+
+
+def _fake_agent(calls):
+    def run(query, session_id=None, speculative_items=None):
+        calls.append(query)
+        if query == "boom":
+            raise RuntimeError("llm down")
+        return {"answer": query.upper(), "citations": [], "trace_id": query, "attempts": 1, "used_tools": []}
+
+    return run
+
+
+def test_run_agent_batch_dedupes_keeps_order_and_isolates_failures(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batch, "_prefetch", lambda queries: {})
+    monkeypatch.setattr(batch, "run_agent", _fake_agent(calls))
+
+    results = batch.run_agent_batch(["a", "boom", "b", "a "], concurrency=2)
+
+    assert sorted(calls) == ["a", "b", "boom"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert [r["ok"] for r in results] == [True, False, True, True]
+    assert results[3]["answer"] == "A" and results[3]["query"] == "a "
+    assert results[1]["error"] == "RuntimeError: llm down"
+
+
+def test_arun_agent_batch_returns_results_in_input_order(monkeypatch):
+    calls = []
+    run = _fake_agent(calls)
+
+    async def arun(query, session_id=None, speculative_items=None):
+        await asyncio.sleep(0.01 if query == "a" else 0)
+        return run(query)
+
+    monkeypatch.setattr(batch, "_prefetch", lambda queries: {})
+    monkeypatch.setattr(batch, "arun_agent", arun)
+
+    results = asyncio.run(batch.arun_agent_batch(["a", "b", "a"]))
+    assert [r["answer"] for r in results] == ["A", "B", "A"]
+    assert sorted(calls) == ["a", "b"]
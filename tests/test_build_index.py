@@ -0,0 +1,109 @@
+from argparse import Namespace
+
+import pytest
+
+from scripts import build_index
+
+
+class _Embeddings:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+class _Collection:
+    def __init__(self, store):
+        self.store = store
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if any(m["source"] == self.store.fail_source for m in metadatas):
+            raise RuntimeError("disk full")
+        self.store.upserts.append(list(ids))
+        self.store.rows.update(dict(zip(ids, documents)))
+
+
+class _Store:
+    def __init__(self):
+        self.rows = {}
+        self.upserts = []
+        self.fail_source = None
+        self._collection = _Collection(self)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.rows.pop(chunk_id)
+
+
+def _write(raw, name, paragraphs):
+    (raw / name).write_text("\n\n".join(f"第{i}条 {p}" * 40 for i, p in enumerate(paragraphs)), encoding="utf-8")
+
+
+def _ingest(vs, build_dir):
+    args = Namespace(workers=1, batch_size=2, queue_size=8)
+    return build_index.ingest(vs, build_dir, build_index.load_manifest(build_dir), args)
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    raw, build_dir = tmp_path / "raw", tmp_path / "build"
+    raw.mkdir()
+    build_dir.mkdir()
+    monkeypatch.setattr(build_index, "RAW_DIR", raw)
+    monkeypatch.setattr(build_index, "get_embeddings", lambda: _Embeddings())
+    _write(raw, "a.md", ["考试作弊取消成绩。", "旷课三次记过。"])
+    _write(raw, "b.txt", ["请假需要辅导员批准。"])
+    return raw, build_dir
+
+
+def test_chunk_ids_are_deterministic():
+    a = build_index.make_chunk_id("data/raw/a.md", "0", "考试作弊")
+    assert a == build_index.make_chunk_id("data/raw/a.md", "0", "考试作弊")
+    assert a.startswith("a-") and a != build_index.make_chunk_id("data/raw/a.md", "5", "考试作弊")
+
+
+def test_unchanged_files_are_skipped_and_edits_only_touch_their_chunks(tree):
+    raw, build_dir = tree
+    vs = _Store()
+
+    added, removed, skipped = _ingest(vs, build_dir)
+    manifest = build_index.load_manifest(build_dir)
+    assert (removed, skipped) == (0, 0) and added == len(vs.rows) > 2
+    assert {k: v["sha256"] for k, v in manifest.items()} == {
+        str(p): build_index.file_sha256(p) for p in (raw / "a.md", raw / "b.txt")
+    }
+    assert sorted(vs.rows) == sorted(i for v in manifest.values() for i in v["chunk_ids"])
+
+    assert _ingest(vs, build_dir) == (0, 0, 2)
+
+    _write(raw, "a.md", ["考试作弊取消成绩。", "旷课五次记过。"])
+    (raw / "b.txt").unlink()
+    before = set(vs.rows)
+    added, removed, skipped = _ingest(vs, build_dir)
+    manifest = build_index.load_manifest(build_dir)
+    assert list(manifest) == [str(raw / "a.md")] and skipped == 0
+    # The unchanged first paragraph keeps its chunk ids and is not re-embedded.
+    assert 0 < added < len(manifest[str(raw / "a.md")]["chunk_ids"])
+    assert sorted(vs.rows) == sorted(manifest[str(raw / "a.md")]["chunk_ids"])
+    assert removed == len(before - set(vs.rows))
+
+
+def test_interrupted_build_resumes_with_the_unfinished_files(tree, monkeypatch):
+    raw, build_dir = tree
+    vs = _Store()
+    # Files reach the pipeline in completion order; fix it so a.md is stored before b.txt fails.
+    parse_files = build_index.parse_files
+    monkeypatch.setattr(build_index, "parse_files", lambda *args: sorted(parse_files(*args), key=lambda p: p.key))
+    vs.fail_source = str(raw / "b.txt")
+    _write(raw, "a.md", ["考试作弊。"])
+    _write(raw, "b.txt", ["请假需要辅导员批准。", "旷课三次记过。"])
+    with pytest.raises(RuntimeError):
+        build_index.ingest(vs, build_dir, {}, Namespace(workers=1, batch_size=1, queue_size=8))
+
+    finished = build_index.load_manifest(build_dir)
+    assert list(finished) == [str(raw / "a.md")]
+
+    vs.fail_source = None
+    added, removed, skipped = _ingest(vs, build_dir)
+    manifest = build_index.load_manifest(build_dir)
+    assert skipped == 1 and removed == 0 and set(manifest) == {str(raw / "a.md"), str(raw / "b.txt")}
+    assert added == len(manifest[str(raw / "b.txt")]["chunk_ids"])
+    assert sorted(vs.rows) == sorted(i for v in manifest.values() for i in v["chunk_ids"])
@@ -0,0 +1,72 @@
+import json
+import sys
+import threading
+import time
+
+from src.runtime.trace_sink import TraceSink
+from train.sft import build_sft_data
+
+
+def _main(monkeypatch, tmp_path, rows, run_agent):
+    sink = TraceSink(tmp_path / "traces", flush_seconds=0.01)
+    monkeypatch.setattr(build_sft_data, "get_trace_sink", lambda: sink)
+    monkeypatch.setattr(build_sft_data, "run_agent", run_agent(sink))
+    (tmp_path / "in.jsonl").write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+    out = tmp_path / "out.jsonl"
+    argv = ["build_sft_data.py", "--input", str(tmp_path / "in.jsonl"), "--output", str(out), "--concurrency", "2"]
+    monkeypatch.setattr(sys, "argv", argv)
+    build_sft_data.main()
+    sink.close()
+    return [json.loads(x) for x in out.read_text(encoding="utf-8").splitlines()]
+
+
+def _agent(calls, before=None):
+    def factory(sink):
+        def run(query, use_cache=True):
+            calls.append(query)
+            if before is not None:
+                before(query)
+            trace_id = f"t-{query}"
+            sink.emit(trace_id, {"type": "tool_call", "tool": "retrieval_augment", "query": query})
+            sink.emit(trace_id, {"type": "request_summary"})
+            return {"trace_id": trace_id, "answer": query.upper(), "citations": [], "used_tools": ["retrieval_augment"]}
+
+        return run
+
+    return factory
+
+
+def test_samples_inline_their_trajectory_and_skip_finished_rows(monkeypatch, tmp_path):
+    rows = [{"id": "a", "query": "a"}, {"id": "b", "query": "b"}]
+    (tmp_path / "out.jsonl").write_text(json.dumps({"id": "a"}) + "\n" + '{"id": "b", "que', encoding="utf-8")
+    calls = []
+
+    samples = _main(monkeypatch, tmp_path, rows, _agent(calls))
+
+    assert calls == ["b"]
+    assert [s["id"] for s in samples] == ["a", "b"]
+    sample = samples[1]
+    assert sample["trajectory_ref"] == "t-b" and sample["answer"] == "B"
+    assert sample["trajectory"] == [
+        {"type": "tool_call", "tool": "retrieval_augment", "query": "b"},
+        {"type": "request_summary"},
+    ]
+
+
+def test_samples_are_appended_as_runs_finish(monkeypatch, tmp_path):
+    out = tmp_path / "out.jsonl"
+    fast_written = threading.Event()
+
+    def before(query):
+        if query == "slow":
+            # Held until the fast sample is on disk; a windowed writer would never get there.
+            for _ in range(200):
+                if out.exists() and '"fast"' in out.read_text(encoding="utf-8"):
+                    fast_written.set()
+                    return
+                time.sleep(0.01)
+
+    samples = _main(monkeypatch, tmp_path, [{"query": "slow"}, {"query": "fast"}], _agent([], before))
+
+    assert fast_written.is_set()
+    assert [s["query"] for s in samples] == ["fast", "slow"]
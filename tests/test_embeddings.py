@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+
+from src.retrieval.embeddings import BatchingEmbedder
+
+
+class _CountingEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_batching_embedder_coalesces_concurrent_queries():
+    base = _CountingEmbeddings()
+    embedder = BatchingEmbedder(base, max_batch=64, max_wait_ms=50)
+    queries = [f"问题{i}" * (i % 3 + 1) for i in range(16)]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        vectors = list(pool.map(embedder.embed_query, queries))
+
+    assert vectors == [[float(len(q)), 1.0] for q in queries]
+    assert len(base.batches) < len(queries)
+    embedder.close()
+
+
+def test_batching_embedder_serves_repeats_from_cache():
+    base = _CountingEmbeddings()
+    embedder = BatchingEmbedder(base, max_wait_ms=1, cache_size=2)
+
+    embedder.embed_query("考试 作弊")
+    embedder.embed_query("考试  作弊 ")
+    assert len(base.batches) == 1
+
+    embedder.embed_query("b")
+    embedder.embed_query("c")
+    embedder.embed_query("考试 作弊")
+    assert len(base.batches) == 4
+    embedder.close()
+
+
+class _GatedEmbeddings(_CountingEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def embed_documents(self, texts):
+        self.gate.wait()
+        return super().embed_documents(texts)
+
+
+def test_closed_embedder_resolves_in_flight_and_later_requests():
+    base = _GatedEmbeddings()
+    embedder = BatchingEmbedder(base, max_batch=1, max_wait_ms=0, timeout=3)
+    in_flight = [embedder.submit("a"), embedder.submit("b")]
+    embedder.close()
+    base.gate.set()
+
+    assert [f.result(timeout=3) for f in in_flight] == [[1.0, 1.0], [1.0, 1.0]]
+    # Reloads close the instance while requests still hold it; those are encoded inline.
+    assert embedder.submit("cc").result(timeout=3) == [2.0, 1.0]
+    assert embedder.embed_query("ddd") == [3.0, 1.0]
+
+
+def test_embed_query_wait_is_bounded():
+    embedder = BatchingEmbedder(_GatedEmbeddings(), max_wait_ms=0, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        embedder.embed_query("a")
+    embedder.base.gate.set()
+    embedder.close()
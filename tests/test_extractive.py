@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.agent import tools
+from src.agent.tools import RetrieveItemOutput, extract_related_sentences
+
+
+def _chars(text):
+    # Bag-of-characters vectors: sentences sharing characters with the query score high.
+    out = np.zeros(1 << 16)
+    for c in text:
+        out[ord(c) & 0xFFFF] += 1
+    return out.tolist()
+
+
+class _CharEmbeddings:
+    def embed_documents(self, texts):
+        return [_chars(t) for t in texts]
+
+
+def _item(chunk_id, content):
+    return RetrieveItemOutput(
+        doc_id="d", chunk_id=chunk_id, source="s.txt", start_offset=0,
+        end_offset=len(content), content=content, distance=0.1, hit_keyword=False,
+    )
+
+
+def test_extractive_selection_keeps_verbatim_runs_under_budget(monkeypatch):
+    queries = []
+    monkeypatch.setattr(tools, "get_embeddings", lambda: _CharEmbeddings())
+    monkeypatch.setattr(tools, "embed_query", lambda text: queries.append(text) or _chars(text))
+    items = [
+        _item("c1", "宿舍禁止使用大功率电器。考试作弊者取消成绩。考试作弊情节严重者开除学籍。"),
+        _item("c2", "奖学金每学年评审一次。图书馆周末开放。"),
+    ]
+
+    res = extract_related_sentences("考试作弊怎么处理", "作弊", items)
+
+    assert [e.chunk_id for e in res.evidence] == ["c1"]
+    excerpt = res.evidence[0].excerpt
+    assert excerpt == "考试作弊者取消成绩。考试作弊情节严重者开除学籍。"
+    assert excerpt in items[0].content
+    assert sum(len(e.excerpt) for e in res.evidence) <= tools.settings.extractive_budget_chars
+    # Only the query goes through the cached query embedder; sentences bypass it.
+    assert queries == ["考试作弊怎么处理"]
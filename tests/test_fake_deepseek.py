@@ -0,0 +1,44 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from src.agent.graph import AgentAnswerOutput, ClassifyOutput
+from src.bench.fake_deepseek import create_app
+
+
+EVIDENCE = [
+    {"doc_id": "d1", "chunk_id": "c1", "source": "s.txt", "excerpt": "考试作弊者给予记过处分。情节严重者开除学籍。"}
+]
+
+
+def _tool(schema) -> dict:
+    return {
+        "type": "function",
+        "function": {"name": schema.__name__, "parameters": schema.model_json_schema()},
+    }
+
+
+def _complete(client: TestClient, messages: list[dict], schema) -> dict:
+    resp = client.post(
+        "/chat/completions",
+        json={"model": "deepseek-chat", "messages": messages, "tools": [_tool(schema)]},
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["usage"]["prompt_tokens"] > 0
+    call = body["choices"][0]["message"]["tool_calls"][0]["function"]
+    return json.loads(call["arguments"])
+
+
+def test_structured_outputs_are_schema_valid_and_grounded():
+    client = TestClient(create_app(latency_ms=0, tokens_per_second=0))
+    payload = json.dumps({"query": "考试作弊怎么处理", "evidence": EVIDENCE}, ensure_ascii=False)
+    answer = AgentAnswerOutput.model_validate(
+        _complete(client, [{"role": "user", "content": payload}], AgentAnswerOutput)
+    )
+    assert answer.is_answerable
+    assert answer.citations[0].chunk_id == "c1"
+    assert answer.citations[0].quote in EVIDENCE[0]["excerpt"]
+
+    chitchat = _complete(client, [{"role": "user", "content": "问题：你好"}], ClassifyOutput)
+    assert ClassifyOutput.model_validate(chitchat).is_policy_related is False
@@ -0,0 +1,46 @@
+import numpy as np
+
+from src.retrieval.flat_index import FlatIndex
+from src.retrieval.vectorstore import FlatVectorStore
+
+
+def _rows(n=300, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    for i, v in enumerate(vectors):
+        meta = {"doc_id": f"d{i // 10}", "chunk_id": f"c{i}", "source": "s.txt", "start_offset": i, "end_offset": i + 1}
+        yield meta, f"text {i}", v.tolist()
+
+
+def test_flat_search_matches_brute_force_and_survives_reload(tmp_path):
+    FlatIndex.build(_rows()).save(tmp_path)
+    index = FlatIndex.load(tmp_path)
+    queries = np.random.default_rng(1).normal(size=(5, 32)).astype(np.float32)
+
+    unit = np.asarray(index.vectors)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    expected = np.argsort(-(unit @ q.T), axis=0)[:10].T
+
+    hits = index.search(queries, 10)
+    assert [[row for row, _ in h] for h in hits] == expected.tolist()
+    row, distance = hits[0][0]
+    assert np.isclose(distance, 2 - 2 * float(unit[row] @ q[0]), atol=1e-5)
+
+
+def test_int8_rescoring_keeps_recall_and_store_returns_items(tmp_path):
+    FlatIndex.build(_rows()).save(tmp_path)
+    exact = FlatIndex.load(tmp_path)
+    quantized = FlatIndex.load(tmp_path, int8=True, rescore_factor=4)
+    queries = np.random.default_rng(2).normal(size=(20, 32)).astype(np.float32)
+
+    recall = [
+        len({r for r, _ in a} & {r for r, _ in b}) / 10
+        for a, b in zip(exact.search(queries, 10), quantized.search(queries, 10))
+    ]
+    assert np.mean(recall) >= 0.95
+
+    store = FlatVectorStore(quantized)
+    items = store.search(queries[:1].tolist(), 3)[0]
+    assert len(items) == 3 and items[0].distance <= items[1].distance
+    assert [x.chunk_id for x in store.fetch(["c7", "missing", "c3"])] == ["c7", "c3"]
+    assert store.fetch(["c7"])[0].content == "text 7"
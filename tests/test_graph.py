@@ -0,0 +1,278 @@
+import asyncio
+from dataclasses import replace
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+import orjson
+import pytest
+
+from src.agent import graph
+from src.agent.prompts import FALLBACK_ANSWER, INSUFFICIENT_EVIDENCE
+from src.agent.tools import ExpandKeywordOutput
+from src.config.settings import settings
+from src.retrieval.rerank import RetrievedItem
+
+
+def _chunk(chunk_id, distance=0.1):
+    return RetrievedItem("d1", chunk_id, "手册.md", 0, 10, f"第{chunk_id}条 考试作弊取消成绩。", distance)
+
+
+class _Stubs:
+    # Everything the graph calls out to (LLM, search, trace sink) replaced by scripted answers.
+    def __init__(self, monkeypatch, **overrides):
+        self.policy = True
+        self.proba = None
+        self.rewrites = ["考试作弊处理"]
+        self.results = {}
+        self.answers = []
+        self.searches = []
+        self.calls = []
+        self.events = []
+        monkeypatch.setattr(
+            graph,
+            "settings",
+            replace(
+                settings,
+                **{
+                    "speculative_retrieval": False,
+                    "fast_classifier_enabled": False,
+                    "semantic_cache_enabled": False,
+                    "session_backend": "off",
+                    "selective_read_char_threshold": 100000,
+                    "context_expand_chars": 0,
+                    "max_attempts": 2,
+                    **overrides,
+                },
+            ),
+        )
+        monkeypatch.setattr(graph, "ainvoke_structured", self.structured)
+        monkeypatch.setattr(graph, "aexpand_and_keyword", self.expand)
+        monkeypatch.setattr(graph, "asearch_candidates", self.search)
+        monkeypatch.setattr(graph, "invoke_structured", lambda *args: asyncio.run(self.structured(*args)))
+        monkeypatch.setattr(graph, "expand_and_keyword", lambda *args: asyncio.run(self.expand(*args)))
+        monkeypatch.setattr(graph, "search_candidates", lambda *args: asyncio.run(self.search(*args)))
+        monkeypatch.setattr(graph, "get_chat_model", self.chat_model)
+        monkeypatch.setattr(graph, "_append_trace", lambda trace_id, event: self.events.append(event))
+        monkeypatch.setattr(graph, "serving_index_version", lambda: "v1")
+        monkeypatch.setattr(graph, "get_query_classifier", lambda: self)
+        monkeypatch.setattr(graph, "embed_query", lambda text: [1.0])
+        graph.get_graph.cache_clear()
+
+    async def structured(self, messages, schema):
+        self.calls.append(schema.__name__)
+        if schema is graph.ClassifyOutput:
+            return graph.ClassifyOutput(is_policy_related=self.policy)
+        text = self.answers.pop(0)
+        return graph.AgentAnswerOutput(answer=text, citations=[], is_answerable=text != INSUFFICIENT_EVIDENCE)
+
+    async def expand(self, query, tried=None, history=None):
+        self.calls.append("rewrite")
+        return ExpandKeywordOutput(expand_query=self.rewrites[min(len(tried or []), len(self.rewrites) - 1)], keyword="")
+
+    async def search(self, query, k=None):
+        self.searches.append((query, k))
+        return [replace(x) for x in self.results.get(query, [])]
+
+    @property
+    def ready(self):
+        return self.proba is not None
+
+    def predict_proba(self, vectors):
+        return [self.proba]
+
+    def chat_model(self):
+        return GenericFakeChatModel(messages=iter([AIMessage(content=self.answers.pop(0))]))
+
+
+@pytest.fixture(autouse=True)
+def _fresh_graph():
+    # The compiled graph is cached and its wiring depends on the patched settings.
+    yield
+    graph.get_graph.cache_clear()
+
+
+def _run(query):
+    return asyncio.run(graph.arun_agent(query))
+
+
+def _stream(query):
+    async def collect():
+        return [event async for event in graph.astream_agent(query)]
+
+    return asyncio.run(collect())
+
+
+def test_stream_strips_marks_and_answers_without_citations(monkeypatch):
+    stubs = _Stubs(monkeypatch)
+    stubs.results = {"考试作弊处理": [_chunk("c1")]}
+    stubs.answers = ["作弊者 取消[d1:c1] 成绩。 [注] 无需 引用"]
+
+    events = _stream("考试作弊怎么处理？")
+
+    names = [e["event"] for e in events]
+    # classify and rewrite run in the same superstep, in either order.
+    assert sorted(names[:2]) == ["classified", "rewritten"] and names[2:4] == ["retrieved", "evidence"]
+    assert names[-1] == "final" and "reset" not in names and "retry" not in names
+    text = "".join(e["text"] for e in events if e["event"] == "token")
+    assert text == "作弊者 取消 成绩。 [注] 无需 引用"
+    final = events[-1]
+    assert final["answer"] == text and final["attempts"] == 1
+    assert [c["chunk_id"] for c in final["citations"]] == ["c1"]
+
+    # An answer without any mark is still answered, not retried.
+    stubs.answers = ["考试 作弊 取消 成绩。"]
+    events = _stream("考试作弊怎么处理？")
+    assert events[-1]["attempts"] == 1 and events[-1]["citations"] == []
+
+
+def test_stream_resets_tokens_before_a_retry_answer(monkeypatch):
+    stubs = _Stubs(monkeypatch)
+    stubs.rewrites = ["考试作弊处理", "考试违纪处分"]
+    stubs.results = {"考试作弊处理": [_chunk("c1")], "考试违纪处分": [_chunk("c2")]}
+    stubs.answers = [INSUFFICIENT_EVIDENCE, "违纪 记过[d1:c2]"]
+
+    events = _stream("考试作弊怎么处理？")
+
+    names = [e["event"] for e in events]
+    first, reset = names.index("token"), names.index("reset")
+    assert first < names.index("retry") < reset < len(names) - 1
+    assert events[reset]["attempt"] == 2
+    after = "".join(e["text"] for e in events[reset:] if e["event"] == "token")
+    assert after == "违纪 记过"
+    assert events[-1]["answer"] == after and events[-1]["attempts"] == 2
+
+
+def test_sse_and_ndjson_event_order(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from src.agent import batch
+    from src.api import app as api
+
+    stubs = _Stubs(monkeypatch)
+    stubs.results = {"考试作弊处理": [_chunk("c1")]}
+    stubs.answers = ["取消 成绩[d1:c1]"]
+    client = TestClient(api.app)
+
+    body = client.post("/ask/stream", json={"query": "考试作弊怎么处理？"}).text
+    names = [line[len("event: ") :] for line in body.splitlines() if line.startswith("event: ")]
+    assert sorted(names[:2]) == ["classified", "rewritten"]
+    assert names[2:4] == ["retrieved", "evidence"] and set(names[4:-1]) == {"token"} and names[-1] == "final"
+    assert orjson.loads(body.rstrip().splitlines()[-1][len("data: ") :])["answer"] == "取消 成绩"
+
+    monkeypatch.setattr(batch, "_prefetch", lambda queries: {})
+    stubs.answers = ["取消成绩"]
+    response = client.post("/ask/batch", json={"queries": ["考试作弊怎么处理？"] * 2, "stream": True})
+    lines = [orjson.loads(x) for x in response.text.splitlines()]
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [(x["index"], x["ok"], x["answer"]) for x in lines] == [(0, True, "取消成绩"), (1, True, "取消成绩")]
+
+
+def test_retry_excludes_seen_chunks_and_searches_deeper(monkeypatch):
+    stubs = _Stubs(monkeypatch)
+    stubs.rewrites = ["考试作弊处理", "考试违纪处分"]
+    stubs.results = {"考试作弊处理": [_chunk("c1")], "考试违纪处分": [_chunk("c1"), _chunk("c2", 0.2)]}
+    stubs.answers = [INSUFFICIENT_EVIDENCE, "记过处分"]
+
+    result = _run("考试作弊怎么处理？")
+
+    assert result["attempts"] == 2 and result["answer"] == "记过处分"
+    k = graph.settings.top_k_recall
+    assert stubs.searches == [("考试作弊处理", k), ("考试违纪处分", 2 * k)]
+    retrieved = [e["output"]["items"] for e in stubs.events if e.get("tool") == "retrieval_augment"]
+    assert [[x["chunk_id"] for x in items] for items in retrieved] == [["c1"], ["c2"]]
+
+
+def test_retry_with_an_already_tried_rewrite_ends_without_retrieving(monkeypatch):
+    stubs = _Stubs(monkeypatch)
+    stubs.results = {"考试作弊处理": [_chunk("c1")]}
+    stubs.answers = [INSUFFICIENT_EVIDENCE]
+
+    result = _run("考试作弊怎么处理？")
+
+    assert result["attempts"] == 2 and result["answer"] == INSUFFICIENT_EVIDENCE
+    assert stubs.searches == [("考试作弊处理", graph.settings.top_k_recall)]
+    assert stubs.calls.count("rewrite") == 2 and stubs.calls.count("AgentAnswerOutput") == 1
+
+
+def test_empty_retrieval_goes_straight_to_answer(monkeypatch):
+    stubs = _Stubs(monkeypatch, max_attempts=1)
+
+    result = _run("考试作弊怎么处理？")
+
+    assert result["answer"] == FALLBACK_ANSWER and result["citations"] == []
+    assert result["used_tools"] == ["expand_and_keyword", "retrieval_augment"]
+    assert "AgentAnswerOutput" not in stubs.calls
+
+
+def test_confident_chitchat_skips_rewrite_and_speculation(monkeypatch):
+    stubs = _Stubs(monkeypatch, fast_classifier_enabled=True, speculative_retrieval=True)
+    stubs.proba = 0.01
+    stubs.answers = ["你好！"]
+
+    result = _run("你好")
+
+    assert result["answer"] == "你好！" and result["used_tools"] == []
+    assert stubs.calls == [] and stubs.searches == []
+    classify = [e for e in stubs.events if e.get("tool") == "classify_query"]
+    assert [e["output"]["method"] for e in classify] == ["fast"]
+
+
+def test_fan_out_runs_branches_in_parallel_and_joins_at_plan(monkeypatch):
+    stubs = _Stubs(monkeypatch, fast_classifier_enabled=True, speculative_retrieval=True)
+    stubs.proba = 0.99
+    stubs.results = {"考试作弊怎么处理？": [_chunk("c1")], "考试作弊处理": [_chunk("c1")]}
+    stubs.answers = ["取消成绩"]
+
+    result = _run("考试作弊怎么处理？")
+
+    # A confident policy label skips the LLM classify call but keeps rewrite and speculation.
+    assert "ClassifyOutput" not in stubs.calls and "rewrite" in stubs.calls
+    assert [q for q, _ in stubs.searches] == ["考试作弊怎么处理？", "考试作弊处理"]
+    assert result["used_tools"] == ["expand_and_keyword", "retrieval_augment"]
+
+    # Unsure: the LLM decides while rewrite and speculation run; their work is dropped for chit-chat.
+    stubs.proba, stubs.policy, stubs.calls, stubs.searches = 0.5, False, [], []
+    stubs.answers = ["好的"]
+    result = _run("考试作弊怎么处理？")
+    assert sorted(stubs.calls) == ["ClassifyOutput", "rewrite"]
+    assert [q for q, _ in stubs.searches] == ["考试作弊怎么处理？"]
+    assert result["answer"] == "好的" and result["used_tools"] == ["expand_and_keyword"]
+    classify = [e for e in stubs.events if e.get("tool") == "classify_query"]
+    assert classify[-1]["output"] == {"is_policy_related": False, "method": "llm", "policy_proba": 0.5}
+
+
+def test_speculation_merges_only_candidates_scored_the_same_way(monkeypatch):
+    stubs = _Stubs(monkeypatch, speculative_retrieval=True, speculative_merge_overlap=0.5)
+    raw = [_chunk("c1", 0.1), _chunk("c2", 0.2)]
+    stubs.answers = ["取消成绩", "取消成绩"]
+
+    def speculation():
+        return next(e["args"]["speculation"] for e in stubs.events if e.get("tool") == "retrieval_augment")
+
+    stubs.results = {"考试作弊怎么处理？": raw, "考试作弊处理": [_chunk("c1", 0.3), _chunk("c3", 0.15)]}
+    _run("考试作弊怎么处理？")
+    assert speculation() == "merged"
+
+    # Fused RRF distances (0 is best) would always beat raw L2 distances in a merge.
+    fused = [replace(x, distance=0.0, fused=True) for x in raw]
+    stubs.events, stubs.results["考试作弊怎么处理？"] = [], fused
+    result = _run("考试作弊怎么处理？")
+    assert speculation() == "discarded"
+    retrieved = next(e for e in stubs.events if e.get("tool") == "retrieval_augment")["output"]["items"]
+    assert [x["chunk_id"] for x in retrieved] == ["c3", "c1"] and result["attempts"] == 1
+
+
+def test_sync_and_async_paths_share_one_compiled_graph(monkeypatch):
+    stubs = _Stubs(monkeypatch)
+    stubs.results = {"考试作弊处理": [_chunk("c1")]}
+    stubs.answers = ["取消成绩", "取消成绩"]
+
+    compiled = graph.get_graph()
+    sync = graph.run_agent("考试作弊怎么处理？")
+    sync_calls, stubs.calls = stubs.calls, []
+    result = _run("考试作弊怎么处理？")
+
+    assert graph.get_graph() is compiled
+    assert sorted(stubs.calls) == sorted(sync_calls) == ["AgentAnswerOutput", "ClassifyOutput", "rewrite"]
+    for key in ("answer", "attempts", "used_tools", "index_version"):
+        assert result[key] == sync[key]
@@ -0,0 +1,89 @@
+from dataclasses import replace
+import time
+
+import pytest
+
+from src.config.settings import settings
+from src.retrieval import index_version as iv
+from src.runtime.resources import ResourceRegistry
+
+
+def test_versions_publish_atomically_and_old_ones_are_collected(tmp_path, monkeypatch):
+    monkeypatch.setattr(iv, "settings", replace(settings, chroma_persist_dir=str(tmp_path)))
+    assert iv.current_index_version() == "" and iv.index_dir() == tmp_path
+
+    first, path = iv.create_index_version()
+    (path / "manifest.json").write_text("{}")
+    iv.publish_index_version(first)
+    assert iv.current_index_version() == first and iv.index_dir() == path
+
+    # A new build starts from a copy of the published one.
+    versions = [first]
+    for _ in range(3):
+        version, path = iv.create_index_version(iv.current_index_version())
+        assert (path / "manifest.json").exists()
+        iv.publish_index_version(version)
+        versions.append(version)
+    building, _ = iv.create_index_version(iv.current_index_version())
+
+    assert iv.gc_index_versions(keep=2) == versions[:2]
+    remaining = sorted(p.name for p in (tmp_path / iv.VERSIONS_DIR).iterdir())
+    assert remaining == [*versions[2:], building]
+
+
+def test_watcher_swaps_loaded_resources_and_closes_old_ones_later(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        iv, "settings", replace(settings, chroma_persist_dir=str(tmp_path), index_swap_grace_seconds=0.05)
+    )
+    reg = ResourceRegistry()
+    monkeypatch.setattr(iv, "registry", reg)
+
+    v1, _ = iv.create_index_version()
+    iv.publish_index_version(v1)
+    watcher = iv.IndexWatcher(interval=0)
+    closed = []
+    reg.register("text_store", lambda: {"version": watcher.loading or watcher.version}, close=closed.append)
+    reg.register("lexical_index", lambda: {"version": watcher.loading or watcher.version})
+
+    old = reg.get("text_store")
+    assert not watcher.refresh()
+
+    v2, _ = iv.create_index_version(v1)
+    iv.publish_index_version(v2)
+    assert watcher.refresh() and watcher.version == v2
+    assert reg.get("text_store") == {"version": v2}
+    # Only resources that were in use get rebuilt; the old instance outlives the swap briefly.
+    assert reg.loaded(iv.INDEX_RESOURCES) == ["text_store"]
+    assert closed == []
+    time.sleep(0.2)
+    assert closed == [old]
+
+
+def test_failed_swap_keeps_the_old_version_and_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(iv, "settings", replace(settings, chroma_persist_dir=str(tmp_path)))
+    reg = ResourceRegistry()
+    monkeypatch.setattr(iv, "registry", reg)
+    monkeypatch.setattr(iv, "get_index_watcher", lambda: watcher)
+
+    v1, _ = iv.create_index_version()
+    iv.publish_index_version(v1)
+    watcher = iv.IndexWatcher(interval=0)
+    failures = [RuntimeError("disk busy")]
+
+    def load():
+        if watcher.loading and failures:
+            raise failures.pop()
+        return iv.serving_index_dir().name
+
+    reg.register("lexical_index", load)
+    assert reg.get("lexical_index") == v1
+
+    v2, _ = iv.create_index_version(v1)
+    iv.publish_index_version(v2)
+    with pytest.raises(RuntimeError):
+        watcher.refresh()
+    assert watcher.version == v1 and iv.serving_index_version() == v1
+    assert reg.get("lexical_index") == v1
+
+    assert watcher.refresh()
+    assert watcher.version == v2 and reg.get("lexical_index") == v2
@@ -0,0 +1,35 @@
+from src.retrieval.lexical import LexicalIndex, tokenize
+
+
+CHUNKS = [
+    ("c0", "第12条 考试作弊者给予记过处分。"),
+    ("c1", "学生宿舍晚上十一点熄灯。"),
+    ("c2", "旷课累计十学时给予警告处分。"),
+]
+
+
+def test_tokenize_uses_cjk_bigrams():
+    assert tokenize("第12条") == ["第1", "12", "2条"]
+    assert tokenize("GPA 绩点") == ["gpa", "绩点"]
+
+
+def test_lexical_index_roundtrip_and_search(tmp_path):
+    LexicalIndex.build(CHUNKS).save(tmp_path)
+    index = LexicalIndex.load(tmp_path)
+
+    assert len(index) == 3
+    assert index.search("作弊怎么处理", k=2)[0][0] == "c0"
+    assert index.search("第12条", k=1)[0][0] == "c0"
+    assert index.search("火星", k=3) == []
+
+
+def test_lexical_index_missing_dir_is_empty(tmp_path):
+    assert LexicalIndex.load(tmp_path / "missing").search("作弊", k=3) == []
+
+
+def test_common_terms_are_only_dropped_on_large_corpora():
+    small = LexicalIndex.build([("c0", "考试作弊"), ("c1", "作弊处分"), ("c2", "作弊记过"), ("c3", "宿舍熄灯")])
+    assert sorted(c for c, _ in small.search("作弊", k=5)) == ["c0", "c1", "c2"]
+
+    large = LexicalIndex.build([(f"c{i}", "作弊" if i % 2 else "熄灯") for i in range(2000)] + [("x", "作弊 处分")])
+    assert [c for c, _ in large.search("作弊处分", k=5)] == ["x"]
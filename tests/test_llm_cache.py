@@ -0,0 +1,42 @@
+from pydantic import BaseModel
+
+from src.llm.cache import LLMCache, make_cache_key
+
+
+class _Out(BaseModel):
+    is_policy_related: bool
+
+
+MESSAGES = [{"role": "user", "content": "考试作弊怎么处理？"}]
+
+
+def test_cache_key_is_stable_and_schema_sensitive():
+    other = [{"role": "user", "content": "  考试作弊怎么处理？\n"}]
+
+    class _Other(BaseModel):
+        answer: str
+
+    key = make_cache_key("deepseek-chat", 0, MESSAGES, _Out)
+    assert key == make_cache_key("deepseek-chat", 0, other, _Out)
+    assert key != make_cache_key("deepseek-chat", 0, MESSAGES, _Other)
+    assert key != make_cache_key("deepseek-chat", 0.7, MESSAGES, _Out)
+
+
+def test_cache_persists_to_disk_tier(tmp_path):
+    path = tmp_path / "llm.sqlite3"
+    key = make_cache_key("deepseek-chat", 0, MESSAGES, _Out)
+    cache = LLMCache(path, max_memory=1)
+    cache.set(key, {"is_policy_related": True})
+    cache.close()
+
+    reopened = LLMCache(path, max_memory=1)
+    assert reopened.get(key) == {"is_policy_related": True}
+    assert reopened.get("missing") is None
+    reopened.close()
+
+
+def test_cache_ttl_expires_entries(tmp_path):
+    cache = LLMCache(tmp_path / "llm.sqlite3", ttl_seconds=1e-9)
+    cache.set("k", {"x": 1})
+    assert cache.get("k") is None
+    cache.close()
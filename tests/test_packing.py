@@ -0,0 +1,61 @@
+from src.agent.graph import parse_stream_citations
+from src.agent.packing import estimate_tokens, pack_evidence
+
+
+TEXT = "第一条 学生应遵守校规。第二条 考试作弊者取消成绩。第三条 情节严重者开除学籍。第四条 图书馆周末开放。"
+
+
+def _item(chunk_id, start, end, doc_id="d1"):
+    return {
+        "doc_id": doc_id, "chunk_id": chunk_id, "source": "rules.txt", "start_offset": start,
+        "end_offset": end, "content": TEXT[start:end], "distance": 0.1, "hit_keyword": False,
+    }
+
+
+def _ev(item, excerpt=None):
+    return {
+        "doc_id": item["doc_id"], "chunk_id": item["chunk_id"], "source": item["source"],
+        "excerpt": item["content"] if excerpt is None else excerpt,
+    }
+
+
+def test_overlapping_chunks_merge_into_one_verbatim_excerpt():
+    # c2 ranks first and overlaps c1; c3 starts exactly where c2 ends.
+    c2, c1, c3 = _item("c2", 10, 30), _item("c1", 0, 16), _item("c3", 30, 40)
+    items = [c2, c1, c3]
+
+    packed, report = pack_evidence([_ev(x) for x in items], items, token_budget=0)
+
+    assert len(packed) == 1 and report["merged"] == 2
+    assert packed[0]["excerpt"] == TEXT[0:40]
+    assert packed[0]["chunk_id"] == "c2"
+    assert sorted(packed[0]["merged_chunk_ids"]) == ["c1", "c2", "c3"]
+
+    answer = "会被取消成绩[d1:c3]。"
+    assert [c["chunk_id"] for c in parse_stream_citations(answer, packed)] == ["c2"]
+
+
+def test_near_duplicates_from_other_docs_are_dropped_and_budget_keeps_best_ranked():
+    a = _item("a", 10, 40)
+    dup = dict(_item("b", 10, 40, doc_id="d2"), source="copy.txt")
+    tail = _item("c", 40, len(TEXT), doc_id="d3")
+    items = [a, dup, tail]
+
+    packed, report = pack_evidence(
+        [_ev(x) for x in items], items, token_budget=estimate_tokens(a["content"]) + 1
+    )
+
+    assert report["duplicates"] == 1
+    assert [x["chunk_id"] for x in packed] == ["a"]
+    assert report["dropped"] == 1
+    assert report["tokens_after"] <= estimate_tokens(a["content"]) + 1
+
+
+def test_sentence_excerpts_inside_a_chunk_keep_their_offsets():
+    item = _item("c1", 0, len(TEXT))
+    first, second = "第二条 考试作弊者取消成绩。", "第三条 情节严重者开除学籍。"
+
+    packed, report = pack_evidence([_ev(item, second), _ev(item, first)], [item], token_budget=0)
+
+    assert [x["excerpt"] for x in packed] == [first + second]
+    assert report["merged"] == 1
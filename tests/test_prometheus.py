@@ -0,0 +1,32 @@
+from src.runtime.prometheus import render_prometheus
+from src.runtime.spans import collect_spans, record_span, summarize_spans
+from src.runtime.stats import Stats
+
+
+def test_render_counters_and_cumulative_histograms():
+    s = Stats()
+    s.incr("llm_cache_miss", 3)
+    s.observe("node_seconds", 0.02, {"name": "classify"}, buckets=(0.01, 0.1))
+    s.observe("node_seconds", 0.5, {"name": "classify"}, buckets=(0.01, 0.1))
+    text = render_prometheus(s)
+
+    assert "# TYPE rag_llm_cache_miss_total counter\nrag_llm_cache_miss_total 3" in text
+    assert "# TYPE rag_node_seconds histogram" in text
+    assert 'rag_node_seconds_bucket{name="classify",le="0.01"} 0' in text
+    assert 'rag_node_seconds_bucket{name="classify",le="0.1"} 1' in text
+    assert 'rag_node_seconds_bucket{name="classify",le="+Inf"} 2' in text
+    assert 'rag_node_seconds_count{name="classify"} 2' in text
+
+
+def test_spans_are_collected_per_request():
+    record_span("node", "outside", 0.1)
+    with collect_spans() as spans:
+        record_span("node", "classify", 0.01)
+        record_span("llm", "ClassifyOutput", 0.2, prompt_tokens=100, completion_tokens=5)
+        record_span("llm_cache", "ExpandKeywordOutput", 0.001)
+
+    summary = summarize_spans(spans)
+    assert [s["name"] for s in spans] == ["classify", "ClassifyOutput", "ExpandKeywordOutput"]
+    assert summary["nodes_ms"] == {"classify": 10.0}
+    assert summary["llm_calls"] == 1 and summary["llm_cache_hits"] == 1
+    assert summary["prompt_tokens"] == 100 and summary["completion_tokens"] == 5
@@ -0,0 +1,33 @@
+import numpy as np
+
+from src.agent.query_classifier import QueryClassifier
+from src.config.settings import settings
+
+
+def _data(n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 2, n).astype(float)
+    x = rng.normal(size=(n, dim)) * 0.3
+    x[:, 0] += np.where(y > 0.5, 1.0, -1.0)
+    return x / np.linalg.norm(x, axis=1, keepdims=True), y
+
+
+def test_fit_separates_classes_and_roundtrips(tmp_path):
+    x, y = _data()
+    clf = QueryClassifier.fit(x, y, meta={"embedding_model": settings.embedding_model_path})
+    proba = clf.predict_proba(x)
+    assert ((proba >= 0.5) == (y > 0.5)).mean() > 0.95
+
+    path = tmp_path / "clf.npz"
+    clf.save(path)
+    loaded = QueryClassifier.load(path)
+    assert loaded.ready
+    assert np.allclose(loaded.predict_proba(x), proba)
+
+
+def test_load_rejects_other_embedding_model_and_missing_file(tmp_path):
+    x, y = _data()
+    path = tmp_path / "clf.npz"
+    QueryClassifier.fit(x, y, meta={"embedding_model": "some/other-model"}).save(path)
+    assert not QueryClassifier.load(path).ready
+    assert not QueryClassifier.load(tmp_path / "missing.npz").ready
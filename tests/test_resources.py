@@ -0,0 +1,88 @@
+from src.runtime.resources import ResourceRegistry
+
+
+def test_registry_loads_once_and_reloads_dependents():
+    calls = {"base": 0, "child": 0}
+    reg = ResourceRegistry()
+
+    def base():
+        calls["base"] += 1
+        return object()
+
+    def child():
+        calls["child"] += 1
+        return (reg.get("base"), calls["child"])
+
+    reg.register("base", base)
+    reg.register("child", child, depends_on=("base",))
+
+    first = reg.get("child")
+    assert reg.get("child") is first
+    assert calls == {"base": 1, "child": 1}
+
+    reg.reload(["base"])
+    assert calls == {"base": 2, "child": 2}
+    assert reg.get("child") is not first
+    assert reg.is_ready()
+
+
+def test_registry_records_warmup_errors():
+    reg = ResourceRegistry()
+
+    def broken():
+        raise RuntimeError("no model")
+
+    reg.register("broken", broken)
+    status = reg.warmup()
+    assert not reg.is_ready()
+    assert "no model" in status["broken"]["error"]
+
+
+def test_stateful_resources_are_only_reloaded_when_named():
+    reg = ResourceRegistry()
+    closed = []
+    reg.register("model", object)
+    reg.register("cache", object, depends_on=("model",), close=closed.append, stateful=True)
+    model, cache = reg.get("model"), reg.get("cache")
+
+    reg.reload()
+    reg.reload(["model"])
+    assert reg.get("model") is not model and reg.get("cache") is cache and closed == []
+
+    reg.reload(["cache"])
+    assert reg.get("cache") is not cache and closed == [cache]
+
+
+def test_lazy_resources_are_skipped_until_used():
+    reg = ResourceRegistry()
+    built = []
+    reg.register("model", lambda: built.append("model") or "model")
+    reg.register("chroma", lambda: built.append("chroma") or "chroma", lazy=True)
+
+    reg.warmup()
+    reg.reload()
+    assert built == ["model", "model"] and reg.is_ready()
+    assert reg.status()["chroma"] == {**reg.status()["chroma"], "ready": False, "lazy": True}
+
+    assert reg.get("chroma") == "chroma"
+    reg.reload()
+    assert built == ["model", "model", "chroma", "model", "chroma"]
+
+
+def test_reload_endpoint_rejects_unknown_names(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from src.api import app as api
+
+    reg = ResourceRegistry()
+    reg.register("model", object)
+    reg.register("sessions", object, stateful=True)
+    monkeypatch.setattr(api, "registry", reg)
+    sessions = reg.get("sessions")
+    client = TestClient(api.app)
+
+    assert client.post("/admin/reload", json={"resources": ["model", "nope"]}).status_code == 400
+    assert set(client.post("/admin/reload").json()["resources"]) == {"model", "sessions"}
+    assert reg.get("sessions") is sessions
+    assert client.post("/admin/reload", json={"resources": ["sessions"]}).status_code == 200
+    assert reg.get("sessions") is not sessions
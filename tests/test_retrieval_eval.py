@@ -0,0 +1,108 @@
+from dataclasses import replace
+import random
+
+import numpy as np
+
+from src.agent import tools
+from src.config.settings import settings
+from src.eval import retrieval
+from src.retrieval import rerank
+from src.retrieval.rerank import RetrievedItem
+
+
+def _item(chunk_id, distance):
+    content = f"关于{'作弊' if int(chunk_id[1:]) % 3 == 0 else '请假'}的规定 {chunk_id}"
+    return RetrievedItem("d", chunk_id, "s", 0, 1, content, distance)
+
+
+class _Store:
+    def __init__(self, rankings):
+        self.rankings = rankings
+
+    def search(self, vectors, k):
+        return [[_item(c, d) for c, d in self.rankings[v[0]][:k]] for v in vectors]
+
+    def fetch(self, chunk_ids):
+        return [_item(c, 0.0) for c in chunk_ids]
+
+
+class _Lexical:
+    def __init__(self, rankings):
+        self.rankings = rankings
+
+    def search(self, query, k):
+        return [(c, 1.0) for c in self.rankings[query][:k]]
+
+
+class _Embedder:
+    def __init__(self, queries):
+        self.queries = queries
+
+    def embed_queries(self, texts):
+        return [[self.queries.index(t)] for t in texts]
+
+
+def test_vectorized_ranking_matches_the_live_pipeline(monkeypatch):
+    rng = random.Random(0)
+    queries = [f"q{i}" for i in range(30)]
+    vector, lexical = [], {}
+    for q in queries:
+        ids = rng.sample(range(60), 20)
+        vector.append([(f"c{c}", round(0.1 * i + rng.random() * 0.05, 3)) for i, c in enumerate(ids)])
+        lexical[q] = [] if q == "q0" else [f"c{c}" for c in rng.sample(range(60), 20)]
+    keywords = ["作弊" if i % 2 else "" for i in range(len(queries))]
+
+    store, index, embedder = _Store(vector), _Lexical(lexical), _Embedder(queries)
+    for module in (tools, retrieval):
+        monkeypatch.setattr(module, "get_vectorstore", lambda: store)
+        monkeypatch.setattr(module, "get_lexical_index", lambda: index)
+    monkeypatch.setattr(retrieval, "get_query_embedder", lambda: embedder)
+    monkeypatch.setattr(tools, "embed_query", lambda q: [queries.index(q)])
+
+    cache = retrieval.collect_ranks(queries, keywords, depth=20, hybrid=True)
+    for recall_k, final_k, bonus in [(10, 5, 0.1), (20, 8, 0.5), (5, 5, 0.0)]:
+        monkeypatch.setattr(tools, "settings", replace(settings, top_k_final=final_k, hybrid_retrieval=True))
+        monkeypatch.setattr(rerank, "settings", replace(settings, keyword_bonus=bonus))
+        ranked = retrieval.rank(cache, recall_k, final_k, bonus)
+        for i, (q, kw) in enumerate(zip(queries, keywords)):
+            live = tools.rank_candidates(tools.search_candidates(q, recall_k), kw).items
+            assert [cache.chunk_ids[i, j] for j in ranked[i] if j >= 0] == [x.chunk_id for x in live]
+
+
+def test_metrics_and_sweep_over_cached_ranks(tmp_path):
+    relevant = np.array([[False, True, False], [True, False, True], [False, False, False]])
+    n_gold = np.array([1, 3, 2])
+    m = retrieval.retrieval_metrics(relevant, n_gold, [1, 3])
+    assert m["hit@1"] == 1 / 3 and m["hit@3"] == 2 / 3
+    assert np.isclose(m["recall@3"], (1 + 2 / 3 + 0) / 3)
+    assert np.isclose(m["mrr@3"], (1 / 2 + 1) / 3)
+    ideal = 1 + 1 / np.log2(3) + 1 / np.log2(4)
+    assert np.isclose(m["ndcg@3"], (1 / np.log2(3) + (1 + 1 / np.log2(4)) / ideal) / 3)
+
+    cache = retrieval.RankCache(
+        queries=["a", "b"],
+        keywords=["", "k"],
+        chunk_ids=np.array([["x", "y", "z"], ["u", "v", ""]]),
+        vector_rank=np.array([[0, 1, 2], [0, 1, retrieval.MISSING]], dtype=np.int32),
+        lexical_rank=np.full((2, 3), retrieval.MISSING, dtype=np.int32),
+        distance=np.array([[0.1, 0.2, 0.3], [0.1, 0.15, np.inf]]),
+        keyword_hit=np.array([[False, False, False], [False, True, False]]),
+        depth=3,
+    )
+    cache.save(tmp_path / "ranks.npz")
+    loaded = retrieval.RankCache.load(tmp_path / "ranks.npz")
+    rows = retrieval.sweep(loaded, [["z"], ["v"]], top_k_recall=[2, 3], top_k_final=[1], keyword_bonus=[0.0, 0.1])
+    by = {(r["top_k_recall"], r["keyword_bonus"]): r["metrics"] for r in rows}
+    assert by[(2, 0.0)]["hit@1"] == 0.0 and by[(2, 0.1)]["hit@1"] == 0.5
+    assert by[(3, 0.1)]["recall@1"] == 0.5
+
+
+def test_gold_chunks_missing_from_the_index_are_reported(monkeypatch):
+    class Store:
+        def fetch(self, chunk_ids):
+            return [_item(c, 0.0) for c in chunk_ids if c != "chunk_1"]
+
+    monkeypatch.setattr(retrieval, "get_vectorstore", Store)
+    records = [{"query": "a", "gold_chunks": ["chunk_1", "c3"]}, {"query": "b", "gold_chunks": []}]
+    assert retrieval.missing_gold_chunks(records) == ["chunk_1"]
+    assert retrieval.missing_gold_chunks([{"query": "b"}]) == []
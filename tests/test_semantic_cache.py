@@ -0,0 +1,43 @@
+import time
+
+from src.agent.semantic_cache import SemanticCache
+
+
+def _unit(*xs):
+    norm = sum(x * x for x in xs) ** 0.5
+    return [x / norm for x in xs]
+
+
+def test_semantic_cache_hit_above_threshold():
+    cache = SemanticCache(max_entries=4, ttl_seconds=60, threshold=0.9)
+    cache.store("考试作弊怎么处理", _unit(1, 0, 0), {"answer": "记过"}, latency=1.5)
+
+    hit = cache.lookup(_unit(1, 0.1, 0))
+    assert hit is not None and hit.result["answer"] == "记过"
+    assert cache.lookup(_unit(0, 1, 0)) is None
+
+
+def test_semantic_cache_evicts_lru_and_invalidates_on_new_index():
+    cache = SemanticCache(max_entries=2, ttl_seconds=60, threshold=0.9)
+    cache.store("a", _unit(1, 0, 0), {"answer": "a"}, 1.0, version="v1")
+    cache.store("b", _unit(0, 1, 0), {"answer": "b"}, 1.0, version="v1")
+    assert cache.lookup(_unit(1, 0, 0), version="v1") is not None
+    cache.store("c", _unit(0, 0, 1), {"answer": "c"}, 1.0, version="v1")
+
+    assert len(cache) == 2
+    assert cache.lookup(_unit(0, 1, 0), version="v1") is None
+    assert cache.lookup(_unit(1, 0, 0), version="v2") is None
+    assert len(cache) == 0
+
+
+def test_semantic_cache_expires_entries():
+    cache = SemanticCache(max_entries=2, ttl_seconds=0.01, threshold=0.9)
+    cache.store("a", _unit(1, 0), {"answer": "a"}, 1.0)
+    time.sleep(0.02)
+    assert cache.lookup(_unit(1, 0)) is None
+
+
+def test_semantic_cache_zero_ttl_never_expires():
+    cache = SemanticCache(max_entries=2, ttl_seconds=0, threshold=0.9)
+    cache.store("a", _unit(1, 0), {"answer": "a"}, 1.0)
+    assert cache.lookup(_unit(1, 0)) is not None and len(cache) == 1
@@ -0,0 +1,52 @@
+from src.agent import graph
+from src.agent.session_memory import MemorySessionStore
+
+
+def test_memory_store_caps_turns_and_evicts_least_recent_session():
+    store = MemorySessionStore(max_sessions=2, max_turns=2, ttl_seconds=0)
+    for i in range(3):
+        store.append("a", {"query": f"q{i}"})
+    store.append("b", {"query": "b0"})
+    store.history("a")  # a is now the most recently used session
+    store.append("c", {"query": "c0"})
+
+    assert [x["query"] for x in store.history("a")] == ["q1", "q2"]
+    assert store.history("b") == []
+    assert len(store) == 2
+
+
+class _Embedder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_queries(self, texts):
+        return [self.vectors[t] for t in texts]
+
+
+def _state(query, history):
+    return {
+        "trace_id": "t", "query": query, "expand_query": query, "keyword": "", "is_policy_related": True,
+        "attempts": 1, "history": history, "seen_chunk_ids": [],
+    }
+
+
+def test_follow_up_on_the_same_documents_reuses_previous_chunks(monkeypatch):
+    items = [{"chunk_id": "c1", "doc_id": "d", "source": "s", "content": "x", "start_offset": 0, "end_offset": 1}]
+    turn = {"query": "考试作弊怎么处分", "expand_query": "考试作弊怎么处分", "answer": "取消成绩",
+            "items": items, "index_version": "v1"}
+    monkeypatch.setattr(graph, "serving_index_version", lambda: "v1")
+    monkeypatch.setattr(graph, "_log_tool", lambda *args: None)
+    monkeypatch.setattr(graph, "get_query_embedder", lambda: _Embedder({
+        "考试作弊怎么处分": [1.0, 0.0],
+        "第二次考试作弊怎么处分": [0.9, 0.1],
+        "图书馆几点开门": [0.0, 1.0],
+    }))
+
+    reused = graph.plan_node(_state("第二次考试作弊怎么处分", [turn]))
+    assert reused["retrieved_items"] == items and reused["session_reused"]
+    assert graph.route_after_plan({**_state("第二次考试作弊怎么处分", [turn]), **reused}) == "selective_read"
+
+    assert graph.plan_node(_state("图书馆几点开门", [turn])) == {}
+    # Chunks from an older index are never reused.
+    monkeypatch.setattr(graph, "serving_index_version", lambda: "v2")
+    assert graph.plan_node(_state("第二次考试作弊怎么处分", [turn])) == {}
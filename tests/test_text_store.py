@@ -0,0 +1,43 @@
+import threading
+
+from src.retrieval.text_store import TextStore, normalize_text
+
+
+def test_normalize_text_collapses_whitespace():
+    assert normalize_text("第一条\r\n  学生　应当\n\n\n\n遵守  校规 ") == "第一条\n学生 应当\n\n遵守 校规"
+
+
+def test_text_store_slices_by_character_offsets(tmp_path):
+    store = TextStore(tmp_path)
+    text = "第一条 学生应当遵守校规。第二条 考试作弊者给予记过处分。"
+    store.write("data/raw/rules.txt", text)
+
+    start = text.index("第二条")
+    assert store.slice("data/raw/rules.txt", start, start + 3) == "第二条"
+    assert store.length("data/raw/rules.txt") == len(text)
+    assert store.expand("data/raw/rules.txt", start, start + 3, 4) == text[start - 4 : start + 7]
+    assert store.contains("data/raw/rules.txt", start, len(text), "考试 作弊者")
+    assert store.contains("data/raw/rules.txt", 0, start, "考试作弊") is False
+    assert store.slice("data/raw/missing.txt", 0, 3) is None
+    store.close()
+
+
+class _EvictingStore(TextStore):
+    # Another reader opens a different file, evicting this one, right after every open of a.txt.
+    def _open(self, source):
+        mm = super()._open(source)
+        if source == "a.txt":
+            other = threading.Thread(target=self.length, args=("b.txt",))
+            other.start()
+            other.join(timeout=0.2)
+        return mm
+
+
+def test_reads_survive_eviction_by_another_thread(tmp_path):
+    store = _EvictingStore(tmp_path, max_open=1)
+    store.write("a.txt", "考试作弊者给予记过处分。")
+    store.write("b.txt", "宿舍晚上十一点熄灯。")
+
+    assert store.slice("a.txt", 0, 4) == "考试作弊"
+    assert store.contains("a.txt", 0, 12, "记过处分")
+    store.close()
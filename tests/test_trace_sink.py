@@ -0,0 +1,67 @@
+import threading
+
+import orjson
+
+from src.runtime.stats import stats
+from src.runtime.trace_sink import TraceSink, iter_trace_events, read_trace
+
+
+def test_trace_sink_batches_rotates_and_reads_back(tmp_path):
+    sink = TraceSink(tmp_path, batch_size=4, flush_seconds=0.01, segment_max_bytes=1)
+    for i in range(10):
+        sink.emit(f"t{i % 3}", {"type": "tool_call", "step": i})
+    sink.close()
+
+    assert len(list(tmp_path.glob("*.jsonl.gz"))) > 1
+    assert [e["step"] for e in read_trace("t1", tmp_path)] == [1, 4, 7]
+    assert len(list(iter_trace_events(tmp_path))) == 10
+
+
+def test_trace_reader_supports_legacy_per_trace_files(tmp_path):
+    (tmp_path / "old.jsonl").write_bytes(orjson.dumps({"type": "tool_call"}) + b"\n")
+    assert read_trace("old", tmp_path) == [{"type": "tool_call"}]
+
+
+def test_trace_sink_drops_when_full(tmp_path):
+    sink = TraceSink(tmp_path, max_queue=1, flush_seconds=0.5)
+    for i in range(50):
+        sink.emit("t", {"step": i})
+    sink.close()
+    assert 0 < len(read_trace("t", tmp_path)) < 50
+
+
+def test_trace_sink_drops_events_emitted_after_close(tmp_path):
+    sink = TraceSink(tmp_path, flush_seconds=0.01)
+    sink.emit("t", {"step": 0})
+    sink.close()
+    before = stats.get("trace_events_dropped")
+    sink.emit("t", {"step": 1})
+    assert stats.get("trace_events_dropped") == before + 1
+    assert [e["step"] for e in read_trace("t", tmp_path)] == [0]
+
+
+def test_blocking_emit_returns_when_the_sink_closes(tmp_path):
+    sink = TraceSink(tmp_path, max_queue=1, batch_size=1, flush_seconds=0.01, on_full="block")
+    writing, release = threading.Event(), threading.Event()
+    write = sink._write
+
+    def slow_write(records):
+        writing.set()
+        release.wait()
+        write(records)
+
+    sink._write = slow_write
+    sink.emit("t", {"step": 0})
+    writing.wait()
+    sink.emit("t", {"step": 1})
+    before = stats.get("trace_events_dropped")
+    blocked = threading.Thread(target=sink.emit, args=("t", {"step": 2}))
+    blocked.start()
+    closer = threading.Thread(target=sink.close)
+    closer.start()
+    blocked.join(timeout=5)
+    assert not blocked.is_alive()
+    release.set()
+    closer.join(timeout=5)
+    assert stats.get("trace_events_dropped") == before + 1
+    assert [e["step"] for e in read_trace("t", tmp_path)] == [0, 1]
@@ -1,32 +1,128 @@
 from __future__ import annotations
 
+import argparse
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
 import json
+import logging
+import os
 from pathlib import Path
+import threading
 
 from src.agent.graph import run_agent
+from src.config.settings import settings
+from src.runtime.trace_sink import get_trace_sink
 
 
 INPUT_FILE = Path("train/data/sample_eval.jsonl")
 OUTPUT_FILE = Path("train/data/sft_trajectories.jsonl")
 
+logger = logging.getLogger(__name__)
+
+
+def sample_id(row: dict) -> str:
+    return str(row.get("id") or hashlib.sha1(row["query"].encode("utf-8")).hexdigest()[:16])
+
+
+def load_done(path: Path) -> set[str]:
+    # The output file is the checkpoint: every complete line is a finished sample.
+    if not path.exists():
+        return set()
+    data = path.read_bytes()
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        # Drop a line cut short by a crash so appends start on a clean line.
+        with path.open("r+b") as f:
+            f.truncate(end)
+    done: set[str] = set()
+    for line in data[:end].splitlines():
+        try:
+            done.add(json.loads(line)["id"])
+        except (ValueError, KeyError):
+            continue
+    return done
+
+
+def make_sample(row: dict, result: dict, trajectory: list[dict]) -> dict:
+    return {
+        "id": sample_id(row),
+        "query": row["query"],
+        "trajectory_ref": result["trace_id"],
+        "answer": result["answer"],
+        "citations": result["citations"],
+        "used_tools": result["used_tools"],
+        "trajectory": [{k: v for k, v in e.items() if k != "trace_id"} for e in trajectory],
+    }
+
+
+class TrajectoryTap:
+    # Trace sink tap: keeps each run's events in memory until its sample is written, so the
+    # trace segments are never read back. run_agent emits every event before it returns.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._events: defaultdict[str, list[dict]] = defaultdict(list)
+
+    def __call__(self, record: dict) -> None:
+        with self._lock:
+            self._events[record["trace_id"]].append(record)
+
+    def pop(self, trace_id: str) -> list[dict]:
+        with self._lock:
+            return self._events.pop(trace_id, [])
+
+
+def write_samples(f, finished: list[tuple[dict, dict]], tap: TrajectoryTap) -> None:
+    for row, result in finished:
+        sample = make_sample(row, result, tap.pop(result["trace_id"]))
+        f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
 
 def main() -> None:
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    rows = [json.loads(x) for x in INPUT_FILE.read_text(encoding="utf-8").splitlines() if x.strip()]
-
-    with OUTPUT_FILE.open("w", encoding="utf-8") as f:
-        for row in rows:
-            result = run_agent(row["query"])
-            sample = {
-                "query": row["query"],
-                "trajectory_ref": result["trace_id"],
-                "answer": result["answer"],
-                "citations": result["citations"],
-                "used_tools": result["used_tools"],
-            }
-            f.write(json.dumps(sample, ensure_ascii=False) + "\n")
-
-    print(f"saved={OUTPUT_FILE}")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=Path, default=INPUT_FILE)
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    parser.add_argument("--concurrency", type=int, default=settings.batch_concurrency)
+    parser.add_argument("--restart", action="store_true", help="discard existing output and start over")
+    args = parser.parse_args()
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    if args.restart:
+        args.output.unlink(missing_ok=True)
+    rows = [json.loads(x) for x in args.input.read_text(encoding="utf-8").splitlines() if x.strip()]
+    done = load_done(args.output)
+    todo = [row for row in rows if sample_id(row) not in done]
+    print(f"rows={len(rows)} done={len(rows) - len(todo)} todo={len(todo)}")
+
+    written = failed = 0
+    tap = TrajectoryTap()
+    sink = get_trace_sink()
+    sink.add_tap(tap)
+    try:
+        with args.output.open("a", encoding="utf-8") as f, ThreadPoolExecutor(args.concurrency) as pool:
+            # Semantic-cache hits carry no trajectory, so every row runs the full graph.
+            pending = {pool.submit(run_agent, row["query"], use_cache=False): row for row in todo}
+            while pending:
+                done_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                # Appended right away, so a crash only loses the samples still running.
+                finished: list[tuple[dict, dict]] = []
+                for future in done_futures:
+                    row = pending.pop(future)
+                    try:
+                        finished.append((row, future.result()))
+                    except Exception:
+                        logger.exception("run_agent failed for %r; it will be retried on the next run", row["query"])
+                        failed += 1
+                if finished:
+                    write_samples(f, finished, tap)
+                    written += len(finished)
+                    print(f"written={written}/{len(todo)} failed={failed}")
+    finally:
+        sink.remove_tap(tap)
+
+    print(f"saved={args.output} written={written} failed={failed}")
 
 
 if __name__ == "__main__":